@@ -0,0 +1,200 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Time-indexed bandwidth history with windowed queries.
+
+BandwidthHistory wraps a bandwidth store whose snapshots are sorted by date. The value of a connection in a
+snapshot is the highest of its 1h/1d/1w bandwidths. Prefix sums (for mean and count) and a sparse table of
+range maxima are precomputed over the snapshot axis, so the max, mean and number of values of every
+connection in a date window are found with two binary searches and a constant number of array operations.
+
+Usage: python bandwidth_history.py --store combined_connections.npz [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+"""
+
+import argparse
+import warnings
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from bandwidth_store import BandwidthStore
+from profiling import Profiler, add_arguments
+
+
+class WindowStats(NamedTuple):
+    """Per-connection statistics over a date window, NaN (or 0 for count) for connections without values."""
+
+    max: np.ndarray
+    mean: np.ndarray
+    count: np.ndarray
+
+
+def parse_date(text: Optional[str]) -> Optional[np.datetime64]:
+    """
+    Convert a YYYY-MM-DD date to a datetime64.
+
+    :param text: date, or None (Optional[str])
+    :return: date, or None (Optional[np.datetime64]).
+    """
+    return np.datetime64(text, 's') if text else None
+
+
+def date_argument(text: str) -> np.datetime64:
+    """
+    Convert a YYYY-MM-DD command line argument to a datetime64.
+
+    :param text: date (str)
+    :raises argparse.ArgumentTypeError: for an invalid date
+    :return: date (np.datetime64).
+    """
+    try:
+        return parse_date(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid date {text!r}, expected YYYY-MM-DD') from None
+
+
+class BandwidthHistory:
+    """Windowed max/mean/count queries over the snapshots of a bandwidth store."""
+
+    def __init__(self, store: BandwidthStore):
+        """
+        Precompute the prefix sums and the sparse table of range maxima.
+
+        :param store: bandwidth store with known, sorted snapshot dates (BandwidthStore)
+        :raises ValueError: if the snapshot dates are unknown.
+        """
+        if not store.has_times():
+            raise ValueError('the snapshot dates are unknown, rebuild the store with process_connections.py --store')
+        self.store = store
+        self.times = np.asarray(store.times)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            samples = np.nanmax(store.values, axis=2) if store.values.shape[2] else np.full(store.values.shape[:2], np.nan)
+        present = ~np.isnan(samples)
+        n_connections, n_snapshots = samples.shape
+
+        self.prefix_sum = np.zeros((n_connections, n_snapshots + 1))
+        np.cumsum(np.where(present, samples, 0.0), axis=1, out=self.prefix_sum[:, 1:])
+        self.prefix_count = np.zeros((n_connections, n_snapshots + 1), dtype=np.int64)
+        np.cumsum(present, axis=1, out=self.prefix_count[:, 1:])
+
+        # levels[j][:, i] is the max over snapshots [i, i + 2**j); fmax ignores NaN
+        self.levels = [samples]
+        width = 1
+        while 2 * width <= n_snapshots:
+            previous = self.levels[-1]
+            self.levels.append(np.fmax(previous[:, :-width], previous[:, width:]))
+            width *= 2
+
+    def _bounds(self, since: Optional[np.datetime64], until: Optional[np.datetime64]) -> tuple:
+        """
+        Return the snapshot index range [start, stop) of a date window.
+
+        :param since: first date to include, None for no lower limit (Optional[np.datetime64])
+        :param until: last date to include, None for no upper limit (Optional[np.datetime64])
+        :return: start, stop (tuple).
+        """
+        start = 0 if since is None else int(np.searchsorted(self.times, since, side='left'))
+        stop = len(self.times) if until is None else int(np.searchsorted(self.times, until, side='right'))
+
+        return start, max(start, stop)
+
+    def window_max(self, since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> np.ndarray:
+        """
+        Return the highest value of each connection in a date window.
+
+        :param since: first date to include, None for no lower limit (Optional[np.datetime64])
+        :param until: last date to include, None for no upper limit (Optional[np.datetime64])
+        :return: one value per connection, NaN for connections without values in the window (np.ndarray).
+        """
+        start, stop = self._bounds(since, until)
+        if start == stop:
+            return np.full(len(self.store), np.nan)
+        level = (stop - start).bit_length() - 1
+        table = self.levels[level]
+
+        return np.fmax(table[:, start], table[:, stop - (1 << level)])
+
+    def window_count(self, since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> np.ndarray:
+        """
+        Return the number of snapshots with a value, per connection, in a date window.
+
+        :param since: first date to include, None for no lower limit (Optional[np.datetime64])
+        :param until: last date to include, None for no upper limit (Optional[np.datetime64])
+        :return: one count per connection (np.ndarray).
+        """
+        start, stop = self._bounds(since, until)
+
+        return self.prefix_count[:, stop] - self.prefix_count[:, start]
+
+    def window_mean(self, since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> np.ndarray:
+        """
+        Return the mean value of each connection in a date window.
+
+        :param since: first date to include, None for no lower limit (Optional[np.datetime64])
+        :param until: last date to include, None for no upper limit (Optional[np.datetime64])
+        :return: one value per connection, NaN for connections without values in the window (np.ndarray).
+        """
+        start, stop = self._bounds(since, until)
+        count = self.prefix_count[:, stop] - self.prefix_count[:, start]
+        total = self.prefix_sum[:, stop] - self.prefix_sum[:, start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+
+    def window(self, since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> WindowStats:
+        """
+        Return the max, mean and count of each connection in a date window.
+
+        :param since: first date to include, None for no lower limit (Optional[np.datetime64])
+        :param until: last date to include, None for no upper limit (Optional[np.datetime64])
+        :return: statistics (WindowStats).
+        """
+        return WindowStats(self.window_max(since, until), self.window_mean(since, until), self.window_count(since, until))
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Show windowed bandwidth statistics from a columnar bandwidth store.')
+    parser.add_argument('--store', type=str, default='combined_connections.npz', help='Bandwidth store (.npz).')
+    parser.add_argument('--since', type=date_argument, help='First date to include (YYYY-MM-DD).')
+    parser.add_argument('--until', type=date_argument, help='Last date to include (YYYY-MM-DD).')
+    parser.add_argument('--top', type=int, default=10, help='Number of fastest connections to show (default: 10).')
+    add_arguments(parser, 'bandwidth_history')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'bandwidth_history')
+
+    with profiler.phase('load'):
+        store = BandwidthStore.load(args.store)
+        profiler.count('connections', len(store))
+    with profiler.phase('transform'):
+        history = BandwidthHistory(store)
+        stats = history.window(args.since, args.until)
+    names = history.store.connection_names()
+    with_values = np.flatnonzero(stats.count > 0)
+    print(f'{len(with_values)} of {len(names)} connections have values in the window')
+    for index in with_values[np.argsort(-stats.max[with_values], kind='stable')][:args.top]:
+        print(f'{names[index]}: max={stats.max[index]:.2f} mean={stats.mean[index]:.2f} count={stats.count[index]}')
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Columnar store for connection bandwidths.
+
+The store replaces the { "A:B": [{'1h': .., '1d': .., '1w': ..}] } layout of combined_connections.json with
+  sites:     site names, the position in the array is the site ID (of the site registry, see site_registry.py)
+  pairs:     (connection, 2) array of (source, destination) site IDs
+  values:    (connection, snapshot, resolution) float array with NaN for missing values
+  snapshots: one label per snapshot (the metrics file name, when known)
+  times:     snapshot dates (datetime64, NaT if unknown), in increasing order when known
+so that reductions over all connections are single vectorized operations.
+
+The store is saved as an uncompressed .npz file, whose arrays are memory-mapped (not copied) on load.
+"""
+
+import os
+import re
+import struct
+import warnings
+import zipfile
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from site_registry import SITE_BITS, SITE_MASK, SiteRegistry
+
+RESOLUTIONS = ('1h', '1d', '1w')
+NOT_A_TIME = np.datetime64('NaT', 's')
+# early metrics files named latest-MM.DD.YYYY.json, see input_files in process_connections.py
+MONTH_FIRST_FILES = frozenset({'latest-01.10.2024.json', 'latest-01.23.2024.json'})
+
+
+def parse_snapshot_time(file_name: str, month_first: Optional[bool] = None) -> np.datetime64:
+    """
+    Return the snapshot date encoded in a metrics file name, latest-DD.MM.YYYY.json.
+
+    A few early files were named latest-MM.DD.YYYY.json. Since names like latest-01.10.2024.json are valid in both
+    orders, the order is not guessed: it is given by month_first, by default True for the files in
+    MONTH_FIRST_FILES. The other order is only used when the given one is not a valid date.
+
+    :param file_name: file name (str)
+    :param month_first: the name is MM.DD.YYYY, None to look it up in MONTH_FIRST_FILES (Optional[bool])
+    :return: date, NaT if the name does not contain a valid date (np.datetime64).
+    """
+    base_name = os.path.basename(file_name)
+    match = re.search(r'(\d{1,2})\.(\d{1,2})\.(\d{4})', base_name)
+    if not match:
+        return NOT_A_TIME
+    if month_first is None:
+        month_first = base_name in MONTH_FIRST_FILES
+    first, second, year = (int(group) for group in match.groups())
+    orders = ((second, first), (first, second)) if month_first else ((first, second), (second, first))
+    for day, month in orders:
+        try:
+            return np.datetime64(f'{year:04d}-{month:02d}-{day:02d}', 's')
+        except ValueError:
+            continue
+
+    return NOT_A_TIME
+
+
+def snapshot_times(file_paths: Sequence[str], month_first_files: Iterable[str] = MONTH_FIRST_FILES, ordered: bool = False) -> np.ndarray:
+    """
+    Return the snapshot dates of metrics files, see parse_snapshot_time().
+
+    When the files are known to be in chronological order, a file whose name is a valid date in both orders, and
+    whose date is out of order with the previous or next dated file while the other order would not be, is
+    probably named the other way around: a warning tells to list it in month_first_files (or to remove it from there).
+
+    :param file_paths: metrics file paths (Sequence[str])
+    :param month_first_files: names of the files named latest-MM.DD.YYYY.json (Iterable[str])
+    :param ordered: the files are in chronological order (bool)
+    :return: dates, NaT where unknown (np.ndarray).
+    """
+    month_first_files = set(month_first_files)
+    others = []
+    for file_path in file_paths:
+        month_first = os.path.basename(file_path) in month_first_files
+        others.append(parse_snapshot_time(file_path, not month_first))
+    times = np.array([parse_snapshot_time(file_path, os.path.basename(file_path) in month_first_files) for file_path in file_paths],
+                     dtype='datetime64[s]')
+
+    dated = np.flatnonzero(~np.isnat(times)).tolist() if ordered else []
+    for position, index in enumerate(dated):
+        if others[index] == times[index]:
+            continue
+        low = times[dated[position - 1]] if position > 0 else times[index]
+        high = times[dated[position + 1]] if position + 1 < len(dated) else times[index]
+        if not low <= times[index] <= high and (position == 0 or low <= others[index]) and (position + 1 == len(dated) or others[index] <= high):
+            warnings.warn(f'{file_paths[index]}: read as {str(times[index])[:10]}, out of the file order, but {str(others[index])[:10]} '
+                          f'would fit it; the day/month order of the name is ambiguous', stacklevel=2)
+
+    return times
+
+
+def _load_npz(file_path: str, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Load the arrays of an .npz file, memory-mapping the uncompressed ones.
+
+    np.load() ignores mmap_mode for .npz files, but uncompressed members are stored contiguously in the
+    zip archive, so they can be memory-mapped at the offset of their .npy data.
+
+    :param file_path: path to the .npz file (str)
+    :param mmap: memory-map the arrays instead of reading them (bool)
+    :return: arrays by name (Dict[str, np.ndarray]).
+    """
+    arrays = {}
+    with zipfile.ZipFile(file_path) as archive, open(file_path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if not mmap or info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+
+            # local file header: 30 bytes, then the file name and the extra field
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(file_path, dtype=dtype, mode='r', shape=shape,
+                                         order='F' if fortran_order else 'C', offset=f.tell())
+
+    return arrays
+
+
+class BandwidthStore:
+    """Bandwidths of all connections, as (connection, snapshot, resolution) arrays."""
+
+    def __init__(self, sites: Sequence[str], pairs: np.ndarray, values: np.ndarray, snapshots: Optional[Sequence[str]] = None,
+                 times: Optional[np.ndarray] = None):
+        """
+        Initialize the store.
+
+        :param sites: site names, indexed by site ID (Sequence[str])
+        :param pairs: (connection, 2) source and destination site IDs (np.ndarray)
+        :param values: (connection, snapshot, resolution) bandwidths, NaN if missing (np.ndarray)
+        :param snapshots: snapshot labels, empty strings if unknown (Optional[Sequence[str]])
+        :param times: snapshot dates, NaT if unknown (Optional[np.ndarray]).
+        """
+        self.sites = list(sites)
+        self.pairs = pairs
+        self.values = values
+        self.snapshots = list(snapshots) if snapshots is not None else [''] * values.shape[1]
+        self.times = times if times is not None else np.full(values.shape[1], NOT_A_TIME)
+
+    def has_times(self) -> bool:
+        """
+        Tell whether the dates of all snapshots are known.
+
+        :return: True if all snapshot dates are known (bool).
+        """
+        return not np.isnat(self.times).any()
+
+    def __len__(self) -> int:
+        """
+        Return the number of connections.
+
+        :return: number of connections (int).
+        """
+        return len(self.pairs)
+
+    @classmethod
+    def _build(cls, rows: Iterable[Tuple[int, int, Optional[dict]]], n_snapshots: int, registry: SiteRegistry,
+               snapshots: Optional[Sequence[str]] = None, times: Optional[np.ndarray] = None) -> 'BandwidthStore':
+        """
+        Build a store from (connection key, snapshot index, dashb) rows.
+
+        :param rows: rows, dashb is None for a connection without a value in that snapshot (Iterable[Tuple[int, int, Optional[dict]]])
+        :param n_snapshots: number of snapshots (int)
+        :param registry: site registry of the connection keys (SiteRegistry)
+        :param snapshots: snapshot labels (Optional[Sequence[str]])
+        :param times: snapshot dates (Optional[np.ndarray])
+        :return: store (BandwidthStore).
+        """
+        connection_ids = {}
+        samples = []
+        for key, snapshot, dashb in rows:
+            index = connection_ids.get(key)
+            if index is None:
+                index = connection_ids[key] = len(connection_ids)
+            if dashb:
+                for resolution, name in enumerate(RESOLUTIONS):
+                    value = dashb.get(name)
+                    if value is not None:
+                        samples.append((index, snapshot, resolution, value))
+
+        values = np.full((len(connection_ids), n_snapshots, len(RESOLUTIONS)), np.nan)
+        if samples:
+            index, snapshot, resolution, value = zip(*samples)
+            values[list(index), list(snapshot), list(resolution)] = value
+        keys = np.fromiter(connection_ids, dtype=np.int64, count=len(connection_ids))
+        pairs = np.stack([keys >> SITE_BITS, keys & SITE_MASK], axis=1).astype(np.int32)
+
+        return cls(registry.sites, pairs, values, snapshots, times)
+
+    @classmethod
+    def from_connections(cls, connections: Dict[str, List[dict]], registry: Optional[SiteRegistry] = None) -> 'BandwidthStore':
+        """
+        Build a store from the combined_connections.json layout.
+
+        The file does not record which snapshot a value belongs to, so the samples of each connection are
+        stored in the first snapshots, in order, and the snapshot labels are unknown.
+
+        :param connections: { connection: [dashb] } (Dict[str, List[dict]])
+        :param registry: site registry, default: a new one (Optional[SiteRegistry])
+        :return: store (BandwidthStore).
+        """
+        registry = registry or SiteRegistry()
+        n_snapshots = max((len(data) for data in connections.values() if data), default=0)
+        rows = []
+        for connection, data in connections.items():
+            key = registry.connection_key(connection)
+            rows.append((key, 0, None))
+            for snapshot, dashb in enumerate(data or []):
+                rows.append((key, snapshot, dashb))
+
+        return cls._build(rows, n_snapshots, registry)
+
+    @classmethod
+    def from_partials(cls, file_paths: Sequence[str], partials: Sequence[tuple], registry: SiteRegistry,
+                      month_first_files: Iterable[str] = MONTH_FIRST_FILES, ordered: bool = False) -> 'BandwidthStore':
+        """
+        Build a store from the per-file results of process_connections.py, one snapshot per file.
+
+        The snapshots are ordered by the date in the file names (files without a date last); the connections
+        keep the order in which they first appear in the files.
+
+        :param file_paths: metrics file paths (Sequence[str])
+        :param partials: interned per-file results, [(connection key, dashb or None)] first (Sequence[tuple])
+        :param registry: site registry the partial results were interned with (SiteRegistry)
+        :param month_first_files: names of the files named latest-MM.DD.YYYY.json (Iterable[str])
+        :param ordered: the files are in chronological order, check the ambiguous dates against it (bool)
+        :return: store (BandwidthStore).
+        """
+        times = snapshot_times(file_paths, month_first_files, ordered)
+        # NaT sorts last
+        order = np.argsort(times, kind='stable')
+        position = np.empty(len(order), dtype=int)
+        position[order] = np.arange(len(order))
+        rows = ((key, int(position[snapshot]), dashb) for snapshot, (entries, *_) in enumerate(partials) for key, dashb in entries)
+        labels = [os.path.basename(file_paths[index]) for index in order]
+
+        return cls._build(rows, len(file_paths), registry, labels, times[order])
+
+    def connection_names(self) -> List[str]:
+        """
+        Return the connection names, "A:B".
+
+        :return: connection names (List[str]).
+        """
+        return [f'{self.sites[source]}:{self.sites[destination]}' for source, destination in self.pairs.tolist()]
+
+    def to_connections(self) -> Dict[str, List[dict]]:
+        """
+        Convert the store to the combined_connections.json layout.
+
+        :return: { connection: [dashb] } (Dict[str, List[dict]]).
+        """
+        connections = {}
+        for name, data in zip(self.connection_names(), self.values.tolist()):
+            connections[name] = []
+            for sample in data:
+                dashb = {key: value for key, value in zip(RESOLUTIONS, sample) if value == value}  # NaN != NaN
+                if dashb:
+                    connections[name].append(dashb)
+
+        return connections
+
+    def save(self, file_path: str):
+        """
+        Save the store as an uncompressed .npz file.
+
+        :param file_path: file path (str).
+        """
+        print(f'writing bandwidth store to {file_path}')
+        np.savez(file_path, sites=np.array(self.sites, dtype=str), pairs=self.pairs, values=self.values,
+                 snapshots=np.array(self.snapshots, dtype=str), times=self.times.astype('datetime64[s]'))
+
+    @classmethod
+    def load(cls, file_path: str, mmap: bool = True) -> 'BandwidthStore':
+        """
+        Load a store saved with save().
+
+        :param file_path: file path (str)
+        :param mmap: memory-map the arrays instead of reading them (bool)
+        :return: store (BandwidthStore).
+        """
+        arrays = _load_npz(file_path, mmap=mmap)
+
+        return cls(arrays['sites'].tolist(), arrays['pairs'], arrays['values'], arrays['snapshots'].tolist(), arrays.get('times'))
+
+    def select(self, since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> 'BandwidthStore':
+        """
+        Return a view of the store restricted to the snapshots in [since, until].
+
+        :param since: first date to include, None for no lower limit (Optional[np.datetime64])
+        :param until: last date to include, None for no upper limit (Optional[np.datetime64])
+        :return: store sharing the arrays of this one (BandwidthStore)
+        :raises ValueError: if the snapshot dates are unknown.
+        """
+        if not self.has_times():
+            raise ValueError('the snapshot dates are unknown, rebuild the store with process_connections.py --store')
+        start = 0 if since is None else int(np.searchsorted(self.times, since, side='left'))
+        stop = len(self.times) if until is None else int(np.searchsorted(self.times, until, side='right'))
+
+        return BandwidthStore(self.sites, self.pairs, self.values[:, start:stop], self.snapshots[start:stop], self.times[start:stop])
+
+    def _reduce(self, function, *args, **kwargs) -> np.ndarray:
+        """
+        Apply a NaN-ignoring reduction over the snapshots and resolutions of each connection.
+
+        :param function: numpy nan-reduction, e.g. np.nanmax
+        :return: one value per connection, NaN for connections without values (np.ndarray).
+        """
+        flat = self.values.reshape(len(self.pairs), -1)
+        if flat.shape[1] == 0:
+            return np.full(len(self.pairs), np.nan)
+        with warnings.catch_warnings():
+            # all-NaN rows (connections without any values) are expected
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return function(flat, *args, axis=1, **kwargs)
+
+    def max(self) -> np.ndarray:
+        """
+        Return the highest value of each connection.
+
+        :return: one value per connection, NaN for connections without values (np.ndarray).
+        """
+        return self._reduce(np.nanmax)
+
+    def mean(self) -> np.ndarray:
+        """
+        Return the mean value of each connection.
+
+        :return: one value per connection, NaN for connections without values (np.ndarray).
+        """
+        return self._reduce(np.nanmean)
+
+    def percentile(self, q: float, method: str = 'linear') -> np.ndarray:
+        """
+        Return the q-th percentile of the values of each connection.
+
+        :param q: percentile, 0-100 (float)
+        :param method: estimation method, see np.percentile; 'inverted_cdf' matches KLLSketch.quantile() (str)
+        :return: one value per connection, NaN for connections without values (np.ndarray).
+        """
+        return self._reduce(np.nanpercentile, q, method=method)
@@ -0,0 +1,409 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Benchmarks for the core functions of the REDWOOD scripts.
+
+Each benchmark builds its input with the seeded generators of synthetic_data.py (not timed), then times the
+core function of a script over a sweep of input sizes and measures its peak Python memory (tracemalloc, which
+includes NumPy arrays). The results are written as JSON and can be compared with an earlier result file:
+
+  python benchmark.py --output baseline.json
+  ... change the code ...
+  python benchmark.py --baseline baseline.json
+
+A benchmark is reported as a regression when its time or memory grows by more than --threshold; the script then
+exits with status 1. --scale full sweeps production sizes (1k to 1M connections, 10 to 100k nodes), which takes a
+while and several GB of memory.
+
+Usage: python benchmark.py [--scale small|full] [--only <benchmark> ...] [--repeat <number>] [--seed <number>]
+       [--output <file>] [--baseline <file>] [--threshold <fraction>]
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from data_io import read_json_to_dict, write_dict_to_json
+import synthetic_data
+
+# input sizes per benchmark and scale
+SIZES = {
+    'small': {
+        'process_connections': [1000, 10000],
+        'process_connections_json': [1000, 10000],
+        'reduce_connections': [1000, 10000],
+        'number_of_cpus': [100, 1000],
+        'number_of_cpus_numpy': [100, 1000],
+        'number_of_cpus_dict': [100, 1000],
+        'combine': [100, 1000],
+        'generate_xml': [10, 100, 1000],
+        'generate_xml_fragments': [10, 100, 1000],
+        'widest_path': [10, 100],
+        'extract_time_diffs': [1000, 10000],
+        'timeline': [1000, 10000],
+        'subset_platform': [100, 1000],
+    },
+    'full': {
+        'process_connections': [1000, 10000, 100000, 1000000],
+        'process_connections_json': [1000, 10000, 100000, 1000000],
+        'reduce_connections': [1000, 10000, 100000, 1000000],
+        'number_of_cpus': [100, 1000, 4380, 43800],
+        'number_of_cpus_numpy': [100, 1000, 4380, 43800],
+        'number_of_cpus_dict': [100, 1000, 4380, 43800],
+        'combine': [100, 1000, 10000, 100000],
+        'generate_xml': [10, 100, 1000, 10000, 100000],
+        'generate_xml_fragments': [10, 100, 1000, 10000, 100000],
+        'widest_path': [10, 100, 1000],
+        'extract_time_diffs': [1000, 10000, 100000, 1000000],
+        'timeline': [1000, 10000, 100000, 1000000],
+        'subset_platform': [100, 1000, 10000],
+    },
+}
+SNAPSHOTS = 4
+GRAFANA_QUEUES = 200
+
+
+def setup_process_connections(size: int, seed: int, workdir: str, loader: str = 'stream') -> Callable[[], object]:
+    """
+    Prepare process_connections.process_file() on one metrics file of `size` connections.
+
+    :param size: number of connections (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files (str)
+    :param loader: 'stream' or 'json' (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    from process_connections import process_file
+
+    file_path = os.path.join(workdir, 'latest-01.01.2024.json')
+    write_dict_to_json(synthetic_data.rucio_metrics(size, seed=seed), file_path, quiet=True)
+
+    return lambda: process_file(file_path, loader=loader)
+
+
+def setup_reduce_connections(size: int, seed: int, workdir: str) -> Callable[[], object]:
+    """
+    Prepare process_combined_connections.reduce_connections() on `size` connections with SNAPSHOTS snapshots.
+
+    :param size: number of connections (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    from bandwidth_store import BandwidthStore
+    from process_combined_connections import reduce_connections
+    from process_connections import extract_connections, intern_partials
+    from site_registry import SiteRegistry
+
+    n_sites = synthetic_data.sites_for_connections(size)
+    file_paths = synthetic_data.snapshot_file_names(SNAPSHOTS)
+    partials = [extract_connections(synthetic_data.rucio_metrics(size, n_sites, seed=seed + snapshot).items()) for snapshot in range(SNAPSHOTS)]
+    registry = SiteRegistry()
+    store = BandwidthStore.from_partials(file_paths, intern_partials(partials, registry), registry)
+
+    return lambda: reduce_connections(store)
+
+
+def setup_number_of_cpus(size: int, seed: int, workdir: str, method: str = 'stream') -> Callable[[], object]:
+    """
+    Prepare the number_of_cpus.py reduction of a Grafana CSV with `size` rows of GRAFANA_QUEUES queues.
+
+    :param size: number of rows (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files (str)
+    :param method: 'stream', 'numpy' or 'dict' (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    from number_of_cpus import find_max_values, read_csv_to_dict, stream_max_values
+
+    file_path = os.path.join(workdir, 'grafana-6months.csv')
+    synthetic_data.write_grafana_csv(file_path, GRAFANA_QUEUES, size, seed)
+    if method == 'dict':
+        return lambda: find_max_values(read_csv_to_dict(file_path))
+
+    return lambda: stream_max_values(file_path, method=method).result()
+
+
+def setup_combine(size: int, seed: int, workdir: str) -> Callable[[], object]:
+    """
+    Prepare combine.combine() for `size` queues.
+
+    :param size: number of queues (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    from combine import combine
+
+    queues = synthetic_data.queues_and_rses(size, max(2, size // 4), seed)
+    gflops = synthetic_data.corepower(size, seed)
+    cores = synthetic_data.queue_corecount(size, seed)
+
+    return lambda: combine(queues, gflops, cores, option=2)
+
+
+def setup_generate_xml(size: int, seed: int, workdir: str, backend: str = 'stream') -> Callable[[], object]:
+    """
+    Prepare generate_xml.generate_xml_stream() (or generate_xml_fragments()) for a flat platform of `size` nodes.
+
+    :param size: number of nodes (int)
+    :param seed: random seed, unused (int)
+    :param workdir: directory for the output file (str)
+    :param backend: 'stream' or 'fragments' (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    from generate_xml import generate_xml_fragments, generate_xml_stream
+
+    file_path = os.path.join(workdir, 'platform.xml')
+    generate = generate_xml_fragments if backend == 'fragments' else generate_xml_stream
+
+    return lambda: generate(file_path, size)
+
+
+def setup_widest_path(size: int, seed: int, workdir: str) -> Callable[[], object]:
+    """
+    Prepare widest_path.WidestPaths for `size` sites with about a third of the site pairs measured.
+
+    :param size: number of sites (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    import random
+    from widest_path import WidestPaths
+
+    rng = random.Random(seed)
+    sites = synthetic_data.site_names(size)
+    connections = {f'{source}:{destination}': rng.uniform(1, 10000) for i, source in enumerate(sites) for destination in sites[i + 1:]
+                   if rng.random() < 0.3}
+
+    return lambda: WidestPaths(connections, cache_dir=None)
+
+
+def setup_extract_time_diffs(size: int, seed: int, workdir: str) -> Callable[[], object]:
+    """
+    Prepare the extract_time_diffs.py analysis of a WRENCH output file with `size` tasks.
+
+    :param size: number of tasks (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    file_path = os.path.join(workdir, 'wrench.json')
+    write_dict_to_json(synthetic_data.wrench_output(size, n_hosts=max(1, size // 100), seed=seed), file_path, quiet=True)
+
+    from extract_time_diffs import read_tasks, summarize
+
+    def run():
+        _, columns = read_tasks(file_path)
+        return summarize(columns['compute_start'] - columns['whole_task_start'])
+
+    return run
+
+
+def setup_timeline(size: int, seed: int, workdir: str) -> Callable[[], object]:
+    """
+    Prepare timeline.timelines() on the tasks of a WRENCH output file with `size` tasks.
+
+    :param size: number of tasks (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    from timeline import read_intervals, timelines
+
+    file_path = os.path.join(workdir, 'wrench.json')
+    write_dict_to_json(synthetic_data.wrench_output(size, n_hosts=max(1, size // 100), seed=seed), file_path, quiet=True)
+    host_names, host_cores, tasks = read_intervals(file_path)
+
+    return lambda: timelines(host_names, host_cores, tasks)
+
+
+def setup_subset_platform(size: int, seed: int, workdir: str) -> Callable[[], object]:
+    """
+    Prepare subset_platform.select() of a tenth of `size` queues with the connected strategy.
+
+    :param size: number of queues (int)
+    :param seed: random seed (int)
+    :param workdir: directory for the input files, unused (str)
+    :return: benchmark function (Callable[[], object]).
+    """
+    import random
+    from combine import combine
+    from generate_xml import get_rses
+    from subset_platform import select, usable_queues
+
+    rng = random.Random(seed)
+    queues = usable_queues(combine(synthetic_data.queues_and_rses(size, max(2, size // 4), seed), synthetic_data.corepower(size, seed),
+                                   synthetic_data.queue_corecount(size, seed), option=2))
+    rses = sorted({rse for info in queues.values() for rse in get_rses(info)})
+    connections = {f'{source}:{destination}': rng.uniform(1, 10000) for i, source in enumerate(rses) for destination in rses[i + 1:]
+                   if rng.random() < 0.3}
+
+    return lambda: select(queues, connections, max(1, size // 10), strategy='connected')
+
+
+BENCHMARKS = {
+    'process_connections': setup_process_connections,
+    'process_connections_json': lambda size, seed, workdir: setup_process_connections(size, seed, workdir, loader='json'),
+    'reduce_connections': setup_reduce_connections,
+    'number_of_cpus': setup_number_of_cpus,
+    'number_of_cpus_numpy': lambda size, seed, workdir: setup_number_of_cpus(size, seed, workdir, method='numpy'),
+    'number_of_cpus_dict': lambda size, seed, workdir: setup_number_of_cpus(size, seed, workdir, method='dict'),
+    'combine': setup_combine,
+    'generate_xml': setup_generate_xml,
+    'generate_xml_fragments': lambda size, seed, workdir: setup_generate_xml(size, seed, workdir, backend='fragments'),
+    'widest_path': setup_widest_path,
+    'extract_time_diffs': setup_extract_time_diffs,
+    'timeline': setup_timeline,
+    'subset_platform': setup_subset_platform,
+}
+
+
+def measure(function: Callable[[], object], repeat: int = 3) -> Dict[str, float]:
+    """
+    Time a function and measure its peak memory.
+
+    The times are measured without tracemalloc, which slows down allocations; the memory is measured in one
+    extra run.
+
+    :param function: benchmark function (Callable[[], object])
+    :param repeat: number of timed runs (int)
+    :return: { 'wall': best wall time (s), 'wall_median': .., 'cpu': best CPU time (s), 'peak_memory': bytes } (Dict[str, float]).
+    """
+    walls = []
+    cpus = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            gc.collect()
+            wall, cpu = time.perf_counter(), time.process_time()
+            function()
+            walls.append(time.perf_counter() - wall)
+            cpus.append(time.process_time() - cpu)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {'wall': min(walls), 'wall_median': statistics.median(walls), 'cpu': min(cpus), 'peak_memory': peak}
+
+
+def run_benchmarks(names: List[str], scale: str = 'small', repeat: int = 3, seed: int = synthetic_data.DEFAULT_SEED) -> dict:
+    """
+    Run benchmarks over their size sweep.
+
+    :param names: benchmark names (List[str])
+    :param scale: 'small' or 'full' (str)
+    :param repeat: number of timed runs per size (int)
+    :param seed: random seed for the synthetic inputs (int)
+    :return: { 'meta': {..}, 'results': { benchmark: { size: measurements } } } (dict).
+    """
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    results = {}
+    for name in names:
+        results[name] = {}
+        for size in SIZES[scale][name]:
+            with tempfile.TemporaryDirectory() as workdir:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    function = BENCHMARKS[name](size, seed, workdir)
+                result = measure(function, repeat)
+            results[name][str(size)] = result
+            print(f'{name:26s} {size:>9d}  {result["wall"]:10.4f} s  {result["peak_memory"] / 1e6:10.1f} MB')
+
+    meta = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'numpy': numpy_version,
+        'platform': platform.platform(),
+        'scale': scale,
+        'repeat': repeat,
+        'seed': seed,
+    }
+
+    return {'meta': meta, 'results': results}
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2) -> List[str]:
+    """
+    Compare benchmark results with a baseline.
+
+    :param results: results from run_benchmarks() (dict)
+    :param baseline: earlier results (dict)
+    :param threshold: relative increase of time or memory reported as a regression (float)
+    :return: descriptions of the regressions (List[str]).
+    """
+    regressions = []
+    print(f'{"benchmark":26s} {"size":>9s}  {"time":>8s}  {"memory":>8s}  (ratio to baseline)')
+    for name, sizes in results['results'].items():
+        for size, result in sizes.items():
+            reference = baseline.get('results', {}).get(name, {}).get(size)
+            if not reference:
+                continue
+            ratios = {key: result[key] / reference[key] if reference[key] else 1.0 for key in ('wall', 'peak_memory')}
+            flags = [key for key, ratio in ratios.items() if ratio > 1 + threshold]
+            print(f'{name:26s} {size:>9s}  {ratios["wall"]:8.2f}  {ratios["peak_memory"]:8.2f}  {"REGRESSION" if flags else ""}')
+            regressions.extend(f'{name} {size}: {key} x{ratios[key]:.2f}' for key in flags)
+
+    return regressions
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Benchmark the REDWOOD scripts on synthetic data.')
+    parser.add_argument('--scale', choices=list(SIZES), default='small', help='Size sweep (default: small).')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='Benchmarks to run (default: all).')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per size, the best one is reported (default: 3).')
+    parser.add_argument('--seed', type=int, default=synthetic_data.DEFAULT_SEED, help='Random seed for the synthetic inputs.')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='Result file (default: benchmark_results.json).')
+    parser.add_argument('--baseline', type=str, help='Earlier result file to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative increase in time or memory reported as a regression (default: 0.2).')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only or list(BENCHMARKS), scale=args.scale, repeat=args.repeat, seed=args.seed)
+    write_dict_to_json(results, args.output, pretty=True)
+    if args.baseline:
+        regressions = compare(results, read_json_to_dict(args.baseline), args.threshold)
+        for regression in regressions:
+            print(f'regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,88 +21,249 @@
 """
 Combine GFLOPS, number of CPUs and RSE info into one file.
 The total GFLOPS number is calculated by multiplying the GFLOPS number per CPU with
-the total number of CPUs.
+the total number of CPUs, which is also kept as the number of cores of the queue.
 
 Use queue_corecount.json for number of cores per queue
 Use corepower.json for corepower, ie the average benchmark per core for a queue
+
+Every input file is loaded once and turned into a queue-keyed index of numbers, and all GFLOPS models are computed
+in one pass over the queues, one output file per model:
+
+  runtimes   gflops_per_cpu.json x number_of_cpus.json          -> queues-runtimes_based.json
+  corepower  corepower.json (corepower) x queue_corecount.json   -> queues-corepower_based.json (x 10)
+
+Other models are given as NAME=GFLOPS_FILE[:FIELD],CPU_FILE[:FIELD],SCALE, e.g. with the job slot statistics of
+number_of_cpus.py --stats as the number of CPUs. The queues missing in each source are written to a report
+instead of being printed one by one.
 """
 
-import json
+import argparse
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from data_io import read_json_to_dict, write_dict_to_json
+from profiling import Profiler, add_arguments
+
+QUEUES_AND_RSES = 'queues_and_rses.json'
+DEFAULT_REPORT = 'combine_report.json'
+
+
+class Model(NamedTuple):
+    """A GFLOPS model: GFLOPS per CPU x number of CPUs x scale factor, both read from a source FILE[:FIELD]."""
+
+    name: str
+    gflops: str
+    cpus: str
+    scale: Union[int, float]
+
+    @property
+    def output(self) -> str:
+        """Output file of the model."""
+        return f'queues-{self.name}_based.json'
+
+
+# runtimes (formerly option 1): based on average run times and total number of CPUs
+# corepower (formerly option 2): based on corepower and total number of cores
+MODELS = {
+    'runtimes': Model('runtimes', 'gflops_per_cpu.json', 'number_of_cpus.json', 1),
+    'corepower': Model('corepower', 'corepower.json:corepower', 'queue_corecount.json', 10),
+}
+
+
+def parse_scale(text: str) -> Union[int, float]:
+    """
+    Convert a scale factor, keeping integers exact.
+
+    :param text: scale factor (str)
+    :return: scale factor (Union[int, float]).
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
 
 
-def read_json_to_dict(file_path: str) -> dict:
+def parse_model(spec: str) -> Model:
     """
-    Read a json file to a dictionary.
+    Parse a model given on the command line.
 
-    :param file_path: path to the JSON file (str)
-    :return: data dictionary (dict).
+    :param spec: NAME for one of MODELS, or NAME=GFLOPS_FILE[:FIELD],CPU_FILE[:FIELD],SCALE (str)
+    :raises ValueError: for unknown names or malformed specifications
+    :return: model (Model).
     """
-    with open(file_path, 'r', encoding='utf-8') as json_file:
-        data_dict = json.load(json_file)
+    name, _, definition = spec.partition('=')
+    if not definition:
+        if name not in MODELS:
+            raise ValueError(f'unknown model {name} (known: {", ".join(MODELS)})')
+        return MODELS[name]
+    parts = definition.split(',')
+    if not name or len(parts) != 3:
+        raise ValueError(f'expected NAME=GFLOPS_FILE[:FIELD],CPU_FILE[:FIELD],SCALE, got {spec}')
 
-    return data_dict
+    return Model(name, parts[0], parts[1], parse_scale(parts[2]))
 
 
-def write_dict_to_json(data_dict: dict, file_path: str):
+def split_source(source: str) -> Tuple[str, Optional[str]]:
     """
-    Write a dictionary to a JSON file.
+    Split a source into its file and the field to use in per-queue dictionaries.
 
-    :param data_dict: data dictionary (dict)
-    :param file_path: path to the JSON file (str)
+    :param source: FILE[:FIELD] (str)
+    :return: file path and field, or None (Tuple[str, Optional[str]]).
     """
-    with open(file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(data_dict, json_file, indent=2)  # 'indent' parameter is used for pretty formatting
-
-
-queues_and_rses = read_json_to_dict('queues_and_rses.json')
-
-option = 2
-scale_factor = 1 if option == 1 else 10
-
-# option 1
-# based on average run times and total number of CPUs
-# gflops_per_cpu = read_json_to_dict('gflops_per_cpu.json')
-# number_of_cpus = read_json_to_dict('number_of_cpus.json')
-
-# option 2
-# based on corepower and total number of cores
-gflops_per_cpu = read_json_to_dict('corepower.json')
-number_of_cpus = read_json_to_dict('queue_corecount.json')
-
-# add new field 'gflops' to queues and rses dictionary
-combined = {}
-for queue in queues_and_rses:
-
-    # get the number of CPUs for this queue
-    n_cpus = number_of_cpus.get(queue)
-    if not n_cpus:
-        print(f'number of CPUs unknown for {queue}')
-        continue
-
-    # get the GFLOPS number for this queue
-    if option == 1:
-        gflops = gflops_per_cpu.get(queue)
-    else:
-        d = gflops_per_cpu.get(queue)
-        gflops = d.get('corepower')
-    if not gflops:
-        print(f'GFLOPS unknown for {queue}')
-        continue
-
-    # verify that the queue has RSE(s)
-    rses = queues_and_rses.get(queue)
-    if not rses:
-        print(f'RSE(s) unknown for {queue}')
-        continue
-
-    # add to new dictionary
+    path, _, field = source.partition(':')
+
+    return path, field or None
+
+
+def build_index(data: dict, field: Optional[str] = None) -> Tuple[Dict[str, int], List[str]]:
+    """
+    Build the queue-keyed index of a source.
+
+    Entries without a (non-zero) value are left out of the index; entries that are not numbers are left out and
+    listed as invalid.
+
+    :param data: { queue: number } or { queue: { field: number } } (dict)
+    :param field: field to use in per-queue dictionaries (Optional[str])
+    :return: { queue: number } and the queues with invalid values (Tuple[Dict[str, int], List[str]]).
+    """
+    index = {}
+    invalid = []
+    for queue, value in data.items():
+        if isinstance(value, dict):
+            value = value.get(field) if field else None
+        if not value:
+            continue
+        try:
+            index[queue] = int(value)
+        except (TypeError, ValueError):
+            invalid.append(queue)
+
+    return index, invalid
+
+
+def join(queues_and_rses: dict, sources: Dict[str, dict], models: List[Model]) -> Tuple[Dict[str, dict], dict]:
+    """
+    Combine the RSE(s), GFLOPS and number of CPUs of each queue for all models in one pass.
+
+    :param queues_and_rses: RSE info per queue, from queues_and_rses.json (dict)
+    :param sources: loaded files, { path: data } (Dict[str, dict])
+    :param models: models to compute (List[Model])
+    :return: { model name: { queue: { 'RSE': .., 'GFLOPS': .., 'cores': .. } } } and the missing keys report (Tuple[Dict[str, dict], dict]).
+    """
+    indexes = {}
+    report = {'queues': len(queues_and_rses), 'sources': {}, 'models': {}}
+    for source in sorted({source for model in models for source in (model.gflops, model.cpus)}):
+        path, field = split_source(source)
+        index, invalid = build_index(sources[path], field)
+        indexes[source] = index
+        report['sources'][source] = {'missing': [], 'invalid': invalid,
+                                     'unmatched': sum(1 for queue in index if queue not in queues_and_rses)}
+    missing_rses = []
+
+    combined = {model.name: {} for model in models}
+    for queue, rses in queues_and_rses.items():
+        rse = rses.get('RSE') if rses else None
+        if not rse:
+            missing_rses.append(queue)
+        for source, index in indexes.items():
+            if queue not in index:
+                report['sources'][source]['missing'].append(queue)
+        if not rse:
+            continue
+        for model in models:
+            gflops = indexes[model.gflops].get(queue)
+            n_cpus = indexes[model.cpus].get(queue)
+            if gflops and n_cpus:
+                combined[model.name][queue] = {'RSE': rse, 'GFLOPS': gflops * n_cpus * model.scale, 'cores': n_cpus}
+
+    report['sources'][QUEUES_AND_RSES] = {'missing': missing_rses, 'invalid': [], 'unmatched': 0}
+    for model in models:
+        report['models'][model.name] = {'output': model.output, 'queues': len(combined[model.name]),
+                                        'gflops': model.gflops, 'cpus': model.cpus, 'scale': model.scale}
+
+    return combined, report
+
+
+def summarize(report: dict):
+    """
+    Print a summary of a missing keys report.
+
+    :param report: report from join() (dict).
+    """
+    for source, entry in report['sources'].items():
+        if entry['missing'] or entry['invalid']:
+            print(f"{source}: {len(entry['missing'])} of {report['queues']} queues missing, {len(entry['invalid'])} invalid")
+    for name, entry in report['models'].items():
+        print(f"{name}: combined info for {entry['queues']} queues")
+
+
+def combine(queues_and_rses: dict, gflops_per_cpu: dict, number_of_cpus: dict, option: int = 2) -> dict:
+    """
+    Combine the RSE(s), GFLOPS and number of CPUs of each queue.
+
+    :param queues_and_rses: RSE info per queue, from queues_and_rses.json (dict)
+    :param gflops_per_cpu: GFLOPS per CPU (option 1, gflops_per_cpu.json) or corepower (option 2, corepower.json) per queue (dict)
+    :param number_of_cpus: number of CPUs (option 1, number_of_cpus.json) or cores (option 2, queue_corecount.json) per queue (dict)
+    :param option: 1 for run times based, 2 for corepower based GFLOPS (int)
+    :return: { queue: { 'RSE': .., 'GFLOPS': .., 'cores': .. } } (dict).
+    """
+    model = MODELS['runtimes' if option == 1 else 'corepower']
+    sources = {split_source(model.gflops)[0]: gflops_per_cpu, split_source(model.cpus)[0]: number_of_cpus}
+    combined, report = join(queues_and_rses, sources, [model])
+    summarize(report)
+
+    return combined[model.name]
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Combine GFLOPS, number of CPUs and RSE info into one file per GFLOPS model.')
+    parser.add_argument('--model', type=str, action='append', metavar='SPEC',
+                        help=f'Model to compute, may be repeated: one of {", ".join(MODELS)}, or '
+                             'NAME=GFLOPS_FILE[:FIELD],CPU_FILE[:FIELD],SCALE (default: every predefined model whose files exist).')
+    parser.add_argument('--scale', type=str, action='append', default=[], metavar='NAME=FACTOR',
+                        help='Override the scale factor of a model, may be repeated.')
+    parser.add_argument('--report', type=str, default=DEFAULT_REPORT, help=f'Missing keys report (default: {DEFAULT_REPORT}).')
+    add_arguments(parser, 'combine')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'combine')
+
     try:
-        combined[queue] = {}
-        combined[queue]['RSE'] = rses.get('RSE')
-        combined[queue]['GFLOPS'] = int(gflops) * int(n_cpus) * scale_factor
-    except (TypeError, ValueError) as exc:
-        print(f'exception caught: {exc}')
-
-print(f'combined info for {len(combined.keys())} queues')
-filename = 'queues-runtimes_based.json' if option == 1 else 'queues-corepower_based.json'
-write_dict_to_json(combined, filename)
+        if args.model:
+            models = [parse_model(spec) for spec in args.model]
+        else:
+            models = [model for model in MODELS.values()
+                      if all(os.path.exists(split_source(source)[0]) for source in (model.gflops, model.cpus))]
+        scales = {name: parse_scale(factor) for name, _, factor in (scale.partition('=') for scale in args.scale)}
+    except ValueError as exc:
+        parser.error(str(exc))
+    unknown = set(scales) - {model.name for model in models}
+    if unknown:
+        parser.error(f'--scale for unknown model(s): {", ".join(sorted(unknown))}')
+    if not models:
+        parser.error('no model has all its input files')
+    missing = [path for path in dict.fromkeys(split_source(source)[0] for model in models for source in (model.gflops, model.cpus))
+               if not os.path.exists(path)]
+    if missing:
+        parser.error(f'missing input file(s): {", ".join(missing)}')
+    models = [model._replace(scale=scales.get(model.name, model.scale)) for model in models]
+
+    with profiler.phase('load'):
+        # each file is read once, however many models use it
+        paths = [QUEUES_AND_RSES] + [split_source(source)[0] for model in models for source in (model.gflops, model.cpus)]
+        sources = {path: read_json_to_dict(path) for path in dict.fromkeys(paths)}
+
+    with profiler.phase('transform'):
+        combined, report = join(sources[QUEUES_AND_RSES], sources, models)
+        profiler.count('queues', len(sources[QUEUES_AND_RSES]))
+        profiler.count('models', len(models))
+    summarize(report)
+    with profiler.phase('write'):
+        for model in models:
+            write_dict_to_json(combined[model.name], model.output)
+        write_dict_to_json(report, args.report)
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+On-disk cache for the per-file results of process_connections.py.
+
+Each metrics file is keyed by its path, size, modification time and SHA-256 digest. The extracted
+connections are stored as a compressed pickle named after the digest, so a rerun only has to parse
+files that are new or have changed. Unchanged files are recognized from their size and modification
+time alone; if only the modification time changed, the digest decides.
+
+Usage: python connection_cache.py [--cache-dir <directory>] [--list | --invalidate [<file> ...]]
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import zlib
+from typing import Any, List, Optional
+
+from data_io import read_json_to_dict, write_dict_to_json
+
+# bump when the format of the cached results changes, to invalidate old caches
+CACHE_VERSION = 3
+DEFAULT_CACHE_DIR = '.connection_cache'
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Return the SHA-256 digest of a file.
+
+    :param file_path: file path (str)
+    :param chunk_size: read size in bytes (int)
+    :return: hex digest (str).
+    """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+class ConnectionCache:
+    """Cache of per-file results, stored in a directory with an index.json and one blob per digest."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        """
+        Initialize the cache and read its index, if any.
+
+        :param cache_dir: cache directory (str).
+        """
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.entries = {}
+        self.changed = False
+        if os.path.exists(self.index_path):
+            index = read_json_to_dict(self.index_path)
+            if index.get('version') == CACHE_VERSION:
+                self.entries = index.get('entries', {})
+            else:
+                self.changed = True
+
+    def _blob_path(self, digest: str) -> str:
+        """
+        Return the path of the blob for the given digest.
+
+        :param digest: file digest (str)
+        :return: blob path (str).
+        """
+        return os.path.join(self.cache_dir, f'{digest}.pickle.z')
+
+    def lookup(self, file_path: str) -> Optional[Any]:
+        """
+        Return the cached result for a file, or None if the file is new or has changed.
+
+        :param file_path: file path (str)
+        :return: cached result (Optional[Any]).
+        """
+        key = os.path.abspath(file_path)
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+
+        stat = os.stat(file_path)
+        if entry['size'] != stat.st_size:
+            return None
+        if entry['mtime_ns'] != stat.st_mtime_ns:
+            # touched, but maybe not modified
+            if file_digest(file_path) != entry['sha256']:
+                return None
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self.changed = True
+
+        try:
+            with open(self._blob_path(entry['sha256']), 'rb') as blob:
+                return pickle.loads(zlib.decompress(blob.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError) as exc:
+            print(f'ignoring broken cache entry for {file_path}: {exc}')
+            return None
+
+    def store(self, file_path: str, result: Any):
+        """
+        Store the result for a file, replacing the blob of its previous content if no other entry uses it.
+
+        The blob is always rewritten, since the new result may hold more than the cached one (eg sketches).
+
+        :param file_path: file path (str)
+        :param result: result to cache, must be picklable (Any).
+        """
+        stat = os.stat(file_path)
+        digest = file_digest(file_path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        blob_path = self._blob_path(digest)
+        tmp_path = f'{blob_path}.tmp'
+        with open(tmp_path, 'wb') as blob:
+            blob.write(zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp_path, blob_path)
+
+        key = os.path.abspath(file_path)
+        previous = self.entries.get(key)
+        self.entries[key] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest,
+        }
+        self.changed = True
+        if previous and previous['sha256'] != digest and all(entry['sha256'] != previous['sha256'] for entry in self.entries.values()):
+            try:
+                os.remove(self._blob_path(previous['sha256']))
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, file_paths: Optional[List[str]] = None) -> int:
+        """
+        Remove the entries for the given files, or all entries, and delete unreferenced blobs.
+
+        :param file_paths: file paths, None for all files (Optional[List[str]])
+        :return: number of removed entries (int).
+        """
+        if file_paths is None:
+            keys = list(self.entries)
+        else:
+            keys = [key for key in map(os.path.abspath, file_paths) if key in self.entries]
+        for key in keys:
+            del self.entries[key]
+
+        referenced = {entry['sha256'] for entry in self.entries.values()}
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.pickle.z') and name[:-len('.pickle.z')] not in referenced:
+                    os.remove(os.path.join(self.cache_dir, name))
+        self.changed = True
+
+        return len(keys)
+
+    def save(self):
+        """Write the index, if it has changed."""
+        if not self.changed:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{self.index_path}.tmp'
+        write_dict_to_json({'version': CACHE_VERSION, 'entries': self.entries}, tmp_path, quiet=True)
+        os.replace(tmp_path, self.index_path)
+        self.changed = False
+
+    def describe(self) -> List[str]:
+        """
+        Describe the cache entries.
+
+        :return: one line per entry (List[str]).
+        """
+        lines = []
+        for key, entry in sorted(self.entries.items()):
+            blob_path = self._blob_path(entry['sha256'])
+            blob_size = os.path.getsize(blob_path) if os.path.exists(blob_path) else 0
+            lines.append(f"{key}: {entry['size']} bytes, sha256={entry['sha256'][:12]}, cached={blob_size} bytes")
+
+        return lines
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Inspect or invalidate the process_connections.py cache.')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, help='Cache directory.')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--list', action='store_true', help='List the cached files.')
+    group.add_argument('--invalidate', nargs='*', metavar='FILE',
+                       help='Remove the given files from the cache, or all files if none are given.')
+    args = parser.parse_args()
+
+    cache = ConnectionCache(args.cache_dir)
+    if args.list:
+        for line in cache.describe():
+            print(line)
+        print(f'{len(cache.entries)} cached files in {args.cache_dir}')
+    else:
+        removed = cache.invalidate(args.invalidate or None)
+        cache.save()
+        print(f'removed {removed} cached files from {args.cache_dir}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Common file I/O for the REDWOOD scripts.
+
+The format of a file is selected by its extension, optionally followed by a compression suffix:
+
+  .json             JSON, written with orjson when it is installed and with the stdlib json module otherwise
+  .msgpack, .mpk    MessagePack (requires the msgpack package)
+  .cbor             CBOR (requires the cbor2 package)
+  .gz, .zst         gzip or zstd compression (zstd requires the zstandard package), e.g. combined_connections.json.gz
+
+Files with another extension are treated as JSON. Output is compact unless pretty printing is requested, either
+per call or for all scripts with REDWOOD_PRETTY=1; REDWOOD_JSON_BACKEND=json forces the stdlib JSON backend.
+Both JSON backends write non-finite numbers (NaN, inf) as null, and read NaN and Infinity literals as None.
+Large uncompressed inputs are memory-mapped instead of read into a separate buffer, when the decoder
+can parse the mapping in place (orjson and msgpack).
+"""
+
+import gzip
+import io
+import json
+import math
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Any, IO, Iterator, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORMATS = {'.json': 'json', '.msgpack': 'msgpack', '.mpk': 'msgpack', '.cbor': 'cbor'}
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+MMAP_THRESHOLD = 1 << 20
+PRETTY = os.environ.get('REDWOOD_PRETTY', '') not in ('', '0')
+JSON_BACKEND = os.environ.get('REDWOOD_JSON_BACKEND', 'orjson' if orjson else 'json')
+
+Buffer = Union[bytes, memoryview]
+
+
+def file_format(file_path: str) -> tuple:
+    """
+    Return the data format and compression of a file, from its extension.
+
+    :param file_path: file path (str)
+    :return: (format, compression), compression is None for uncompressed files (tuple).
+    """
+    root, extension = os.path.splitext(file_path.lower())
+    compression = COMPRESSIONS.get(extension)
+    if compression:
+        extension = os.path.splitext(root)[1]
+
+    return FORMATS.get(extension, 'json'), compression
+
+
+def is_data_file(file_path: str) -> bool:
+    """
+    Return True if the extension of a file is one of the supported data formats.
+
+    :param file_path: file path (str)
+    :return: True for .json, .msgpack, .mpk and .cbor files, optionally compressed (bool).
+    """
+    root, extension = os.path.splitext(file_path.lower())
+    if extension in COMPRESSIONS:
+        extension = os.path.splitext(root)[1]
+
+    return extension in FORMATS
+
+
+def _zstd():
+    """
+    Import the zstandard package.
+
+    :return: zstandard module (module)
+    :raises ImportError: if zstandard is not installed.
+    """
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise ImportError('zstd compressed files require the zstandard package (pip install zstandard)') from exc
+
+    return zstandard
+
+
+def open_binary(file_path: str, mode: str = 'rb') -> IO[bytes]:
+    """
+    Open a file for binary reading or writing, (de)compressing it according to its extension.
+
+    :param file_path: file path (str)
+    :param mode: 'rb' or 'wb' (str)
+    :return: file object (IO[bytes]).
+    """
+    compression = file_format(file_path)[1]
+    if compression == 'gzip':
+        return gzip.open(file_path, mode)
+    if compression == 'zstd':
+        return _zstd().open(file_path, mode)
+
+    return open(file_path, mode)
+
+
+def open_text(file_path: str) -> IO[str]:
+    """
+    Open a (possibly compressed) file for reading UTF-8 text, e.g. for the incremental JSON reader.
+
+    :param file_path: file path (str)
+    :return: text file object (IO[str]).
+    """
+    if file_format(file_path)[1] is None:
+        return open(file_path, 'r', encoding='utf-8')
+
+    return io.TextIOWrapper(open_binary(file_path), encoding='utf-8')
+
+
+@contextmanager
+def read_buffer(file_path: str) -> Iterator[Buffer]:
+    """
+    Provide the (decompressed) contents of a file.
+
+    The file is memory-mapped if it is large, uncompressed and decoded with orjson or msgpack; the other
+    decoders need bytes, and would copy the mapping anyway.
+
+    :param file_path: file path (str)
+    :return: file contents, valid inside the with block (Iterator[Buffer]).
+    """
+    data_format, compression = file_format(file_path)
+    in_place = data_format == 'msgpack' or (data_format == 'json' and JSON_BACKEND == 'orjson')
+    if in_place and compression is None and os.path.getsize(file_path) >= MMAP_THRESHOLD:
+        with open(file_path, 'rb') as mapped_file, mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+    else:
+        with open_binary(file_path) as binary_file:
+            yield binary_file.read()
+
+
+def _msgpack():
+    """
+    Import the msgpack package.
+
+    :return: msgpack module (module)
+    :raises ImportError: if msgpack is not installed.
+    """
+    try:
+        import msgpack
+    except ImportError as exc:
+        raise ImportError('MessagePack files require the msgpack package (pip install msgpack)') from exc
+
+    return msgpack
+
+
+def _cbor2():
+    """
+    Import the cbor2 package.
+
+    :return: cbor2 module (module)
+    :raises ImportError: if cbor2 is not installed.
+    """
+    try:
+        import cbor2
+    except ImportError as exc:
+        raise ImportError('CBOR files require the cbor2 package (pip install cbor2)') from exc
+
+    return cbor2
+
+
+def loads(buffer: Buffer, data_format: str = 'json') -> Any:
+    """
+    Decode data.
+
+    :param buffer: encoded data (Buffer)
+    :param data_format: 'json', 'msgpack' or 'cbor' (str)
+    :return: decoded data (Any).
+    """
+    if data_format == 'msgpack':
+        return _msgpack().unpackb(buffer, raw=False, strict_map_key=False)
+    if data_format == 'cbor':
+        return _cbor2().loads(bytes(buffer))
+    if JSON_BACKEND == 'orjson':
+        try:
+            return orjson.loads(buffer)
+        except orjson.JSONDecodeError:  # e.g. NaN, which orjson does not accept
+            pass
+
+    return json.loads(buffer if isinstance(buffer, bytes) else bytes(buffer), parse_constant=lambda name: None)
+
+
+def _finite(data: Any) -> Any:
+    """
+    Replace the non-finite floats (NaN, inf) in data by None, like orjson does.
+
+    :param data: data (Any)
+    :return: data without non-finite floats (Any).
+    """
+    if isinstance(data, float):
+        return data if math.isfinite(data) else None
+    if isinstance(data, dict):
+        return {key: _finite(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_finite(value) for value in data]
+
+    return data
+
+
+def dumps(data: Any, data_format: str = 'json', pretty: bool = False) -> bytes:
+    """
+    Encode data.
+
+    Pretty printing only applies to JSON, which is then indented by two spaces like json.dump(..., indent=2).
+    Non-finite floats are written as null in JSON.
+
+    :param data: data (Any)
+    :param data_format: 'json', 'msgpack' or 'cbor' (str)
+    :param pretty: indent JSON (bool)
+    :return: encoded data (bytes).
+    """
+    if data_format == 'msgpack':
+        return _msgpack().packb(data, use_bin_type=True)
+    if data_format == 'cbor':
+        return _cbor2().dumps(data)
+    if JSON_BACKEND == 'orjson':
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except TypeError:  # e.g. integers beyond 64 bits or non-string keys, which the stdlib handles
+            pass
+    options = {'indent': 2} if pretty else {'separators': (',', ':')}
+    try:
+        return json.dumps(data, allow_nan=False, **options).encode('utf-8')
+    except ValueError:  # only walk the data when it holds NaN or inf
+        return json.dumps(_finite(data), allow_nan=False, **options).encode('utf-8')
+
+
+def read_json_to_dict(file_path: str) -> dict:
+    """
+    Read a json (or other supported format) file to a dictionary.
+
+    :param file_path: file path (str)
+    :return: dictionary from file (dict).
+    """
+    with read_buffer(file_path) as buffer:
+        return loads(buffer, file_format(file_path)[0])
+
+
+def write_dict_to_json(data_dict: dict, file_path: str, pretty: Optional[bool] = None, quiet: bool = False):
+    """
+    Write a dictionary to a json (or other supported format) file.
+
+    :param data_dict: data dictionary (dict)
+    :param file_path: file path (str)
+    :param pretty: indent JSON output, None for the REDWOOD_PRETTY default (Optional[bool])
+    :param quiet: do not report the file that is written (bool).
+    """
+    data = dumps(data_dict, file_format(file_path)[0], PRETTY if pretty is None else pretty)
+    if not quiet:
+        print(f'writing dictionary to {file_path}')
+    with open_binary(file_path, 'wb') as output_file:
+        output_file.write(data)
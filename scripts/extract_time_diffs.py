@@ -20,50 +20,352 @@
 
 """
 Extract time differences (job start - task start times) from a WRENCH JSON file.
+
+The tasks in workflow_execution.tasks are streamed one at a time (see json_stream.py) and their start times are
+collected into typed arrays, so the summary (count, mean, percentiles and a histogram of the differences) is
+computed with NumPy and the memory usage is a few numbers per task instead of the whole document. The per-task
+differences are only written on request, to a CSV (.csv) or NumPy (.npz) file.
+
+With --batch, many WRENCH outputs (e.g. one per generate_xml.py --nodes N platform of a scaling sweep) are
+analyzed in parallel processes and compared in one table of scheduling delay statistics and simulated makespan
+against the number of nodes. The runs are given as a directory, where the node count is the last number in each
+file (or run directory) name and the configuration the rest of the name, or as a JSON manifest:
+[{"file": "flat_1000.json", "nodes": 1000, "config": "flat"}, ...], with paths relative to the manifest.
 """
 
-import json
+import argparse
+import csv
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data_io import file_format, read_json_to_dict, write_dict_to_json
+from json_stream import JSONStreamError, iter_items
+from profiling import Profiler, add_arguments
+
+DEFAULT_INPUT = '/tmp/wrench.json'
+TASKS = ('workflow_execution', 'tasks')
+# column name: (task section, key)
+TASK_FIELDS = {
+    'whole_task_start': ('whole_task', 'start'),
+    'compute_start': ('compute', 'start'),
+}
+# batch mode also needs the end times for the makespan
+RUN_FIELDS = dict(TASK_FIELDS, whole_task_end=('whole_task', 'end'))
+PERCENTILES = (50, 90, 95, 99)
+HISTOGRAM_BINS = 20
+# write buffer for the per-task output
+BUFFER_SIZE = 1 << 20
+
+
+def read_tasks(file_path: str, fields: Dict[str, Tuple[str, str]] = None) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """
+    Read the task IDs and times from a WRENCH JSON file, one task at a time.
+
+    :param file_path: path to the WRENCH JSON file (str)
+    :param fields: { column name: (task section, key) } (default: TASK_FIELDS) (Dict[str, Tuple[str, str]])
+    :raises KeyError: if a task has no such section or key
+    :return: task IDs and { column name: times } (Tuple[List[str], Dict[str, np.ndarray]]).
+    """
+    fields = fields or TASK_FIELDS
+    task_ids = []
+    columns = {name: array('d') for name in fields}
+    appends = [(columns[name].append, section, key) for name, (section, key) in fields.items()]
+    for _, task in iter_items(file_path, prefix=TASKS):
+        task_ids.append(task['task_id'])
+        for append, section, key in appends:
+            append(task[section][key])
+
+    return task_ids, {name: np.asarray(column) for name, column in columns.items()}
+
+
+def summarize(values: np.ndarray, percentiles: Sequence[float] = PERCENTILES, bins: int = HISTOGRAM_BINS) -> dict:
+    """
+    Compute summary statistics of an array.
+
+    :param values: values (np.ndarray)
+    :param percentiles: percentiles to compute, 0-100 (Sequence[float])
+    :param bins: number of histogram bins (int)
+    :return: { 'count', 'mean', 'std', 'min', 'max', 'percentiles': { 'p50': .. }, 'histogram': { 'edges', 'counts' } } (dict).
+    """
+    if not values.size:
+        return {'count': 0}
+    counts, edges = np.histogram(values, bins=bins)
+
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'percentiles': {f'p{percentile:g}': float(value) for percentile, value in
+                        zip(percentiles, np.percentile(values, percentiles))},
+        'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+    }
+
+
+def print_summary(summary: dict, width: int = 40):
+    """
+    Print summary statistics, with the histogram as bars.
+
+    :param summary: statistics from summarize() (dict)
+    :param width: length of the longest bar (int).
+    """
+    print(f"tasks: {summary['count']}")
+    if not summary['count']:
+        return
+    print(f"mean: {summary['mean']:.3f}  std: {summary['std']:.3f}  min: {summary['min']:.3f}  max: {summary['max']:.3f}")
+    print('  '.join(f'{name}: {value:.3f}' for name, value in summary['percentiles'].items()))
+    edges = summary['histogram']['edges']
+    counts = summary['histogram']['counts']
+    peak = max(counts) or 1
+    for low, high, count in zip(edges, edges[1:], counts):
+        print(f"{low:12.3f} - {high:12.3f} {count:9d} {'#' * round(width * count / peak)}")
+
+
+def write_per_task(file_path: str, task_ids: List[str], columns: Dict[str, np.ndarray]):
+    """
+    Write the per-task values, as CSV (buffered, one row per task) or as NumPy arrays (.npz).
+
+    :param file_path: output file, .npz for binary output (str)
+    :param task_ids: task IDs (List[str])
+    :param columns: { column name: values } (Dict[str, np.ndarray]).
+    """
+    if file_path.endswith('.npz'):
+        np.savez(file_path, task_id=np.array(task_ids), **columns)
+    else:
+        with open(file_path, 'w', newline='', buffering=BUFFER_SIZE) as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['task_id'] + list(columns))
+            writer.writerows(zip(task_ids, *(values.tolist() for values in columns.values())))
+    print(f'wrote {len(task_ids)} tasks to {file_path}')
+
+
+def run_tags(name: str) -> Tuple[Optional[int], str]:
+    """
+    Derive the node count and configuration of a run from its file or directory name.
+
+    E.g. 'flat_1000.json' is 1000 nodes with configuration 'flat'.
+
+    :param name: file or directory name (str)
+    :return: node count (None if the name has no number) and configuration (Tuple[Optional[int], str]).
+    """
+    stem = name.split('.')[0]
+    numbers = list(re.finditer(r'\d+', stem))
+    if not numbers:
+        return None, stem
+    last = numbers[-1]
+    config = (re.sub(r'(?:(?:^|[_-])n|[_-])$', '', stem[:last.start()]) + stem[last.end():]).strip('_-')
+
+    return int(last.group()), config or 'default'
 
 
-def read_json_to_dict(file_path: str) -> dict:
+def find_runs(path: str) -> List[dict]:
     """
-    Read a json file to a dictionary.
+    List the WRENCH outputs of a batch.
 
-    :param file_path: file path (str)
-    :return: json dictionary from file (dict).
+    :param path: directory with WRENCH JSON files (or run directories with a wrench.json), or a JSON manifest (str)
+    :raises ValueError: for a malformed manifest
+    :return: [{ 'file', 'nodes', 'config' }] (List[dict]).
     """
-    with open(file_path, 'r', encoding='utf-8') as json_file:
-        data_dict = json.load(json_file)
+    if not os.path.isdir(path):
+        manifest = read_json_to_dict(path)
+        entries = manifest.get('runs') if isinstance(manifest, dict) else manifest
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) and 'file' in entry for entry in entries):
+            raise ValueError(f'{path}: expected a list of {{"file", "nodes", "config"}} entries')
+        base = os.path.dirname(path)
+        runs = []
+        for entry in entries:
+            nodes, config = run_tags(os.path.basename(entry['file']))
+            runs.append({'file': os.path.join(base, entry['file']), 'nodes': entry.get('nodes', nodes),
+                         'config': str(entry.get('config', config))})
+        return runs
 
-    return data_dict
+    runs = []
+    for name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, name)
+        if os.path.isdir(file_path):
+            outputs = [output for output in sorted(os.listdir(file_path)) if output.startswith('wrench.json')]
+            if not outputs:
+                continue
+            file_path = os.path.join(file_path, outputs[0])
+        elif file_format(name)[0] != 'json':
+            continue
+        nodes, config = run_tags(name)
+        runs.append({'file': file_path, 'nodes': nodes, 'config': config})
+
+    return runs
+
+
+def analyze_run(run: dict) -> dict:
+    """
+    Compute the scheduling delay statistics and the makespan of one WRENCH run.
+
+    :param run: { 'file', 'nodes', 'config' } (dict)
+    :return: the run with 'tasks', 'delay_mean', 'delay_p50' .., 'delay_max' and 'makespan', or 'error' (dict).
+    """
+    row = dict(run)
+    try:
+        _, columns = read_tasks(run['file'], RUN_FIELDS)
+    except (OSError, JSONStreamError, KeyError, TypeError, ValueError) as exc:
+        # unreadable file, missing field, or a null or non-numeric time
+        row['error'] = f'{type(exc).__name__}: {exc}'
+        return row
+    delays = columns['compute_start'] - columns['whole_task_start']
+    summary = summarize(delays, bins=1)
+    row['tasks'] = summary['count']
+    if summary['count']:
+        row['delay_mean'] = summary['mean']
+        row.update({f'delay_{name}': value for name, value in summary['percentiles'].items()})
+        row['delay_max'] = summary['max']
+        row['makespan'] = float(columns['whole_task_end'].max() - columns['whole_task_start'].min())
+
+    return row
+
+
+def compare_runs(runs: List[dict], jobs: int = 1) -> List[dict]:
+    """
+    Analyze WRENCH runs in parallel and compare their makespans.
+
+    Runs are compared with the run with the fewest nodes of the same configuration: speedup is its makespan
+    divided by the makespan of the run, and efficiency the speedup divided by the increase in nodes, which drops
+    below 1 where the simulated system stops scaling.
+
+    :param runs: runs from find_runs() (List[dict])
+    :param jobs: number of worker processes (int)
+    :return: one row per run, sorted by configuration and node count (List[dict]).
+    """
+    if jobs > 1 and len(runs) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(runs))) as executor:
+            rows = list(executor.map(analyze_run, runs))
+    else:
+        rows = [analyze_run(run) for run in runs]
+
+    rows.sort(key=lambda row: (row['config'], row['nodes'] is None, row['nodes'] or 0, row['file']))
+    reference = {}
+    for row in rows:
+        if not row.get('makespan') or not row['nodes']:
+            continue
+        base = reference.setdefault(row['config'], row)
+        row['speedup'] = base['makespan'] / row['makespan']
+        row['efficiency'] = row['speedup'] * base['nodes'] / row['nodes']
+
+    return rows
+
+
+TABLE_COLUMNS = ['config', 'nodes', 'tasks', 'delay_mean', 'delay_p50', 'delay_p95', 'delay_p99', 'delay_max',
+                 'makespan', 'speedup', 'efficiency']
+
+
+def print_table(rows: List[dict]):
+    """
+    Print the comparison table.
+
+    :param rows: rows from compare_runs() (List[dict]).
+    """
+    print(''.join(f'{column:>14}' for column in TABLE_COLUMNS))
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['config']:>14}{str(row['nodes']):>14}  {row['file']}: {row['error']}")
+            continue
+        cells = []
+        for column in TABLE_COLUMNS:
+            value = row.get(column)
+            cells.append(f'{value:14.3f}' if isinstance(value, float) else f'{str("" if value is None else value):>14}')
+        print(''.join(cells))
+
+
+def write_table(rows: List[dict], file_path: str):
+    """
+    Write the comparison table, as CSV (.csv) or JSON.
+
+    :param rows: rows from compare_runs() (List[dict])
+    :param file_path: output file (str).
+    """
+    if not file_path.endswith('.csv'):
+        write_dict_to_json({'runs': rows}, file_path)
+        return
+    columns = ['file'] + TABLE_COLUMNS + ['error']
+    with open(file_path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'wrote {len(rows)} runs to {file_path}')
 
 
 def main():
     """Perform main actions for the script."""
-    # Load JSON data
-    workflow_execution = read_json_to_dict('/tmp/wrench.json')
-    if not workflow_execution:
-        print("Failed to load JSON data")
-        exit(-1)
+    parser = argparse.ArgumentParser(description='Extract the time differences between job and task start times from a WRENCH JSON file.')
+    parser.add_argument('--input', type=str, default=DEFAULT_INPUT, help=f'WRENCH JSON file (default: {DEFAULT_INPUT}).')
+    parser.add_argument('--per-task', type=str, metavar='FILE', help='Write the per-task times and differences to FILE (.csv, or .npz for NumPy arrays).')
+    parser.add_argument('--summary', type=str, metavar='FILE', help='Write the summary statistics to FILE (JSON).')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=list(PERCENTILES),
+                        help=f'Percentiles of the differences (default: {" ".join(map(str, PERCENTILES))}).')
+    parser.add_argument('--bins', type=int, default=HISTOGRAM_BINS, help=f'Number of histogram bins (default: {HISTOGRAM_BINS}).')
+    parser.add_argument('--verbose', action='store_true', help='Print the times of every task.')
+    parser.add_argument('--batch', type=str, metavar='PATH',
+                        help='Compare many WRENCH runs: a directory of outputs named like flat_1000.json, or a JSON manifest.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes for --batch (default: number of CPUs).')
+    parser.add_argument('--table', type=str, metavar='FILE', help='Write the --batch comparison table to FILE (.csv or JSON).')
+    add_arguments(parser, 'extract_time_diffs')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'extract_time_diffs')
 
-    # Iterate through each task
-    try:
-        for task in workflow_execution['workflow_execution']['tasks']:
-            # Extract start times
-            compute_start = task['compute']['start']
-            whole_task_start = task['whole_task']['start']
+    if args.batch:
+        if args.per_task or args.verbose:
+            parser.error('--per-task and --verbose analyze a single run, not --batch')
+        try:
+            runs = find_runs(args.batch)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        with profiler.phase('transform'):
+            rows = compare_runs(runs, jobs=args.jobs)
+            profiler.count('runs', len(rows))
+            profiler.count('tasks', sum(row.get('tasks', 0) for row in rows))
+        print_table(rows)
+        with profiler.phase('write'):
+            if args.table:
+                write_table(rows, args.table)
+        profiler.finish()
+        return
+
+    # Load JSON data
+    with profiler.phase('load'):
+        try:
+            task_ids, columns = read_tasks(args.input)
+        except (OSError, JSONStreamError) as e:
+            print(f"Failed to load JSON data: {e}")
+            exit(-1)
+        except (KeyError, TypeError, ValueError) as e:
+            # missing field, or a null or non-numeric time
+            print(f"Failed to extract data from JSON file: {e}")
+            exit(-1)
+        profiler.count('tasks', len(task_ids))
 
-            # Calculate the difference
-            start_time_difference = compute_start - whole_task_start
+    with profiler.phase('transform'):
+        # Calculate the differences
+        columns['difference'] = columns['compute_start'] - columns['whole_task_start']
+        summary = summarize(columns['difference'], args.percentiles, args.bins)
 
-            # Print the result
-            print(f"Task ID: {task['task_id']}")
+    if args.verbose:
+        for task_id, compute_start, whole_task_start, difference in zip(
+                task_ids, columns['compute_start'].tolist(), columns['whole_task_start'].tolist(), columns['difference'].tolist()):
+            print(f"Task ID: {task_id}")
             print(f"Compute Start Time: {compute_start}")
             print(f"Whole Task Start Time: {whole_task_start}")
-            print(f"Difference: {start_time_difference}\n")
-    except KeyError as e:
-        print(f"Failed to extract data from JSON file: {e}")
-        exit(-1)
+            print(f"Difference: {difference}\n")
+    print_summary(summary)
+
+    with profiler.phase('write'):
+        if args.per_task:
+            write_per_task(args.per_task, task_ids, columns)
+        if args.summary:
+            write_dict_to_json(summary, args.summary)
+    profiler.finish()
 
 
 if __name__ == "__main__":
@@ -21,13 +21,54 @@
 """
 Generate platform XML for WRENCH simulations.
 
-Usage: python generate_xml.py --filename <filename> --nodes <number of nodes>
+Usage: python generate_xml.py --filename <filename> --nodes <number of nodes> [--backend stream|tree|fragments]
+                              [--topology flat|cluster|star]
+       python generate_xml.py --filename <filename> --nodes <start>:<stop>[:linear[:<step>]|:geometric[:<factor>]]
+                              [--jobs <n>] [--manifest <manifest>]
+       python generate_xml.py --filename <filename> --queues queues-corepower_based.json
+                              [--connections max_connections.json]
+
+The default 'stream' backend writes the platform incrementally to the output file,
+while the 'tree' backend builds the complete ElementTree first. Both backends produce
+byte for byte identical files. The 'fragments' backend renders the hosts and routes once, with a placeholder
+for the host number, and only fills in the numbers, which is again byte for byte identical.
+
+A sweep of node counts (e.g. --nodes 100:100000:geometric) generates the whole family of platforms in one
+process from the same fragments, writing several files at the same time, and records the generation time,
+size and host, link and route counts of every file in a manifest.
+
+The flat topology lists one route per connected host pair, so its size grows with the number of nodes.
+The cluster and star topologies describe the same network with a Cluster zone and a shared backbone,
+without any explicit routes.
+
+With --queues, the platform is built from measured data instead: one compute host per queue, one storage
+host per RSE and one link per RSE pair with a known bandwidth (max_connections.json). With --fill-missing,
+RSE pairs without a measured bandwidth are routed over the widest path of measured links.
 """
 
 import argparse
+import io
+import os
+import time
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
 from xml.dom import minidom
-from typing import Optional, Dict
+from typing import Optional, Dict, IO, Iterator, List, Sequence, Set, Tuple, Union
+
+from data_io import read_json_to_dict, write_dict_to_json
+from profiling import Profiler, add_arguments
+
+# topologies: 'flat' lists one explicit route per host pair (Full routing), 'cluster' attaches all hosts to a shared
+# backbone (Cluster routing, no explicit routes) and 'star' adds a private link per host in front of the backbone
+TOPOLOGIES = ('flat', 'cluster', 'star')
+NETWORK_BANDWIDTH = "50MBps"
+NETWORK_LATENCY = "1ms"
+PRIVATE_LINK_BANDWIDTH = "10GBps"
+PRIVATE_LINK_LATENCY = "0ms"
+
+XML_DECLARATION = "<?xml version='1.0'?>\n<!DOCTYPE platform SYSTEM \"https://simgrid.org/simgrid.dtd\">\n"
 
 
 def prettify(elem: ET.Element) -> str:
@@ -114,10 +155,13 @@ def add_route(zone: ET.Element, src: str, dst: str):
     zone.append(route)
 
 
-def generate_xml(filename: str, num_fields: int):
+def generate_xml_tree(filename: str, num_fields: int):
     """
     Generate a trivial XML file with a specified number of fields.
 
+    This is the reference backend; it builds the whole ElementTree in memory and
+    pretty prints it via minidom. Use generate_xml_stream() for large platforms.
+
     :param filename: file name to write the XML to (str)
     :param num_fields: number of fields to generate (int).
     """
@@ -280,26 +324,848 @@ def generate_xml(filename: str, num_fields: int):
     pretty_xml = prettify(platform)
 
     # Add the XML declaration and DOCTYPE
-    xml_declaration = "<?xml version='1.0'?>\n<!DOCTYPE platform SYSTEM \"https://simgrid.org/simgrid.dtd\">\n"
-    full_xml = xml_declaration + pretty_xml
+    full_xml = XML_DECLARATION + pretty_xml
 
     # Write the full XML to the output file
     with open(filename, 'w') as f:
         f.write(full_xml)
 
 
+def escape_attribute(value: str) -> str:
+    """
+    Escape an attribute value the same way as minidom does.
+
+    :param value: attribute value (str)
+    :return: escaped attribute value (str).
+    """
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+
+    return value
+
+
+class PlatformWriter:
+    """
+    Incremental writer for platform XML files.
+
+    Elements are written to the output stream as soon as they are added, so the memory usage does not
+    depend on the size of the platform. The layout (indentation, empty lines after closing host, zone
+    and link tags, XML declaration and DOCTYPE) is identical to the one produced by prettify().
+    """
+
+    # closing tags that are followed by an empty line
+    blank_after = ('host', 'zone', 'link')
+
+    def __init__(self, stream: IO[str], indent: str = "    "):
+        """
+        Initialize the writer and write the XML declaration.
+
+        :param stream: output stream (IO[str])
+        :param indent: indentation string (str).
+        """
+        self.stream = stream
+        self.indent = indent
+        self.tags = []
+        self.started = False
+        self.stream.write(XML_DECLARATION)
+
+    def _line(self, text: str, indent: bool = True):
+        """
+        Write a line to the output stream.
+
+        Lines are separated (not terminated) by newlines since the pretty-printed reference output
+        does not end with a newline.
+
+        :param text: line content (str)
+        :param indent: prefix the line with the current indentation (bool).
+        """
+        if self.started:
+            self.stream.write('\n')
+        else:
+            self.started = True
+        if indent:
+            self.stream.write(self.indent * len(self.tags))
+        self.stream.write(text)
+
+    @staticmethod
+    def _attributes(attrs: Dict[str, str]) -> str:
+        """
+        Format the attributes of an element.
+
+        :param attrs: attributes (Dict[str, str])
+        :return: formatted attributes, including a leading space if not empty (str).
+        """
+        return ''.join(f' {key}="{escape_attribute(value)}"' for key, value in attrs.items())
+
+    def comment(self, text: str):
+        """
+        Write a comment.
+
+        :param text: comment text (str).
+        """
+        self._line(f'<!--{text}-->')
+
+    def leaf(self, tag: str, attrs: Dict[str, str]):
+        """
+        Write an element without children.
+
+        :param tag: element tag (str)
+        :param attrs: element attributes (Dict[str, str]).
+        """
+        self._line(f'<{tag}{self._attributes(attrs)}/>')
+
+    def start(self, tag: str, attrs: Dict[str, str]):
+        """
+        Open an element with children.
+
+        :param tag: element tag (str)
+        :param attrs: element attributes (Dict[str, str]).
+        """
+        self._line(f'<{tag}{self._attributes(attrs)}>')
+        self.tags.append(tag)
+
+    def end(self):
+        """Close the most recently opened element."""
+        tag = self.tags.pop()
+        self._line(f'</{tag}>')
+        if tag in self.blank_after:
+            self._line('', indent=False)
+
+    def close(self):
+        """Close all open elements."""
+        while self.tags:
+            self.end()
+
+
+def write_host(
+        writer: PlatformWriter,
+        comment_text: str,
+        host_id: str,
+        speed: str,
+        core: str,
+        props: Optional[Dict[str, str]] = None,
+        disk: Optional[Dict[str, str]] = None,
+        disk_props: Optional[Dict[str, str]] = None
+):
+    """
+    Write a host element with an associated comment.
+
+    :param writer: platform writer (PlatformWriter)
+    :param comment_text: The text of the comment to add before the host (str)
+    :param host_id: The ID of the host (str)
+    :param speed: The speed of the host (str)
+    :param core: The number of cores of the host (str)
+    :param props: Additional properties for the host. Defaults to None (Optional[Dict[str, str]], optional)
+    :param disk: Attributes of the nested disk element. Defaults to None (Optional[Dict[str, str]], optional)
+    :param disk_props: Properties for the nested disk element. Defaults to None (Optional[Dict[str, str]], optional).
+    """
+    writer.comment(comment_text)
+    attrs = {"id": host_id, "speed": speed, "core": core}
+    if not props and not disk:
+        writer.leaf("host", attrs)
+        return
+
+    writer.start("host", attrs)
+    if props:
+        for prop_id, prop_value in props.items():
+            writer.leaf("prop", {"id": prop_id, "value": prop_value})
+    if disk:
+        if disk_props:
+            writer.start("disk", disk)
+            for prop_id, prop_value in disk_props.items():
+                writer.leaf("prop", {"id": prop_id, "value": prop_value})
+            writer.end()
+        else:
+            writer.leaf("disk", disk)
+    writer.end()
+
+
+def write_route(writer: PlatformWriter, src: str, dst: str, link_id: Union[str, Sequence[str]] = "network_link"):
+    """
+    Write a route element.
+
+    :param writer: platform writer (PlatformWriter)
+    :param src: The source of the route (str)
+    :param dst: The destination of the route (str)
+    :param link_id: The ID of the link used by the route, or the IDs of the links in route order (Union[str, Sequence[str]]).
+    """
+    writer.start("route", {"src": src, "dst": dst})
+    for link in [link_id] if isinstance(link_id, str) else link_id:
+        writer.leaf("link_ctn", {"id": link})
+    writer.end()
+
+
+def write_compute_host(writer: PlatformWriter, index: Union[int, str]):
+    """
+    Write a compute host.
+
+    :param writer: platform writer (PlatformWriter)
+    :param index: host number (Union[int, str]).
+    """
+    write_host(
+        writer,
+        " Another host on which the bare-metal compute service will be able to run jobs ",
+        f"ComputeHost{index}",
+        "35Gf",
+        "10",
+        props={"ram": "16GB"}
+    )
+
+
+def write_storage_host(writer: PlatformWriter, index: Union[int, str]):
+    """
+    Write a storage host.
+
+    :param writer: platform writer (PlatformWriter)
+    :param index: host number (Union[int, str]).
+    """
+    write_host(
+        writer,
+        " The host on which the first storage service will run ",
+        f"StorageHost{index}",
+        "10Gf",
+        "1",
+        disk={"id": "hard_drive", "read_bw": "100MBps", "write_bw": "100MBps"},
+        disk_props={"size": "5000GiB", "mount": "/"}
+    )
+
+
+def write_cloud_hosts(writer: PlatformWriter):
+    """
+    Write the cloud head and cloud hosts.
+
+    :param writer: platform writer (PlatformWriter).
+    """
+    disk = {"id": "hard_drive", "read_bw": "100MBps", "write_bw": "100MBps"}
+    write_host(
+        writer,
+        " The host on which the cloud compute service will run ",
+        "CloudHeadHost",
+        "10Gf",
+        "1",
+        disk=disk,
+        disk_props={"size": "5000GiB", "mount": "/scratch/"}
+    )
+    write_host(
+        writer,
+        " The host on which the cloud compute service will start VMs ",
+        "CloudHost",
+        "25Gf",
+        "8",
+        props={"ram": "16GB"}
+    )
+
+
+def write_hosts(writer: PlatformWriter, num_fields: int):
+    """
+    Write the controller, compute, storage and cloud hosts.
+
+    :param writer: platform writer (PlatformWriter)
+    :param num_fields: number of compute and storage hosts (int).
+    """
+    write_host(writer, " The host on which the Controller will run ", "UserHost", "10Gf", "1")
+    for i in range(1, num_fields + 1):
+        write_compute_host(writer, i)
+    for i in range(1, num_fields + 1):
+        write_storage_host(writer, i)
+    write_cloud_hosts(writer)
+
+
+def host_ids(num_fields: int) -> Iterator[str]:
+    """
+    Return the IDs of all hosts in the order they are written by write_hosts().
+
+    :param num_fields: number of compute and storage hosts (int)
+    :return: host IDs (Iterator[str]).
+    """
+    yield "UserHost"
+    for i in range(1, num_fields + 1):
+        yield f"ComputeHost{i}"
+    for i in range(1, num_fields + 1):
+        yield f"StorageHost{i}"
+    yield "CloudHeadHost"
+    yield "CloudHost"
+
+
+def write_shared_link(writer: PlatformWriter):
+    """
+    Write the network link shared by all routes of the flat topology.
+
+    :param writer: platform writer (PlatformWriter).
+    """
+    writer.comment(" A network link shared by EVERY ONE ")
+    writer.leaf("link", {"id": "network_link", "bandwidth": NETWORK_BANDWIDTH, "latency": NETWORK_LATENCY})
+    writer.comment(" The same network link connects all hosts together ")
+
+
+def write_flat_network(writer: PlatformWriter, num_fields: int):
+    """
+    Write the shared network link and one explicit route per connected host pair (Full routing).
+
+    :param writer: platform writer (PlatformWriter)
+    :param num_fields: number of compute and storage hosts (int).
+    """
+    write_shared_link(writer)
+    for i in range(1, num_fields + 1):
+        write_route(writer, "UserHost", f"ComputeHost{i}")
+    for i in range(1, num_fields + 1):
+        write_route(writer, "UserHost", f"StorageHost{i}")
+    write_route(writer, "UserHost", "CloudHeadHost")
+    for i in range(1, num_fields + 1):
+        write_route(writer, f"ComputeHost{i}", f"StorageHost{i}")
+    write_route(writer, "CloudHeadHost", "CloudHost")
+    for i in range(1, num_fields + 1):
+        write_route(writer, f"StorageHost{i}", "CloudHost")
+
+
+def write_cluster_network(writer: PlatformWriter):
+    """
+    Write the shared network link as the backbone of a Cluster zone.
+
+    In a Cluster zone without private links the route between any two hosts consists of the backbone only,
+    which is exactly the route used for every host pair in the flat layout. No explicit routes are needed.
+
+    :param writer: platform writer (PlatformWriter).
+    """
+    writer.comment(" A network link shared by EVERY ONE ")
+    writer.leaf("backbone", {"id": "network_link", "bandwidth": NETWORK_BANDWIDTH, "latency": NETWORK_LATENCY})
+
+
+def write_star_network(writer: PlatformWriter, num_fields: int):
+    """
+    Write a star network: one private link per host, all attached to the shared backbone.
+
+    The route between two hosts is <private link of src, backbone, private link of dst>. The private links
+    are fast enough to never be the bottleneck, so the shared backbone limits the traffic as in the flat layout,
+    while per-host contention can be studied by lowering PRIVATE_LINK_BANDWIDTH.
+
+    :param writer: platform writer (PlatformWriter)
+    :param num_fields: number of compute and storage hosts (int).
+    """
+    writer.comment(" One private link per host, connecting it to the backbone ")
+    for host_id in host_ids(num_fields):
+        link_id = f"{host_id}_link"
+        writer.leaf("link", {"id": link_id, "bandwidth": PRIVATE_LINK_BANDWIDTH, "latency": PRIVATE_LINK_LATENCY})
+        writer.leaf("host_link", {"id": host_id, "up": link_id, "down": link_id})
+    write_cluster_network(writer)
+
+
+def generate_xml_stream(filename: str, num_fields: int, topology: str = "flat"):
+    """
+    Generate a trivial XML file with a specified number of fields.
+
+    The platform is written incrementally, so the memory usage is independent of the number of fields.
+    For the flat topology, the output is identical to the one from generate_xml_tree().
+
+    :param filename: file name to write the XML to (str)
+    :param num_fields: number of fields to generate (int)
+    :param topology: network topology, one of TOPOLOGIES (str)
+    :raises ValueError: for an unknown topology.
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f'unknown topology: {topology}')
+
+    with open(filename, 'w') as f:
+        writer = PlatformWriter(f)
+        writer.start("platform", {"version": "4.1"})
+        writer.start("zone", {"id": "AS0", "routing": "Full" if topology == "flat" else "Cluster"})
+
+        write_hosts(writer, num_fields)
+        if topology == "flat":
+            write_flat_network(writer, num_fields)
+        elif topology == "cluster":
+            write_cluster_network(writer)
+        else:
+            write_star_network(writer, num_fields)
+
+        writer.close()
+
+
+def generate_xml(filename: str, num_fields: int, backend: str = "stream", topology: str = "flat"):
+    """
+    Generate a trivial XML file with a specified number of fields.
+
+    :param filename: file name to write the XML to (str)
+    :param num_fields: number of fields to generate (int)
+    :param backend: 'stream' for the incremental writer, 'tree' for the ElementTree reference (str)
+    :param topology: network topology, one of TOPOLOGIES (str)
+    :raises ValueError: for an unknown backend, or a topology not supported by the backend.
+    """
+    if backend == "stream":
+        generate_xml_stream(filename, num_fields, topology=topology)
+    elif backend == "tree":
+        if topology != "flat":
+            raise ValueError(f'the tree backend only supports the flat topology, not {topology}')
+        generate_xml_tree(filename, num_fields)
+    else:
+        raise ValueError(f'unknown backend: {backend}')
+
+
+# placeholder for the host number (or host ID) in the platform fragments
+MARK = "\x00"
+SWEEP_MODES = ('linear', 'geometric')
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+@lru_cache(maxsize=None)
+def platform_fragments(topology: str) -> Dict[str, Tuple[str, ...]]:
+    """
+    Render the pieces of a --nodes platform once, with a placeholder for the host number.
+
+    The pieces are written by the same functions as generate_xml_stream(), so joining them gives a byte for byte
+    identical file; only the host numbers (or host IDs for the star links) are filled in per platform.
+
+    :param topology: network topology, one of TOPOLOGIES (str)
+    :return: { piece name: text split at the placeholders } (Dict[str, Tuple[str, ...]]).
+    """
+    buffer = io.StringIO()
+    writer = PlatformWriter(buffer)
+    fragments = {}
+
+    def take(name: str):
+        fragments[name] = tuple(buffer.getvalue().split(MARK))
+        buffer.seek(0)
+        buffer.truncate()
+
+    writer.start("platform", {"version": "4.1"})
+    writer.start("zone", {"id": "AS0", "routing": "Full" if topology == "flat" else "Cluster"})
+    write_host(writer, " The host on which the Controller will run ", "UserHost", "10Gf", "1")
+    take('head')
+    write_compute_host(writer, MARK)
+    take('compute_host')
+    write_storage_host(writer, MARK)
+    take('storage_host')
+    write_cloud_hosts(writer)
+    take('cloud_hosts')
+    if topology == "flat":
+        write_shared_link(writer)
+        take('network')
+        for name, src, dst in (('user_compute', "UserHost", f"ComputeHost{MARK}"), ('user_storage', "UserHost", f"StorageHost{MARK}"),
+                               ('compute_storage', f"ComputeHost{MARK}", f"StorageHost{MARK}"),
+                               ('storage_cloud', f"StorageHost{MARK}", "CloudHost")):
+            write_route(writer, src, dst)
+            take(name)
+        write_route(writer, "UserHost", "CloudHeadHost")
+        take('user_cloud')
+        write_route(writer, "CloudHeadHost", "CloudHost")
+        take('cloud_cloud')
+    elif topology == "star":
+        writer.comment(" One private link per host, connecting it to the backbone ")
+        take('network')
+        writer.leaf("link", {"id": f"{MARK}_link", "bandwidth": PRIVATE_LINK_BANDWIDTH, "latency": PRIVATE_LINK_LATENCY})
+        writer.leaf("host_link", {"id": MARK, "up": f"{MARK}_link", "down": f"{MARK}_link"})
+        take('host_link')
+        write_cluster_network(writer)
+        take('backbone')
+    else:
+        write_cluster_network(writer)
+        take('network')
+    writer.close()
+    take('tail')
+
+    return fragments
+
+
+def platform_pieces(num_fields: int, topology: str) -> Iterator[str]:
+    """
+    Yield the text of a --nodes platform from the cached fragments.
+
+    :param num_fields: number of compute and storage hosts (int)
+    :param topology: network topology, one of TOPOLOGIES (str)
+    :return: pieces of the file, in order (Iterator[str]).
+    """
+    fragments = platform_fragments(topology)
+    numbers = [str(i) for i in range(1, num_fields + 1)]
+    # the head starts with the XML declaration
+    yield from fragments['head']
+    for name in ('compute_host', 'storage_host'):
+        parts = fragments[name]
+        for number in numbers:
+            yield number.join(parts)
+    yield from fragments['cloud_hosts']
+    yield from fragments['network']
+    if topology == "flat":
+        # the routes in the order of write_flat_network()
+        for name in ('user_compute', 'user_storage', 'user_cloud', 'compute_storage', 'cloud_cloud', 'storage_cloud'):
+            parts = fragments[name]
+            if len(parts) == 1:
+                yield parts[0]
+            else:
+                for number in numbers:
+                    yield number.join(parts)
+    elif topology == "star":
+        parts = fragments['host_link']
+        for host_id in host_ids(num_fields):
+            yield host_id.join(parts)
+        yield from fragments['backbone']
+    yield from fragments['tail']
+
+
+def generate_xml_fragments(filename: str, num_fields: int, topology: str = "flat"):
+    """
+    Generate a --nodes platform from the cached fragments, identical to the output of generate_xml_stream().
+
+    :param filename: file name to write the XML to (str)
+    :param num_fields: number of fields to generate (int)
+    :param topology: network topology, one of TOPOLOGIES (str)
+    :raises ValueError: for an unknown topology.
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f'unknown topology: {topology}')
+
+    with open(filename, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        f.writelines(platform_pieces(num_fields, topology))
+
+
+def platform_counts(num_fields: int, topology: str) -> Dict[str, int]:
+    """
+    Return the number of hosts, links and routes of a --nodes platform.
+
+    :param num_fields: number of compute and storage hosts (int)
+    :param topology: network topology, one of TOPOLOGIES (str)
+    :return: { 'hosts', 'links', 'routes' } (Dict[str, int]).
+    """
+    hosts = 2 * num_fields + 3
+    if topology == "flat":
+        return {'hosts': hosts, 'links': 1, 'routes': 4 * num_fields + 2}
+    if topology == "star":
+        return {'hosts': hosts, 'links': hosts + 1, 'routes': 0}
+
+    return {'hosts': hosts, 'links': 1, 'routes': 0}
+
+
+def parse_nodes(text: str) -> List[int]:
+    """
+    Parse a number of nodes or a sweep of numbers of nodes.
+
+    START:STOP[:linear[:STEP]] gives START, START + STEP, .. up to STOP (STEP defaults to START), START:STOP:STEP
+    is the same, and START:STOP:geometric[:FACTOR] gives START, START * FACTOR, .. (FACTOR defaults to 2). STOP is
+    always included.
+
+    :param text: N or START:STOP[:MODE[:STEP or FACTOR]] (str)
+    :raises ValueError: for malformed sweeps
+    :return: numbers of nodes, in increasing order (List[int]).
+    """
+    parts = text.split(':')
+    if len(parts) == 1:
+        return [int(text)]
+    if len(parts) > 4:
+        raise ValueError(f'expected START:STOP[:MODE[:STEP]], got {text}')
+    start, stop = int(parts[0]), int(parts[1])
+    mode = parts[2] if len(parts) > 2 else 'linear'
+    if mode.isdigit():
+        mode, parts = 'linear', parts[:2] + ['linear', mode]
+    if mode not in SWEEP_MODES:
+        raise ValueError(f'unknown sweep mode {mode} (known: {", ".join(SWEEP_MODES)})')
+    if not 1 <= start <= stop:
+        raise ValueError(f'expected 1 <= START <= STOP, got {text}')
+
+    values = []
+    if mode == 'geometric':
+        factor = float(parts[3]) if len(parts) > 3 else 2.0
+        if factor <= 1:
+            raise ValueError(f'the geometric factor must be larger than 1, got {factor}')
+        value = float(start)
+        while round(value) < stop:
+            if not values or round(value) > values[-1]:
+                values.append(round(value))
+            value *= factor
+    else:
+        step = int(parts[3]) if len(parts) > 3 else start
+        if step < 1:
+            raise ValueError(f'the step must be positive, got {step}')
+        values = list(range(start, stop, step))
+    values.append(stop)
+
+    return values
+
+
+def sweep_filename(filename: str, num_fields: int) -> str:
+    """
+    Return the file name of one platform of a sweep.
+
+    :param filename: file name, with {nodes} for the number of nodes, or else _N is added before the extension (str)
+    :param num_fields: number of nodes (int)
+    :return: file name (str).
+    """
+    if '{nodes}' in filename:
+        return filename.format(nodes=num_fields)
+    root, extension = os.path.splitext(filename)
+
+    return f'{root}_{num_fields}{extension}'
+
+
+def manifest_filename(filename: str) -> str:
+    """
+    Return the default manifest file name of a sweep.
+
+    :param filename: file name pattern, see sweep_filename() (str)
+    :return: e.g. platform_manifest.json for platform.xml (str).
+    """
+    directory, name = os.path.split(os.path.splitext(filename)[0].replace('{nodes}', ''))
+
+    return os.path.join(directory, f"{name.strip('_-') or 'platforms'}_manifest.json")
+
+
+def generate_sweep(filename: str, nodes: List[int], backend: str = "fragments", topology: str = "flat", jobs: int = 1) -> List[dict]:
+    """
+    Generate a family of --nodes platforms in one process, writing up to `jobs` files concurrently.
+
+    The file generation time is measured per file, so with several jobs it includes the time shared with the
+    other files.
+
+    :param filename: file name pattern, see sweep_filename() (str)
+    :param nodes: numbers of nodes (List[int])
+    :param backend: 'fragments', 'stream' or 'tree' (str)
+    :param topology: network topology, one of TOPOLOGIES (str)
+    :param jobs: number of files written at the same time (int)
+    :return: manifest entries: { 'file', 'nodes', 'topology', 'backend', 'seconds', 'bytes', 'hosts', 'links', 'routes' } (List[dict]).
+    """
+    def generate_one(num_fields: int) -> dict:
+        file_path = sweep_filename(filename, num_fields)
+        start = time.perf_counter()
+        if backend == "fragments":
+            generate_xml_fragments(file_path, num_fields, topology=topology)
+        else:
+            generate_xml(file_path, num_fields, backend=backend, topology=topology)
+        seconds = time.perf_counter() - start
+        entry = {'file': file_path, 'nodes': num_fields, 'topology': topology, 'backend': backend,
+                 'seconds': seconds, 'bytes': os.path.getsize(file_path)}
+        entry.update(platform_counts(num_fields, topology))
+        print(f'wrote {file_path} ({num_fields} nodes, {entry["bytes"]} bytes) in {seconds:.3f} s')
+        return entry
+
+    if backend == "fragments":
+        # render the fragments before the threads need them
+        platform_fragments(topology)
+    # the largest files first, so they do not end up last on one thread
+    order = sorted(dict.fromkeys(nodes), reverse=True)
+    if jobs > 1 and len(order) > 1:
+        with ThreadPoolExecutor(max_workers=min(jobs, len(order))) as executor:
+            entries = list(executor.map(generate_one, order))
+    else:
+        entries = [generate_one(num_fields) for num_fields in order]
+
+    return sorted(entries, key=lambda entry: entry['nodes'])
+
+
+def get_rses(info: dict) -> List[str]:
+    """
+    Return the RSE(s) of a queue as a list.
+
+    :param info: queue info from queues-corepower_based.json (dict)
+    :return: RSE names (List[str]).
+    """
+    rses = info.get("RSE")
+    if not rses:
+        return []
+    if isinstance(rses, str):
+        return [rses]
+
+    return list(dict.fromkeys(rses))
+
+
+def format_bandwidth(mbps: float) -> str:
+    """
+    Convert a bandwidth in Mbit/s, as stored in max_connections.json, to a SimGrid bandwidth string.
+
+    :param mbps: bandwidth in Mbit/s (float)
+    :return: bandwidth string (str).
+    """
+    return f"{mbps:.6g}Mbps"
+
+
+def build_link_index(connections: Dict[str, float], storage_hosts: Set[str],
+                     fill_missing: bool = False) -> Dict[str, Dict[str, Tuple[float, List[str]]]]:
+    """
+    Index the measured site pair bandwidths by site.
+
+    Only pairs where both sites are storage hosts of the platform are kept. The index is symmetric, ie
+    index[a][b] and index[b][a] both refer to the link of the measured pair A:B. With fill_missing, the pairs
+    without a measured connection are added with the links of their widest path (see widest_path.py).
+
+    :param connections: bandwidths per "A:B" connection, from max_connections.json (Dict[str, float])
+    :param storage_hosts: names of the storage hosts (Set[str])
+    :param fill_missing: add widest paths for the pairs without a measured connection (bool)
+    :return: {site: {other site: (bandwidth, link IDs from site to other site)}} (Dict[str, Dict[str, Tuple[float, List[str]]]]).
+    """
+    index = {}
+    measured = {}
+    for connection, bandwidth in connections.items():
+        site1, _, site2 = connection.partition(':')
+        if site1 not in storage_hosts or site2 not in storage_hosts or site1 == site2 or not bandwidth:
+            continue
+        measured[connection] = bandwidth
+        index.setdefault(site1, {})[site2] = (bandwidth, [connection])
+        index.setdefault(site2, {})[site1] = (bandwidth, [connection])
+    if not fill_missing:
+        return index
+
+    from widest_path import WidestPaths  # requires numpy
+    paths = WidestPaths(measured)
+    for i, site1 in enumerate(paths.sites):
+        for site2 in paths.sites[i + 1:]:
+            if site2 in index.get(site1, {}):
+                continue
+            bandwidth = paths.bandwidth(site1, site2)
+            if bandwidth:
+                links = paths.path(site1, site2)
+                index.setdefault(site1, {})[site2] = (bandwidth, links)
+                index.setdefault(site2, {})[site1] = (bandwidth, links[::-1])
+
+    return index
+
+
+def queue_cores(info: dict) -> int:
+    """
+    Return the number of cores of a queue.
+
+    :param info: queue info, with the number of cores (or CPUs) in 'cores' if known (dict)
+    :return: number of cores, 1 if unknown (int).
+    """
+    cores = info.get("cores")
+    if isinstance(cores, bool) or not isinstance(cores, (int, float)) or not cores >= 1:
+        return 1
+
+    return int(round(cores))
+
+
+def generate_xml_from_data(filename: str, queues: dict, connections: Dict[str, float], fill_missing: bool = False):
+    """
+    Generate a platform XML file from measured queue and connection data.
+
+    One compute host is created per queue, with the number of cores of the queue (1 if unknown) and its GFLOPS
+    divided among them (SimGrid host speeds are per core), one storage host per RSE and one link per measured
+    RSE pair. Compute hosts reach their own RSEs and the controller reaches every host over
+    the shared network link, while storage hosts (and the compute hosts using them) reach remote RSEs over
+    the dedicated link of the measured pair. With fill_missing, RSE pairs without a measured connection are
+    routed over the widest path of measured links instead of not being connected at all.
+
+    :param filename: file name to write the XML to (str)
+    :param queues: queue info from queues-corepower_based.json (dict)
+    :param connections: bandwidths per "A:B" connection from max_connections.json (Dict[str, float])
+    :param fill_missing: synthesize routes for RSE pairs without a measured connection (bool).
+    """
+    queue_rses = {queue: get_rses(info) for queue, info in queues.items() if info.get("GFLOPS")}
+    storage_hosts = list(dict.fromkeys(rse for rses in queue_rses.values() for rse in rses))
+    link_index = build_link_index(connections, set(storage_hosts), fill_missing=fill_missing)
+    used_links = {link for others in link_index.values() for _, links in others.values() for link in links}
+    disk = {"id": "hard_drive", "read_bw": "100MBps", "write_bw": "100MBps"}
+
+    with open(filename, 'w') as f:
+        writer = PlatformWriter(f)
+        writer.start("platform", {"version": "4.1"})
+        writer.start("zone", {"id": "AS0", "routing": "Full"})
+
+        write_host(writer, " The host on which the Controller will run ", "UserHost", "10Gf", "1")
+        for queue in queue_rses:
+            gflops = queues[queue]['GFLOPS']
+            cores = queue_cores(queues[queue])
+            speed = f"{gflops}Gf" if cores == 1 else f"{gflops / cores:.10g}Gf"
+            write_host(writer, f" Compute host for queue {queue} ", queue, speed, str(cores), props={"ram": "16GB"})
+        for rse in storage_hosts:
+            write_host(writer, f" Storage host for RSE {rse} ", rse, "10Gf", "1",
+                       disk=disk, disk_props={"size": "5000GiB", "mount": "/"})
+
+        writer.comment(" A network link shared by EVERY ONE without a measured connection ")
+        writer.leaf("link", {"id": "network_link", "bandwidth": NETWORK_BANDWIDTH, "latency": NETWORK_LATENCY})
+        writer.comment(" Measured connections between RSEs ")
+        for connection, bandwidth in connections.items():
+            if connection in used_links:
+                writer.leaf("link", {"id": connection, "bandwidth": format_bandwidth(bandwidth), "latency": NETWORK_LATENCY})
+
+        for host in chain(queue_rses, storage_hosts):
+            write_route(writer, "UserHost", host)
+        for queue, rses in queue_rses.items():
+            # local RSEs over the shared link, remote RSEs over the fastest route from any local RSE
+            remote = {}
+            for rse in rses:
+                write_route(writer, queue, rse)
+                for other, (bandwidth, links) in link_index.get(rse, {}).items():
+                    if other not in rses and bandwidth > remote.get(other, (0, []))[0]:
+                        remote[other] = (bandwidth, links)
+            for other, (_, links) in remote.items():
+                write_route(writer, queue, other, links)
+        for rse in storage_hosts:
+            for other, (_, links) in link_index.get(rse, {}).items():
+                # routes are symmetrical, so one direction per pair is enough
+                if rse < other:
+                    write_route(writer, rse, other, links)
+
+        writer.close()
+
+
 def main():
     """Perform main actions for the script."""
     # Set up argument parsing
     parser = argparse.ArgumentParser(description='Generate a trivial XML file.')
     parser.add_argument('--filename', type=str, required=True, help='The name of the output XML file.')
-    parser.add_argument('--nodes', type=int, required=True, help='The number of fields in the XML file.')
+    parser.add_argument('--nodes', type=str,
+                        help='The number of fields in the XML file, or a sweep START:STOP[:linear[:STEP]|:geometric[:FACTOR]], '
+                             'e.g. 100:100000:geometric, written to one file per number of nodes (FILENAME_N.xml, or {nodes} in FILENAME).')
+    parser.add_argument('--backend', choices=['stream', 'tree', 'fragments'],
+                        help='Write the file incrementally (stream, default for one file), via an in-memory ElementTree (tree) or '
+                             'from pre-rendered host and route fragments (fragments, default for a sweep).')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Files written at the same time in a sweep (default: number of CPUs).')
+    parser.add_argument('--manifest', type=str,
+                        help='Manifest of a sweep with the generation time, size and host/route counts per file (default: FILENAME_manifest.json).')
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='flat',
+                        help='Explicit routes (flat), a shared backbone (cluster) or private links to a backbone (star).')
+    parser.add_argument('--queues', type=str,
+                        help='Generate one host per queue and RSE from this file (e.g. queues-corepower_based.json).')
+    parser.add_argument('--connections', type=str, default='max_connections.json',
+                        help='Measured bandwidths per RSE pair, used with --queues (default: max_connections.json).')
+    parser.add_argument('--fill-missing', action='store_true',
+                        help='With --queues, route RSE pairs without a measured connection over their widest path.')
+    add_arguments(parser, 'generate_xml')
 
     # Parse the arguments
     args = parser.parse_args()
+    if args.backend == 'tree' and args.topology != 'flat':
+        parser.error('the tree backend only supports the flat topology')
+    if args.queues and (args.backend not in (None, 'stream') or args.topology != 'flat'):
+        parser.error('--queues is only supported by the stream backend with the flat topology')
+    if not args.queues and args.nodes is None:
+        parser.error('either --nodes or --queues is required')
+    try:
+        nodes = parse_nodes(args.nodes) if args.nodes is not None else []
+    except ValueError as exc:
+        parser.error(str(exc))
+    sweep = args.nodes is not None and ':' in args.nodes
+    backend = args.backend or ('fragments' if sweep else 'stream')
+    profiler = Profiler.from_args(args, 'generate_xml')
 
-    # Generate the XML file
-    generate_xml(args.filename, args.nodes)
+    if args.queues:
+        with profiler.phase('load'):
+            queues = read_json_to_dict(args.queues)
+            connections = read_json_to_dict(args.connections)
+            profiler.count('queues', len(queues))
+            profiler.count('connections', len(connections))
+        with profiler.phase('write'):
+            generate_xml_from_data(args.filename, queues, connections, fill_missing=args.fill_missing)
+    elif sweep:
+        with profiler.phase('write'):
+            entries = generate_sweep(args.filename, nodes, backend=backend, topology=args.topology, jobs=args.jobs)
+            profiler.count('files', len(entries))
+            profiler.count('hosts', sum(entry['hosts'] for entry in entries))
+            profiler.count('bytes', sum(entry['bytes'] for entry in entries))
+            manifest = args.manifest or manifest_filename(args.filename)
+            write_dict_to_json({'platforms': entries}, manifest)
+    else:
+        # Generate the XML file
+        with profiler.phase('write'):
+            if backend == 'fragments':
+                generate_xml_fragments(args.filename, nodes[0], topology=args.topology)
+            else:
+                generate_xml(args.filename, nodes[0], backend=backend, topology=args.topology)
+            profiler.count('hosts', platform_counts(nodes[0], args.topology)['hosts'])
+    profiler.finish()
 
 
 if __name__ == "__main__":
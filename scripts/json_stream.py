@@ -0,0 +1,209 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Incremental reader for large JSON files.
+
+iter_items() walks the members of one object (or the elements of one array) in a JSON document and
+decodes them one at a time, so only the current member is kept in memory instead of the whole document.
+The file is read in chunks and each member is decoded with the stdlib json decoder, so the decoded
+values are identical to the ones from json.load().
+
+Example: for connection, info in iter_items('latest.json'): ...
+         for _, task in iter_items('wrench.json', prefix=('workflow_execution', 'tasks')): ...
+"""
+
+import json
+from typing import Any, IO, Iterator, Sequence, Tuple, Union
+
+from data_io import open_text
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = '0123456789+-.eE'
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+
+class JSONStreamError(ValueError):
+    """Raised for malformed or unexpected JSON input."""
+
+
+class _Scanner:
+    """Tokenizer over a text stream that keeps only the not yet consumed part of the input in memory."""
+
+    def __init__(self, stream: IO[str], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Initialize the scanner.
+
+        :param stream: input stream (IO[str])
+        :param chunk_size: minimum read size in characters (int).
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0  # position of buf[0] in the stream
+        self.eof = False
+
+    def fill(self) -> bool:
+        """
+        Read more data into the buffer and drop the consumed part.
+
+        The read size grows with the pending data, so decoding a large value costs linear time overall.
+
+        :return: False at end of file (bool).
+        """
+        if self.eof:
+            return False
+        pending = len(self.buf) - self.pos
+        chunk = self.stream.read(max(self.chunk_size, pending))
+        if not chunk:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+        return True
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and return the next character without consuming it.
+
+        :return: next character, or '' at end of file (str).
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        """
+        Consume the next character, which must be one of chars.
+
+        :param chars: allowed characters (str)
+        :return: consumed character (str)
+        :raises JSONStreamError: for any other character.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            found = repr(char) if char else 'end of file'
+            raise JSONStreamError(f'expected one of {chars!r} at offset {self.offset + self.pos}, found {found}')
+        self.pos += 1
+
+        return char
+
+    def value(self) -> Any:
+        """
+        Decode and consume the next JSON value.
+
+        :return: decoded value (Any)
+        :raises JSONStreamError: for malformed input.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as exc:
+                if self.fill():
+                    continue
+                raise JSONStreamError(f'{exc.msg} at offset {self.offset + exc.pos}') from exc
+            # a number at the end of the buffer may continue in the next chunk, possibly after an
+            # incomplete fraction or exponent ('1.', '1e', '1e-') that the decoder stopped in front of
+            if len(self.buf) - end <= 2 and not self.buf[end:].strip(NUMBER_CHARS) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def object_keys(self) -> Iterator[str]:
+        """
+        Iterate over the keys of an object whose '{' has been consumed.
+
+        The caller must consume the value of each key (with value() or by descending into it) before
+        asking for the next key.
+
+        :return: keys (Iterator[str]).
+        """
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise JSONStreamError(f'expected a string key at offset {self.offset + self.pos}')
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def array_indices(self) -> Iterator[int]:
+        """
+        Iterate over the element indices of an array whose '[' has been consumed.
+
+        The caller must consume each element before asking for the next index.
+
+        :return: indices (Iterator[int]).
+        """
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            if self.expect(',]') == ']':
+                return
+            index += 1
+
+
+def iter_items(file_path: str, prefix: Sequence[str] = (), chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[Union[str, int], Any]]:
+    """
+    Yield the members of the object, or the elements of the array, at the given key path.
+
+    Members outside of the key path are decoded one at a time and discarded. Note that duplicate keys are
+    all yielded, while json.load() would only keep the last value.
+
+    :param file_path: path to the JSON file, optionally gzip or zstd compressed (str)
+    :param prefix: keys leading from the top-level object to the container to iterate over (Sequence[str])
+    :param chunk_size: read size in characters (int)
+    :return: (key, value) for an object, (index, value) for an array (Iterator[Tuple[Union[str, int], Any]])
+    :raises KeyError: if a key of the prefix is not found
+    :raises JSONStreamError: for malformed input, or if the prefix leads to a scalar.
+    """
+    with open_text(file_path) as stream:
+        scanner = _Scanner(stream, chunk_size)
+        for name in prefix:
+            scanner.expect('{')
+            for key in scanner.object_keys():
+                if key == name:
+                    break
+                scanner.value()
+            else:
+                raise KeyError(name)
+
+        if scanner.expect('{[') == '{':
+            for key in scanner.object_keys():
+                yield key, scanner.value()
+        else:
+            for index in scanner.array_indices():
+                yield index, scanner.value()
@@ -21,10 +21,34 @@
 """
 Convert csv data from Grafana to JSON.
 Create number of CPUs file.
+
+The CSV file is reduced row by row (or in NumPy chunks of rows with --method numpy) to the maximum value of each
+column, so the memory usage does not depend on the number of rows. --method dict uses the original
+read_csv_to_dict() and find_max_values(), which keep the whole table in memory.
+
+A single maximum over six months overstates the capacity that a queue can sustain. With --stats, the time series
+are also reduced to rolling-window statistics per queue (sustained maximum over N hours, a percentile and the
+time-weighted mean), which combine.py can use as its number of CPUs.
 """
 
+import argparse
 import csv
-import json
+import datetime
+import itertools
+import warnings
+from typing import Any, Iterable, List, Optional, Tuple
+
+from data_io import write_dict_to_json
+from profiling import Profiler, add_arguments
+
+TIME_COLUMN = 'Time'
+CHUNK_ROWS = 1024
+WINDOW_HOURS = 24
+PERCENTILE = 95
+# queues per block of slot_statistics()
+COLUMN_BLOCK = 256
+# str.translate() table that deletes digits and separators
+INTEGER_CHARS = str.maketrans('', '', '0123456789,')
 
 
 def read_csv_to_dict(file_path: str) -> dict:
@@ -69,32 +93,405 @@ def find_max_values(data_dict: dict) -> dict:
     return max_values
 
 
-def write_dict_to_json(data_dict: dict, file_path: str):
+def parse_lines(lines: List[str], width: int) -> Optional[Tuple[List[str], Any]]:
     """
-    Write a dictionary to a JSON file.
+    Parse a chunk of CSV lines with NumPy.
 
-    :param data_dict: data dictionary (dict)
-    :param file_path: path to the JSON file (str)
+    This fast path requires the time stamp in the first column and only integers (or empty cells) in the
+    others. Lines without a time stamp are skipped and empty cells become -1, which is below any value.
+
+    :param lines: CSV lines (List[str])
+    :param width: number of columns, including the time stamp (int)
+    :return: time stamps and values, shape (rows, width - 1), or None if the chunk needs the csv module (Optional[Tuple[List[str], np.ndarray]]).
+    """
+    import numpy as np
+
+    stamps = []
+    cells = []
+    for line in lines:
+        stamp, _, rest = line.partition(',')
+        if stamp and stamp != '""':
+            stamps.append(stamp.strip('"'))
+            cells.append(rest.rstrip('\r\n'))
+    if not cells:
+        return stamps, np.empty((0, width - 1), dtype=np.int64)
+    text = ','.join(cells).replace('""', '')
+    if text.translate(INTEGER_CHARS):
+        return None
+    text = text.replace(',,', ',-1,').replace(',,', ',-1,')
+    text = ('-1' if text.startswith(',') else '') + text + ('-1' if text.endswith(',') else '')
+    values = np.fromstring(text, dtype=np.int64, sep=',')
+    if values.size != len(cells) * (width - 1):
+        return None
+
+    return stamps, values.reshape(len(cells), -1)
+
+
+class ColumnMaxima:
+    """Running maxima of the numeric columns of a Grafana CSV export."""
+
+    def __init__(self, header: List[str]):
+        """
+        Initialize the maxima from the header row.
+
+        :param header: column names; a BOM and quotes around the names are removed (List[str]).
+        """
+        self.names = [name.lstrip('\ufeff').strip().strip('"') for name in header]
+        self.time_index = self.names.index(TIME_COLUMN) if TIME_COLUMN in self.names else None
+        self.maxima: List[Optional[int]] = [None] * len(self.names)
+        self.order = []
+        self.rows = 0
+
+    def _update(self, index: int, value: int):
+        """
+        Update the maximum of a column.
+
+        :param index: column index (int)
+        :param value: value (int).
+        """
+        current = self.maxima[index]
+        if current is None:
+            self.order.append(index)
+            self.maxima[index] = value
+        elif value > current:
+            self.maxima[index] = value
+
+    def update_rows(self, rows: Iterable[List[str]]):
+        """
+        Add rows, one at a time.
+
+        Rows without a time stamp and values that are not non-negative integers (e.g. empty bins) are skipped,
+        as in read_csv_to_dict().
+
+        :param rows: CSV rows (Iterable[List[str]]).
+        """
+        time_index = self.time_index
+        maxima = self.maxima
+        width = len(self.names)
+        for row in rows:
+            if time_index is None or time_index >= len(row) or not row[time_index]:
+                continue
+            self.rows += 1
+            for index, value in enumerate(row[:width]):
+                if index != time_index and value.isdigit():
+                    value = int(value)
+                    current = maxima[index]
+                    if current is None or value > current:
+                        if current is None:
+                            self.order.append(index)
+                        maxima[index] = value
+
+    def update_lines(self, lines: List[str]):
+        """
+        Add a chunk of CSV lines with NumPy, one vectorized maximum per column.
+
+        Chunks that parse_lines() cannot handle are parsed with the csv module and added row by row.
+
+        :param lines: CSV lines (List[str]).
+        """
+        import numpy as np
+
+        parsed = parse_lines(lines, len(self.names)) if self.time_index == 0 else None
+        if parsed is None:
+            self.update_rows(csv.reader(lines))
+            return
+
+        stamps, values = parsed
+        if not stamps:
+            return
+        self.rows += len(stamps)
+        chunk_maxima = values.max(axis=0)
+        present = np.flatnonzero(chunk_maxima >= 0)
+        # columns in the order of their first value, like the row by row reduction
+        first = (values >= 0).argmax(axis=0)
+        for position in sorted(present.tolist(), key=lambda position: (first[position], position)):
+            self._update(position + 1, int(chunk_maxima[position]))
+
+    def result(self) -> dict:
+        """
+        Return the maximum of each column with at least one numeric value.
+
+        :return: { column name: maximum }, in the order in which the columns got their first value (dict).
+        """
+        return {self.names[index]: self.maxima[index] for index in self.order}
+
+
+def stream_max_values(file_path: str, method: str = 'stream', chunk_rows: int = CHUNK_ROWS) -> ColumnMaxima:
+    """
+    Find the maximum value of each column of a CSV file without keeping the rows in memory.
+
+    Unlike read_csv_to_dict(), rows with the same time stamp are all used, not only the last one.
+
+    :param file_path: path to the CSV file (str)
+    :param method: 'stream' (row by row) or 'numpy' (chunks of rows) (str)
+    :param chunk_rows: number of rows per NumPy chunk (int)
+    :return: column maxima (ColumnMaxima).
+    """
+    # utf-8-sig removes the BOM in front of the "Time" header
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as csv_file:
+        maxima = ColumnMaxima(next(csv.reader([csv_file.readline()]), []))
+        if method == 'numpy':
+            while True:
+                chunk = list(itertools.islice(csv_file, chunk_rows))
+                if not chunk:
+                    break
+                maxima.update_lines(chunk)
+        else:
+            maxima.update_rows(csv.reader(csv_file))
+
+    return maxima
+
+
+def read_time_series(file_path: str, chunk_rows: int = CHUNK_ROWS) -> Tuple[List[str], List[str], Any]:
+    """
+    Read the job slot time series of all queues from a Grafana CSV export.
+
+    :param file_path: path to the CSV file (str)
+    :param chunk_rows: number of rows per NumPy chunk (int)
+    :return: queue names, time stamps and values, shape (rows, queues), -1 for empty bins (Tuple[List[str], List[str], np.ndarray]).
+    """
+    import numpy as np
+
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as csv_file:
+        names = [name.lstrip('\ufeff').strip().strip('"') for name in next(csv.reader([csv_file.readline()]), [])]
+        if TIME_COLUMN not in names:
+            raise ValueError(f'no {TIME_COLUMN} column in {file_path}')
+        time_index = names.index(TIME_COLUMN)
+        width = len(names)
+        stamps = []
+        chunks = []
+        while True:
+            lines = list(itertools.islice(csv_file, chunk_rows))
+            if not lines:
+                break
+            parsed = parse_lines(lines, width) if time_index == 0 else None
+            if parsed is None:
+                # slow path: quoted values, non-integers or the time stamp in another column
+                rows = [row for row in csv.reader(lines) if time_index < len(row) and row[time_index]]
+                parsed = ([row[time_index] for row in rows],
+                          np.array([[int(value) if value.isdigit() else -1 for index, value in
+                                     enumerate(row[:width] + [''] * (width - len(row))) if index != time_index] for row in rows],
+                                   dtype=np.int64).reshape(len(rows), width - 1))
+            stamps.extend(parsed[0])
+            chunks.append(parsed[1])
+
+    values = np.concatenate(chunks) if chunks else np.empty((0, width - 1), dtype=np.int64)
+
+    return [name for index, name in enumerate(names) if index != time_index], stamps, values
+
+
+def parse_time(stamp: str) -> Optional[float]:
+    """
+    Convert a Grafana time stamp to seconds since the epoch.
+
+    :param stamp: ISO 8601 date and time, or epoch seconds or milliseconds (str)
+    :return: seconds, or None if the time stamp is not understood (Optional[float]).
+    """
+    stamp = stamp.strip().strip('"')
+    if stamp.isdigit():
+        seconds = int(stamp)
+        return seconds / 1000 if seconds > 10 ** 11 else float(seconds)
+    try:
+        time_stamp = datetime.datetime.fromisoformat(stamp.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if time_stamp.tzinfo is None:
+        time_stamp = time_stamp.replace(tzinfo=datetime.timezone.utc)
+
+    return time_stamp.timestamp()
+
+
+def rolling_min(values: Any, window: int) -> Any:
+    """
+    Minimum of every window of consecutive rows, for all columns at once.
+
+    Uses the van Herk/Gil-Werman algorithm: the rows are cut into blocks of the window length, and the minimum of
+    a window is the minimum of a suffix of one block and a prefix of the next, so each value is visited a constant
+    number of times whatever the window length.
+
+    :param values: values, shape (rows, columns) (np.ndarray)
+    :param window: window length in rows (int)
+    :return: window minima, shape (rows - window + 1, columns) (np.ndarray).
+    """
+    import numpy as np
+
+    n_rows, n_columns = values.shape
+    if window <= 1:
+        return values.copy()
+    if n_rows < window:
+        return np.empty((0, n_columns), dtype=values.dtype)
+    padded = np.concatenate([values, np.full(((-n_rows) % window, n_columns), np.inf, dtype=values.dtype)])
+    blocks = padded.reshape(-1, window, n_columns)
+    prefix = np.minimum.accumulate(blocks, axis=1).reshape(-1, n_columns)
+    suffix = np.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_columns)
+
+    return np.minimum(suffix[:n_rows - window + 1], prefix[window - 1:n_rows])
+
+
+def statistic_names(window_hours: float = WINDOW_HOURS, percentile: float = PERCENTILE) -> List[str]:
     """
-    with open(file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(data_dict, json_file, indent=2)
+    Return the names of the statistics in the output of slot_statistics().
+
+    :param window_hours: sustained maximum window (float)
+    :param percentile: percentile (float)
+    :return: statistic names (List[str]).
+    """
+    return ['max', f'sustained_max_{window_hours:g}h', f'p{percentile:g}', 'mean', 'samples']
+
+
+def slot_statistics(names: List[str], stamps: List[str], values: Any, window_hours: float = WINDOW_HOURS,
+                    percentile: float = PERCENTILE) -> dict:
+    """
+    Compute rolling-window job slot statistics per queue.
+
+    The samples are placed on a regular time grid (the median interval between time stamps) and all queues are
+    processed column-wise with NumPy. Empty bins are unknown rather than zero: they are skipped by the maximum,
+    the sustained maximum and the percentile, and the last known value is held through them for the mean.
+
+    - max: the largest sample, as in find_max_values()
+    - sustained_max_<N>h: the highest number of slots held during N consecutive hours, i.e. the maximum of the
+      rolling N hour minimum (None if the series is shorter than the window)
+    - p<P>: the P-th percentile of the samples
+    - mean: the time-weighted mean from the first sample on
+    - samples: the number of non-empty bins
+
+    :param names: queue names (List[str])
+    :param stamps: time stamps, one per row (List[str])
+    :param values: values, shape (rows, queues), negative for empty bins (np.ndarray)
+    :param window_hours: sustained maximum window (float)
+    :param percentile: percentile, 0-100 (float)
+    :return: { queue: { statistic: value } }, in the order in which the queues got their first value (dict).
+    """
+    import numpy as np
+
+    max_name, sustained_name, percentile_name, mean_name, samples_name = statistic_names(window_hours, percentile)
+    if not stamps:
+        return {}
+
+    times = [parse_time(stamp) for stamp in stamps]
+    if None in times:
+        print(f'unknown time stamp format ({stamps[times.index(None)]}), assuming hourly rows')
+        times = [3600.0 * row for row in range(len(stamps))]
+    times = np.asarray(times)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    values = values[order]
+    steps = np.diff(np.unique(times))
+    step = float(np.median(steps)) if steps.size else 3600.0
+    positions = np.rint((times - times[0]) / step).astype(np.int64)
+    unique_positions = bool(positions.size < 2 or np.all(np.diff(positions) > 0))
+    window = max(1, int(round(window_hours * 3600 / step)))
+    n_grid = int(positions[-1]) + 1
+
+    present = values >= 0
+    first = present.argmax(axis=0)
+    columns = sorted(np.flatnonzero(present.any(axis=0)).tolist(), key=lambda column: (first[column], column))
+
+    statistics = {}
+    # a block of queues at a time bounds the size of the temporary grids
+    for start in range(0, len(columns), COLUMN_BLOCK):
+        block = columns[start:start + COLUMN_BLOCK]
+        samples = values[:, block].astype(np.float64)
+        samples[samples < 0] = np.nan
+        grid = np.full((n_grid, len(block)), np.nan)
+        if unique_positions:
+            grid[positions] = samples
+        else:
+            # several rows in one bin, keep the largest value like the maximum does
+            np.fmax.at(grid, positions, samples)
+
+        valid = ~np.isnan(grid)
+        counts = valid.sum(axis=0)
+        maxima = np.nanmax(grid, axis=0)
+        with warnings.catch_warnings():
+            # windows without any sample
+            warnings.simplefilter('ignore', RuntimeWarning)
+            window_minima = rolling_min(np.where(valid, grid, np.inf), window)
+            window_minima[np.isinf(window_minima)] = np.nan
+            sustained = np.nanmax(window_minima, axis=0) if len(window_minima) else np.full(len(block), np.nan)
+        percentiles = np.nanpercentile(grid, percentile, axis=0)
+
+        # hold the last known value through empty bins
+        last = np.maximum.accumulate(np.where(valid, np.arange(n_grid)[:, None], -1), axis=0)
+        held = grid[np.maximum(last, 0), np.arange(len(block))]
+        known = last >= 0
+        means = np.where(known, held, 0.0).sum(axis=0) / known.sum(axis=0)
+
+        for position, column in enumerate(block):
+            statistics[names[column]] = {
+                max_name: int(maxima[position]),
+                sustained_name: None if np.isnan(sustained[position]) else int(sustained[position]),
+                percentile_name: round(float(percentiles[position]), 2),
+                mean_name: round(float(means[position]), 2),
+                samples_name: int(counts[position]),
+            }
+
+    return statistics
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Extract the maximum number of CPUs per queue from a Grafana CSV file.')
+    # path = 'grafana-7days.csv'
+    # path = 'grafana-1year.csv'
+    parser.add_argument('--input', type=str, default='grafana-6months.csv', help='Grafana CSV export (default: grafana-6months.csv).')
+    parser.add_argument('--output', type=str, default='number_of_cpus.json', help='Output file (default: number_of_cpus.json).')
+    parser.add_argument('--method', choices=['stream', 'numpy', 'dict'], default='stream',
+                        help='Reduce row by row (stream), in NumPy chunks of rows (numpy) or via the whole table in memory (dict).')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help=f'Rows per chunk for --method numpy (default: {CHUNK_ROWS}).')
+    parser.add_argument('--stats', type=str, metavar='FILE',
+                        help='Also write rolling-window job slot statistics per queue to FILE, e.g. job_slot_stats.json '
+                             '(reads the whole series, --method is ignored).')
+    parser.add_argument('--window-hours', type=float, default=WINDOW_HOURS,
+                        help=f'Window of the sustained maximum in hours (default: {WINDOW_HOURS}).')
+    parser.add_argument('--percentile', type=float, default=PERCENTILE, help=f'Percentile of the samples (default: {PERCENTILE}).')
+    add_arguments(parser, 'number_of_cpus')
+    args = parser.parse_args()
+    if not 0 <= args.percentile <= 100:
+        parser.error('--percentile must be between 0 and 100')
+    if args.window_hours <= 0:
+        parser.error('--window-hours must be positive')
+    profiler = Profiler.from_args(args, 'number_of_cpus')
+
+    if args.stats:
+        # the statistics need the whole series, which also gives the maxima
+        with profiler.phase('load'):
+            names, stamps, values = read_time_series(args.input, chunk_rows=args.chunk_rows)
+            profiler.count('rows', len(stamps))
+        with profiler.phase('transform'):
+            statistics = slot_statistics(names, stamps, values, window_hours=args.window_hours, percentile=args.percentile)
+            _max_values = {queue: stats['max'] for queue, stats in statistics.items()}
+    elif args.method == 'dict':
+        with profiler.phase('load'):
+            result_dict = read_csv_to_dict(args.input)
+            profiler.count('rows', len(result_dict))
 
+        # Display the resulting dictionary
+        # for timestamp, data in result_dict.items():
+        #     print(f"Timestamp: {timestamp}, Data: {data}")
 
-# path = 'grafana-7days.csv'
-# path = 'grafana-1year.csv'
-path = 'grafana-6months.csv'
-result_dict = read_csv_to_dict(path)
+        with profiler.phase('transform'):
+            _max_values = find_max_values(result_dict)
+    else:
+        # reading and reducing are interleaved
+        with profiler.phase('transform'):
+            maxima = stream_max_values(args.input, method=args.method, chunk_rows=args.chunk_rows)
+            _max_values = maxima.result()
+            profiler.count('rows', maxima.rows)
+    profiler.count('queues', len(_max_values))
 
-# Display the resulting dictionary
-# for timestamp, data in result_dict.items():
-#     print(f"Timestamp: {timestamp}, Data: {data}")
+    # Display the maximum values
+    for _key, _value in _max_values.items():
+        print(f"Max value for {_key}: {_value}")
 
-_max_values = find_max_values(result_dict)
+    print(len(_max_values.items()))
 
-# Display the maximum values
-for _key, _value in _max_values.items():
-    print(f"Max value for {_key}: {_value}")
+    with profiler.phase('write'):
+        write_dict_to_json(_max_values, args.output)
+        if args.stats:
+            write_dict_to_json(statistics, args.stats)
+    profiler.finish()
 
-print(len(_max_values.items()))
 
-write_dict_to_json(_max_values, 'number_of_cpus.json')
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Run the REDWOOD data pipeline.
+
+The stages and the files they read and write are declared below; the dependencies between the stages follow
+from their inputs and outputs:
+
+  connections      data/latest*.json                        -> combined_connections.json, combined_connections.npz,
+                                                               site_registry.json
+  max_connections  combined_connections.npz                 -> max_connections.json
+  number_of_cpus   grafana-6months.csv                      -> number_of_cpus.json
+  job_slot_stats   grafana-6months.csv                      -> job_slot_stats.json
+  combine          queues_and_rses.json, corepower.json,
+                   queue_corecount.json                     -> queues-corepower_based.json, combine_report.json
+  platform         queues-corepower_based.json,
+                   max_connections.json                     -> platform.xml
+  verify           queues-corepower_based.json,
+                   max_connections.json, platform.xml       -> verify_report.json
+
+A stage is skipped when the SHA-256 digests of its inputs and outputs are the same as after its last run
+(recorded in .pipeline_state.json). Independent stages run concurrently, and the data produced by a stage is
+handed to the stages that need it in memory instead of being read back from disk. Stages whose input files
+are missing are skipped, together with the stages that depend on them.
+
+Usage: python pipeline.py [--workdir <directory>] [--jobs <threads>] [--force] [--dry-run] [stage ...]
+"""
+
+import argparse
+import glob
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from connection_cache import file_digest
+from data_io import is_data_file, read_json_to_dict, write_dict_to_json
+from profiling import Profiler, add_arguments
+
+STATE_FILE = '.pipeline_state.json'
+
+
+class Stage:
+    """A pipeline stage: a function from named input artifacts to named output artifacts."""
+
+    def __init__(self, name: str, inputs: List[str], outputs: List[str], run: Callable[[Dict[str, Any], Dict[str, str]], Dict[str, Any]]):
+        """
+        Declare a stage.
+
+        The run function gets the loaded inputs (JSON as dictionaries, .npz as bandwidth stores, glob patterns as
+        sorted lists of paths, anything else as its path) and the output paths. It returns the outputs that the
+        runner should write (and keep in memory); outputs that are not returned must be written by the function.
+
+        :param name: stage name (str)
+        :param inputs: input files or glob patterns, relative to the work directory (List[str])
+        :param outputs: output files, relative to the work directory (List[str])
+        :param run: stage function (Callable[[Dict[str, Any], Dict[str, str]], Dict[str, Any]]).
+        """
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+
+
+def run_connections(inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Combine the connections of all Rucio metrics files.
+
+    :param inputs: loaded inputs (Dict[str, Any])
+    :param outputs: output paths (Dict[str, str])
+    :return: output artifacts (Dict[str, Any]).
+    """
+    from bandwidth_store import BandwidthStore
+    from connection_cache import ConnectionCache, DEFAULT_CACHE_DIR
+    from process_connections import collect_partials, intern_partials, merge_partials
+    from site_registry import SiteRegistry
+
+    file_paths = inputs['data/latest*.json']
+    registry = SiteRegistry.load(outputs['site_registry.json'])
+    # the cache lives in the work directory, next to the outputs
+    cache = ConnectionCache(os.path.join(os.path.dirname(outputs['site_registry.json']), DEFAULT_CACHE_DIR))
+    partials = intern_partials(collect_partials(file_paths, workers=os.cpu_count() or 1, cache=cache), registry)
+
+    return {
+        'combined_connections.json': merge_partials(file_paths, partials, registry),
+        'combined_connections.npz': BandwidthStore.from_partials(file_paths, partials, registry),
+        'site_registry.json': registry.to_dict(),
+    }
+
+
+def run_max_connections(inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Find the fastest bandwidth of each connection.
+
+    :param inputs: loaded inputs (Dict[str, Any])
+    :param outputs: output paths (Dict[str, str])
+    :return: output artifacts (Dict[str, Any]).
+    """
+    from process_combined_connections import reduce_connections
+
+    result = reduce_connections(inputs['combined_connections.npz'])
+    print(f'max_connections: {len(result.connections)} connections, scaling factor {result.scaling_factor}')
+
+    return {'max_connections.json': result.connections}
+
+
+def run_number_of_cpus(inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Find the maximum number of job slots per queue.
+
+    :param inputs: loaded inputs (Dict[str, Any])
+    :param outputs: output paths (Dict[str, str])
+    :return: output artifacts (Dict[str, Any]).
+    """
+    from number_of_cpus import stream_max_values
+
+    return {'number_of_cpus.json': stream_max_values(inputs['grafana-6months.csv'], method='numpy').result()}
+
+
+def run_job_slot_stats(inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Compute rolling-window job slot statistics per queue.
+
+    :param inputs: loaded inputs (Dict[str, Any])
+    :param outputs: output paths (Dict[str, str])
+    :return: output artifacts (Dict[str, Any]).
+    """
+    from number_of_cpus import read_time_series, slot_statistics
+
+    return {'job_slot_stats.json': slot_statistics(*read_time_series(inputs['grafana-6months.csv']))}
+
+
+def run_combine(inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Combine the GFLOPS, number of cores and RSE info of each queue.
+
+    :param inputs: loaded inputs (Dict[str, Any])
+    :param outputs: output paths (Dict[str, str])
+    :return: output artifacts (Dict[str, Any]).
+    """
+    from combine import MODELS, join, summarize
+
+    combined, report = join(inputs['queues_and_rses.json'], inputs, [MODELS['corepower']])
+    summarize(report)
+
+    return {'queues-corepower_based.json': combined['corepower'], 'combine_report.json': report}
+
+
+def run_verify(inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Validate the queue, connection and platform files and the references between them.
+
+    :param inputs: loaded inputs (Dict[str, Any])
+    :param outputs: output paths (Dict[str, str])
+    :return: output artifacts (Dict[str, Any]).
+    """
+    from verify import verify
+
+    report = verify(inputs)
+    if report['problems']:
+        print(f"WARNING: verify found {report['problems']} problems")
+
+    return {'verify_report.json': report}
+
+
+def run_platform(inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Generate the platform XML file from the queue and connection data.
+
+    :param inputs: loaded inputs (Dict[str, Any])
+    :param outputs: output paths (Dict[str, str])
+    :return: output artifacts, none since the XML file is written directly (Dict[str, Any]).
+    """
+    from generate_xml import generate_xml_from_data
+
+    generate_xml_from_data(outputs['platform.xml'], inputs['queues-corepower_based.json'], inputs['max_connections.json'])
+
+    return {}
+
+
+STAGES = [
+    Stage('connections', ['data/latest*.json'], ['combined_connections.json', 'combined_connections.npz', 'site_registry.json'], run_connections),
+    Stage('max_connections', ['combined_connections.npz'], ['max_connections.json'], run_max_connections),
+    Stage('number_of_cpus', ['grafana-6months.csv'], ['number_of_cpus.json'], run_number_of_cpus),
+    Stage('job_slot_stats', ['grafana-6months.csv'], ['job_slot_stats.json'], run_job_slot_stats),
+    Stage('combine', ['queues_and_rses.json', 'corepower.json', 'queue_corecount.json'], ['queues-corepower_based.json', 'combine_report.json'], run_combine),
+    Stage('verify', ['queues-corepower_based.json', 'max_connections.json', 'platform.xml'], ['verify_report.json'], run_verify),
+    Stage('platform', ['queues-corepower_based.json', 'max_connections.json'], ['platform.xml'], run_platform),
+]
+
+
+class Pipeline:
+    """Runs stages in dependency order, concurrently where possible, skipping the up-to-date ones."""
+
+    def __init__(self, stages: List[Stage], workdir: str = '.', force: bool = False, dry_run: bool = False,
+                 profiler: Optional[Profiler] = None):
+        """
+        Initialize the pipeline and read the state of the previous run.
+
+        :param stages: stages (List[Stage])
+        :param workdir: directory that the stage inputs and outputs are relative to (str)
+        :param force: run all stages, even if they are up to date (bool)
+        :param dry_run: only report what would run (bool)
+        :param profiler: records the load, transform and write phases of each stage (Optional[Profiler]).
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.profiler = profiler or Profiler('pipeline')
+        self.workdir = workdir
+        self.force = force
+        self.dry_run = dry_run
+        self.producers = {output: stage.name for stage in stages for output in stage.outputs}
+        self.artifacts = {}
+        # outputs of the stages that would run, in a dry run
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.state_path = os.path.join(workdir, STATE_FILE)
+        self.state = {'files': {}, 'stages': {}}
+        if os.path.exists(self.state_path):
+            self.state = read_json_to_dict(self.state_path)
+
+    def dependencies(self, stage: Stage) -> List[str]:
+        """
+        Return the stages that produce the inputs of a stage.
+
+        :param stage: stage (Stage)
+        :return: stage names (List[str]).
+        """
+        return [self.producers[name] for name in stage.inputs if name in self.producers]
+
+    def path(self, name: str) -> str:
+        """
+        Return the path of a file relative to the work directory.
+
+        :param name: file name (str)
+        :return: path (str).
+        """
+        return os.path.join(self.workdir, name)
+
+    def expand(self, name: str) -> List[str]:
+        """
+        Return the existing files for an input name or glob pattern.
+
+        :param name: file name or glob pattern (str)
+        :return: sorted paths (List[str]).
+        """
+        if glob.has_magic(name):
+            return sorted(glob.glob(self.path(name)))
+
+        return [self.path(name)] if os.path.exists(self.path(name)) else []
+
+    def digest(self, path: str) -> str:
+        """
+        Return the SHA-256 digest of a file, reusing the recorded one if its size and mtime did not change.
+
+        :param path: file path (str)
+        :return: hex digest (str).
+        """
+        stat = os.stat(path)
+        with self.lock:
+            known = self.state['files'].get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = file_digest(path)
+        with self.lock:
+            self.state['files'][path] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        return digest
+
+    def fingerprint(self, names: List[str]) -> Optional[Dict[str, str]]:
+        """
+        Return the digests of all files for the given names.
+
+        :param names: file names or glob patterns (List[str])
+        :return: { path: digest }, None if a name has no files (Optional[Dict[str, str]]).
+        """
+        digests = {}
+        for name in names:
+            paths = self.expand(name)
+            if not paths:
+                return None
+            for path in paths:
+                digests[path] = self.digest(path)
+
+        return digests
+
+    def load(self, name: str) -> Any:
+        """
+        Return an input artifact, from memory if a stage of this run produced it.
+
+        :param name: file name or glob pattern (str)
+        :return: loaded artifact (Any).
+        """
+        with self.lock:
+            if name in self.artifacts:
+                return self.artifacts[name]
+        if glob.has_magic(name):
+            return self.expand(name)
+        if is_data_file(name):
+            return read_json_to_dict(self.path(name))
+        if name.endswith('.npz'):
+            from bandwidth_store import BandwidthStore
+            return BandwidthStore.load(self.path(name))
+
+        return self.path(name)
+
+    def save(self, name: str, artifact: Any):
+        """
+        Write an output artifact and keep it in memory for the following stages.
+
+        :param name: file name (str)
+        :param artifact: dictionary for data files (.json, .msgpack, ..), or an object with a save(path) method (Any).
+        """
+        if is_data_file(name):
+            write_dict_to_json(artifact, self.path(name))
+        else:
+            artifact.save(self.path(name))
+        with self.lock:
+            self.artifacts[name] = artifact
+
+    def execute(self, stage: Stage) -> str:
+        """
+        Run a stage unless it is up to date.
+
+        In a dry run, the outputs of the stages that would run count as present (but changed) inputs.
+
+        :param stage: stage (Stage)
+        :return: 'ran', 'up to date', 'would run' or 'missing input' (str).
+        """
+        with self.lock:
+            pending = [name for name in stage.inputs if name in self.pending]
+        inputs = self.fingerprint([name for name in stage.inputs if name not in pending])
+        if inputs is None:
+            return 'missing input'
+        recorded = self.state['stages'].get(stage.name, {})
+        outputs = self.fingerprint(stage.outputs) if stage.outputs else {}
+        if not self.force and not pending and recorded.get('inputs') == inputs and outputs is not None and recorded.get('outputs') == outputs:
+            return 'up to date'
+        if self.dry_run:
+            with self.lock:
+                self.pending.update(stage.outputs)
+            return 'would run'
+
+        with self.profiler.phase('load'):
+            loaded = {name: self.load(name) for name in stage.inputs}
+        with self.profiler.phase('transform'):
+            produced = stage.run(loaded, {name: self.path(name) for name in stage.outputs})
+        with self.profiler.phase('write'):
+            for name, artifact in produced.items():
+                self.save(name, artifact)
+
+        outputs = self.fingerprint(stage.outputs) if stage.outputs else {}
+        with self.lock:
+            self.state['stages'][stage.name] = {'inputs': inputs, 'outputs': outputs}
+
+        return 'ran'
+
+    def run(self, targets: Optional[List[str]] = None, jobs: int = 4) -> Dict[str, str]:
+        """
+        Run the given stages and the stages they depend on.
+
+        :param targets: stage names, None for all stages (Optional[List[str]])
+        :param jobs: number of stages to run concurrently (int)
+        :return: { stage name: status } (Dict[str, str]).
+        """
+        selected = set()
+        pending = list(targets or self.stages)
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.dependencies(self.stages[name]))
+
+        status = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while len(status) < len(selected):
+                for name in [name for name in self.stages if name in selected and name not in status and name not in running.values()]:
+                    dependencies = self.dependencies(self.stages[name])
+                    if any(status.get(dependency) in ('missing input', 'failed', 'skipped') for dependency in dependencies):
+                        status[name] = 'skipped'
+                    elif all(dependency in status for dependency in dependencies):
+                        running[executor.submit(self.timed, self.stages[name])] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as exc:  # report, and skip the dependent stages
+                        print(f'stage {name} failed: {exc!r}')
+                        status[name] = 'failed'
+
+        if not self.dry_run:
+            tmp_path = f'{self.state_path}.tmp'
+            write_dict_to_json(self.state, tmp_path, quiet=True)
+            os.replace(tmp_path, self.state_path)
+
+        return status
+
+    def timed(self, stage: Stage) -> str:
+        """
+        Run a stage and report its status and duration.
+
+        :param stage: stage (Stage)
+        :return: stage status (str).
+        """
+        start = time.time()
+        with self.profiler.phase(stage.name):
+            status = self.execute(stage)
+        print(f'stage {stage.name}: {status} ({time.time() - start:.2f} s)')
+
+        return status
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Run the REDWOOD data pipeline.')
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"Stages to run, together with the stages they depend on: {', '.join(stage.name for stage in STAGES)} (default: all).")
+    parser.add_argument('--workdir', type=str, default='.', help='Directory with the input and output files (default: .).')
+    parser.add_argument('--jobs', type=int, default=4, help='Number of stages to run concurrently (default: 4).')
+    parser.add_argument('--force', action='store_true', help='Run the stages even if they are up to date.')
+    parser.add_argument('--dry-run', action='store_true', help='Only show which stages would run.')
+    add_arguments(parser, 'pipeline')
+    args = parser.parse_args()
+    unknown = [name for name in args.stages if name not in {stage.name for stage in STAGES}]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    profiler = Profiler.from_args(args, 'pipeline')
+    pipeline = Pipeline(STAGES, workdir=args.workdir, force=args.force, dry_run=args.dry_run, profiler=profiler)
+    start = time.time()
+    status = pipeline.run(args.stages or None, jobs=args.jobs)
+    for name, result in status.items():
+        print(f'{name}: {result}')
+    print(f'pipeline finished in {time.time() - start:.2f} s')
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
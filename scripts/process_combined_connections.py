@@ -23,112 +23,236 @@ Process the combined_connections.json file to extract connections and bandwidths
 and produce the max_connections.json with the fastest detected transfers
 
 Note: duplicates will be removed, ie only the fastest bandwidth of A:B and B:A will be stored
+
+Usage: python process_combined_connections.py [--input combined_connections.json|.npz] [--store <.npz file>]
+                                              [--target-bandwidth <Mbit/s> | --scaling-factor <factor>]
+
+The connections are reduced in one vectorized pass over a columnar bandwidth store (see bandwidth_store.py):
+each A:B / B:A pair is identified by its ordered pair of site IDs, and the maximum per pair, the fastest and
+slowest connections and the normalisation factor all come from the same arrays. By default, the bandwidths are
+scaled so that the fastest known connection is 10 Gbit/s.
+
+Instead of the single highest value ever seen, --capacity p50/p90/p99 uses a quantile of the values of each
+connection, from the quantile sketches written by process_connections.py --sketches, or computed exactly from
+the input when no sketches are given.
+
+--since/--until restrict the statistics to the snapshots in a date window; this requires a bandwidth store
+written by process_connections.py --store, which records the date of each metrics file.
 """
 
-import json
+import argparse
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+
+from bandwidth_history import BandwidthHistory, date_argument
+from bandwidth_store import BandwidthStore
+from data_io import read_json_to_dict, write_dict_to_json
+from profiling import Profiler, add_arguments
+from quantile_sketch import KLLSketch, QUANTILES, sketches_from_dict, summarize
+from site_registry import SITE_BITS, SiteRegistry
+
+# the fastest known connection is scaled to this bandwidth (Mbit/s), ie 10 Gbit/s
+TARGET_BANDWIDTH = 10000.0
+
+
+class ReducedConnections(NamedTuple):
+    """Result of reduce_connections()."""
+
+    connections: dict  # { connection: scaled max bandwidth }, inverse connections removed
+    fastest: dict  # { connection: scaled bandwidth } of the fastest connection
+    slowest: dict  # { connection: scaled bandwidth } of the slowest connection
+    scaling_factor: float
+
+
+def canonical_pairs(pairs: np.ndarray) -> np.ndarray:
+    """
+    Return one integer key per connection that is the same for A:B and B:A.
+
+    :param pairs: (connection, 2) source and destination site IDs (np.ndarray)
+    :return: (min ID << 32) | max ID per connection (np.ndarray).
+    """
+    pairs = pairs.astype(np.int64)
+
+    return (pairs.min(axis=1) << SITE_BITS) | pairs.max(axis=1)
+
+
+def reduce_connections(store: BandwidthStore, values: Optional[np.ndarray] = None, scaling_factor: Optional[float] = None,
+                       target_bandwidth: float = TARGET_BANDWIDTH) -> ReducedConnections:
+    """
+    Find the fastest bandwidth of each connection, keeping only the fastest of A:B and B:A.
+
+    Connections without a positive bandwidth are ignored. The surviving connection of a pair is named after
+    the orientation that appears first in the store, as before.
 
-# to make the fastest known connection 10 Gbit/s
-scaling_factor = 2.2595857275527105
+    :param store: bandwidth store (BandwidthStore)
+    :param values: bandwidth per connection, default: the maximum over all snapshots and resolutions (Optional[np.ndarray])
+    :param scaling_factor: factor applied to all bandwidths, default: target_bandwidth / highest bandwidth (Optional[float])
+    :param target_bandwidth: bandwidth of the fastest connection after scaling (float)
+    :return: reduced connections (ReducedConnections).
+    """
+    if values is None:
+        values = store.max()
+    valid = np.flatnonzero(values > 0)  # NaN compares False
+    if not len(valid):
+        return ReducedConnections({}, {}, {}, scaling_factor or 1.0)
+    valid_values = values[valid]
+
+    # global extremes, first occurrence on ties
+    fastest = valid[np.argmax(valid_values)]
+    slowest = valid[np.argmin(valid_values)]
+    if scaling_factor is None:
+        scaling_factor = float(target_bandwidth / values[fastest])
+
+    # group A:B and B:A; a stable sort keeps the first occurrence at the start of each group
+    keys = canonical_pairs(store.pairs[valid])
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    pair_max = np.maximum.reduceat(valid_values[order], starts)
+    first = order[starts]
+
+    # restore the order of the input
+    by_first = np.argsort(first)
+    representatives = valid[first[by_first]]
+    pair_max = pair_max[by_first] * scaling_factor
+
+    sites = store.sites
+    pairs = store.pairs[representatives].tolist()
+    connections = {f'{sites[source]}:{sites[destination]}': value for (source, destination), value in zip(pairs, pair_max.tolist())}
 
+    def named(index: int) -> dict:
+        source, destination = store.pairs[index].tolist()
+        return {f'{sites[source]}:{sites[destination]}': float(values[index]) * scaling_factor}
 
-def read_json_to_dict(file_path: str) -> dict:
+    return ReducedConnections(connections, named(fastest), named(slowest), scaling_factor)
+
+
+def capacity_values(store: BandwidthStore, capacity: str = 'max', sketches: Optional[Dict[str, KLLSketch]] = None,
+                    since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> np.ndarray:
     """
-    Read a json file to a dictionary.
+    Return the bandwidth statistic used as the capacity of each connection.
+
+    With a date window, the maximum is answered from the precomputed range maxima of a BandwidthHistory,
+    and quantiles are computed from the snapshots in the window.
 
-    :param file_path: file path (str)
-    :return: json dictionary from file (dict).
+    :param store: bandwidth store (BandwidthStore)
+    :param capacity: 'max' or one of the QUANTILES names, e.g. 'p90' (str)
+    :param sketches: { connection: sketch }; without sketches, quantiles are computed exactly from the store (Optional[Dict[str, KLLSketch]])
+    :param since: first snapshot date to include, None for no lower limit (Optional[np.datetime64])
+    :param until: last snapshot date to include, None for no upper limit (Optional[np.datetime64])
+    :return: one value per connection of the store, NaN if unknown (np.ndarray)
+    :raises ValueError: for a window on a store without snapshot dates, or with sketches.
     """
-    with open(file_path, 'r', encoding='utf-8') as json_file:
-        data_dict = json.load(json_file)
+    windowed = since is not None or until is not None
+    if windowed and sketches is not None:
+        raise ValueError('the quantile sketches cover all snapshots and cannot be restricted to a date window')
+    if capacity == 'max':
+        return BandwidthHistory(store).window_max(since, until) if windowed else store.max()
+    q = QUANTILES[capacity]
+    if sketches is None:
+        if windowed:
+            store = store.select(since, until)
+        return store.percentile(q * 100, method='inverted_cdf')
 
-    return data_dict
+    values = np.full(len(store), np.nan)
+    for index, name in enumerate(store.connection_names()):
+        sketch = sketches.get(name)
+        if sketch is not None and sketch.count:
+            values[index] = sketch.quantile(q)
 
+    return values
 
-def write_dict_to_json(data_dict: dict, file_path: str):
+
+def quantile_summary(store: BandwidthStore, sketches: Optional[Dict[str, KLLSketch]] = None) -> Dict[str, dict]:
     """
-    Write a dictionary to a json file.
+    Return the p50, p90, p99 and max bandwidths of each connection that has values.
 
-    :param data_dict: data dictionary (dict)
-    :param file_path: file path (str).
+    :param store: bandwidth store (BandwidthStore)
+    :param sketches: { connection: sketch }; without sketches, the values are computed exactly from the store (Optional[Dict[str, KLLSketch]])
+    :return: { connection: { 'p50': .., 'p90': .., 'p99': .., 'max': .. } } (Dict[str, dict]).
     """
-    print(f'writing dictionary to {file_path}')
-    with open(file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(data_dict, json_file, indent=2)
-
-
-def inverse(connection: str) -> str:
-    """ A:B -> B:A """
-    sites = connection.split(":")
-    site1 = sites[0]
-    site2 = sites[1]
-
-    return f"{site2}:{site1}"
-
-
-# find max mbps values
-connections_with_max = {}
-connections = read_json_to_dict("combined_connections.json")
-for connection in connections.keys():
-
-    data = connections.get(connection)
-    if not data:
-        continue
-
-    weeks = []
-    days = []
-    hours = []
-    for info in data:
-        weeks.append(info.get('1w', 0))
-        days.append(info.get('1d', 0))
-        hours.append(info.get('1h', 0))
-
-    # it could happen that there are no '1w', '1d', '1h' values present
-    highest_value = max([max(weeks), max(days), max(hours)])
-    if highest_value == 0:
-        print(f'no max value found for {connection}')
-        continue
-    connections_with_max[connection] = highest_value * scaling_factor
-
-# find which connection has the highest transfer rate - and the slowest
-fastest_connection = {}
-highest_value = 0
-slowest_connection = {}
-lowest_value = 9999
-for connection in connections_with_max:
-
-    value = connections_with_max[connection]
-    if value > highest_value:
-        fastest_connection = {connection: value}
-        highest_value = value
-    if value < lowest_value:
-        slowest_connection = {connection: value}
-        lowest_value = value
-
-# finally, only keep the highest value from A:B and B:A
-reduced_connections_with_max = {}
-for connection in connections_with_max:
-    value1 = connections_with_max[connection]
-    inv = inverse(connection)
-    # has the connection already been processed?
-    if inv in reduced_connections_with_max:
-        continue
-
-    if inv in connections_with_max:
-        value2 = connections_with_max[inv]
-    else:
-        value2 = 0
-    m = max(value1, value2)
-    reduced_connections_with_max[connection] = m
-
-# verify that there are no inverse connections in the final dictionary
-# (test failure: reduced_connections_with_max['CYFRONET-LCG2:BNL-ATLAS'] = 0)
-for connection in reduced_connections_with_max:
-    inv = inverse(connection)
-    if inv in reduced_connections_with_max:
-        print(f'WARNING: found inverse connection {inv} ({connection})')
-
-print(f'fastest connection: {fastest_connection}')
-print(f'slowest connection: {slowest_connection}')
-print(f'total number of connections (inverse connections removed): {len(reduced_connections_with_max)}')
-file_path = 'max_connections.json'
-write_dict_to_json(reduced_connections_with_max, file_path)
+    if sketches is not None:
+        return {name: summarize(sketch) for name, sketch in sketches.items() if sketch.count}
+
+    columns = {name: capacity_values(store, name) for name in list(QUANTILES) + ['max']}
+    summary = {}
+    for index, name in enumerate(store.connection_names()):
+        if columns['max'][index] == columns['max'][index]:  # NaN for connections without values
+            summary[name] = {key: float(values[index]) for key, values in columns.items()}
+
+    return summary
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Find the fastest bandwidth of each connection.')
+    parser.add_argument('--input', type=str, default='combined_connections.json',
+                        help='combined_connections.json, or a columnar bandwidth store (.npz).')
+    parser.add_argument('--output', type=str, default='max_connections.json', help='Output file (.json, .msgpack or .cbor, optionally .gz or .zst).')
+    parser.add_argument('--pretty', action='store_true', help='Indent the JSON output files.')
+    parser.add_argument('--store', type=str, help='Also write the input as a columnar bandwidth store (.npz).')
+    scaling = parser.add_mutually_exclusive_group()
+    scaling.add_argument('--target-bandwidth', type=float, default=TARGET_BANDWIDTH,
+                         help=f'Scale the bandwidths so that the fastest connection gets this value (default: {TARGET_BANDWIDTH} Mbit/s).')
+    scaling.add_argument('--scaling-factor', type=float, help='Scale the bandwidths by a fixed factor instead.')
+    parser.add_argument('--capacity', choices=['max'] + list(QUANTILES), default='max',
+                        help='Bandwidth statistic used for each connection (default: max).')
+    parser.add_argument('--sketches', type=str,
+                        help='Per-connection quantile sketches from process_connections.py --sketches (default: exact quantiles).')
+    parser.add_argument('--quantiles', type=str,
+                        help='Also write the p50/p90/p99/max bandwidth of each connection to this file (unscaled).')
+    parser.add_argument('--since', type=date_argument, help='Only use snapshots from this date on (YYYY-MM-DD, requires a .npz input).')
+    parser.add_argument('--until', type=date_argument, help='Only use snapshots up to this date (YYYY-MM-DD, requires a .npz input).')
+    parser.add_argument('--registry', type=str,
+                        help='Site registry for the site IDs of a JSON input, updated with its new sites, e.g. site_registry.json '
+                             '(default: IDs in this run only).')
+    add_arguments(parser, 'process_combined_connections')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'process_combined_connections')
+
+    with profiler.phase('load'):
+        if args.input.endswith('.npz'):
+            store = BandwidthStore.load(args.input)
+        else:
+            registry = SiteRegistry.load(args.registry) if args.registry else SiteRegistry()
+            store = BandwidthStore.from_connections(read_json_to_dict(args.input), registry)
+            if args.registry:
+                registry.save(args.registry)
+        profiler.count('connections', len(store))
+    if args.store:
+        with profiler.phase('write'):
+            store.save(args.store)
+
+    since, until = args.since, args.until
+    if since is not None or until is not None:
+        if not store.has_times():
+            parser.error('--since/--until require a bandwidth store with snapshot dates, see process_connections.py --store')
+        if args.sketches:
+            parser.error('--since/--until cannot be combined with --sketches')
+
+    with profiler.phase('load'):
+        sketches = sketches_from_dict(read_json_to_dict(args.sketches)) if args.sketches else None
+    if args.quantiles:
+        with profiler.phase('transform'):
+            window = store.select(since, until) if since is not None or until is not None else store
+            summary = quantile_summary(window, sketches)
+        with profiler.phase('write'):
+            write_dict_to_json(summary, args.quantiles, pretty=args.pretty)
+
+    with profiler.phase('transform'):
+        values = capacity_values(store, args.capacity, sketches, since=since, until=until)
+        result = reduce_connections(store, values=values, scaling_factor=args.scaling_factor, target_bandwidth=args.target_bandwidth)
+        profiler.count('reduced_connections', len(result.connections))
+
+    print(f'scaling factor: {result.scaling_factor}')
+    print(f'fastest connection: {result.fastest}')
+    print(f'slowest connection: {result.slowest}')
+    print(f'total number of connections (inverse connections removed): {len(result.connections)}')
+    with profiler.phase('write'):
+        write_dict_to_json(result.connections, args.output, pretty=args.pretty)
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -20,35 +20,33 @@
 
 """
 Process the latest.json Rucio transfer metrics file to extract connections and bandwidths
-"""
-
-import json
-import os
-
-
-def read_json_to_dict(file_path: str) -> dict:
-    """
-    Read a json file to a dictionary.
 
-    :param file_path: file path (str)
-    :return: json dictionary from file (dict).
-    """
-    with open(file_path, 'r', encoding='utf-8') as json_file:
-        data_dict = json.load(json_file)
+Usage: python process_connections.py [--input <directory or glob>] [--workers <number of processes>]
 
-    return data_dict
+Without --input, the files in input_files are read from the data directory. With more than one worker,
+the files are parsed in a process pool; the partial results are merged in file order, so the output is
+identical to the one from a serial run.
 
+Each file is decoded one connection at a time (see json_stream.py), so the memory usage does not depend
+on the size of the metrics files. The per-file results, including one quantile sketch per connection with --sketches
+(see quantile_sketch.py), are cached (see connection_cache.py), so a rerun only parses new or changed files.
+Connections are handled as packed integer pairs of site IDs (see site_registry.py); the site IDs are kept in
+site_registry.json so that they are the same in every run.
+"""
 
-def write_dict_to_json(data_dict: dict, file_path: str):
-    """
-    Write a dictionary to a json file.
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
 
-    :param data_dict: data dictionary (dict)
-    :param file_path: file path (str).
-    """
-    print(f'writing dictionary to {file_path}')
-    with open(file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(data_dict, json_file, indent=2)
+from connection_cache import ConnectionCache, DEFAULT_CACHE_DIR
+from data_io import file_format, read_json_to_dict, write_dict_to_json
+from json_stream import iter_items
+from profiling import Profiler, add_arguments
+from quantile_sketch import KLLSketch, merge_sketches, sketch_dashb, sketches_to_dict
+from site_registry import DEFAULT_REGISTRY, SiteRegistry, is_valid
 
 
 # input_files = ['latest.json']
@@ -78,52 +76,281 @@ input_files = [
     'latest-10.06.2024.json',
 ]
 
-data_dir = os.path.join(os.getcwd(), 'data')
+# per-file partial result: the sites of the file (in the order of their file-local IDs), [(connection key, dashb
+# or None)] in file order, with keys made of file-local site IDs, and the names of the connections without dashb info
+Partial = Tuple[List[str], List[Tuple[int, Optional[dict]]], List[str], Optional[Dict[int, KLLSketch]]]
+# partial result with the file-local site IDs replaced by the IDs of the run's site registry
+Interned = Tuple[List[Tuple[int, Optional[dict]]], List[str], Optional[Dict[int, KLLSketch]]]
 
-# extract all info; { connection: [dashb] }
-all_connections = {}
 
-# get connections and bandwidths
-for file_name in input_files:
-    print(f'processing {file_name}')
-    connections = read_json_to_dict(os.path.join(data_dir, file_name))
+def extract_connections(connections: Iterable[Tuple[str, dict]], sketches: bool = False) -> Partial:
+    """
+    Extract the dashb bandwidth info of all connections in a metrics file.
 
-    for connection in connections.keys():
+    Self-connections and connections to/from UNKNOWN are ignored. Connections without bandwidth numbers
+    are kept (with dashb None), since they are still listed in the combined output. With sketches, the
+    bandwidth values of each connection are also added to a quantile sketch, to be merged with the ones of
+    the other files (see build_sketches()).
 
-        sites = connection.split(':')
-        local_site = sites[0]
-        remote_site = sites[1]
-        # ignore self-connection
-        if local_site == remote_site:
-            continue
-        if 'UNKNOWN' in {local_site, remote_site}:
-            continue
+    The sites are interned in a registry local to the file, since the files may be parsed in separate
+    processes; intern_partials() translates the keys to the IDs of the run's registry.
 
-        if connection not in all_connections:
-            all_connections[connection] = []
+    :param connections: (connection, metrics) items of a Rucio transfer metrics file (Iterable[Tuple[str, dict]])
+    :param sketches: also build the quantile sketches, None otherwise (bool)
+    :return: partial result (Partial).
+    """
+    registry = SiteRegistry()
+    entries = []
+    no_dashb = []
+    for connection, info in connections:
+
+        # ignore self-connections and connections to/from UNKNOWN
+        key = registry.connection_key(connection)
+        if not is_valid(key):
+            continue
 
         # are there any bandwidth numbers for this connection?
-        mbps = connections.get(connection).get('mbps')
+        mbps = info.get('mbps')
         if not mbps:
-            # print(f'no mbps info for connection {connection}')
+            entries.append((key, None))
             continue
 
         dashb = mbps.get('dashb')
         if not dashb:
-            print(f'no dashb info for connection {connection}')
+            no_dashb.append(connection)
+            entries.append((key, None))
             continue
 
-        # print(f'connectino={connection} dashb={dashb}')
+        entries.append((key, dashb))
+
+    return registry.sites, entries, no_dashb, sketch_dashb(entries) if sketches else None
+
+
+def process_file(file_path: str, loader: str = 'stream', sketches: bool = False) -> Partial:
+    """
+    Read a metrics file and extract its connections.
+
+    This is the unit of work for the process pool, so it only returns the compact partial result.
+    The 'stream' loader decodes one connection at a time and keeps only its dashb info, so the memory
+    usage does not depend on the file size; the 'json' loader reads the whole file at once, which is also
+    used for the binary formats (MessagePack, CBOR).
+
+    :param file_path: file path (str)
+    :param loader: 'stream' or 'json' (str)
+    :param sketches: also build one quantile sketch per connection (bool)
+    :return: partial result (Partial).
+    """
+    if loader == 'json' or file_format(file_path)[0] != 'json':
+        return extract_connections(read_json_to_dict(file_path).items(), sketches)
+
+    return extract_connections(iter_items(file_path), sketches)
+
+
+def intern_partials(partials: Iterable[Partial], registry: SiteRegistry) -> List[Interned]:
+    """
+    Translate the connection keys of per-file partial results to the site IDs of a registry.
+
+    :param partials: partial results (Iterable[Partial])
+    :param registry: site registry of the run, new sites are added (SiteRegistry)
+    :return: interned partial results, in the same order (List[Interned]).
+    """
+    interned = []
+    for sites, entries, no_dashb, sketches in partials:
+        keys = registry.translate(sites, (key for key, _ in entries))
+        if sketches is not None:
+            sketches = dict(zip(registry.translate(sites, sketches), sketches.values()))
+        interned.append((list(zip(keys, (dashb for _, dashb in entries))), no_dashb, sketches))
+
+    return interned
+
+
+def merge_partials(file_paths: List[str], partials: Iterable[Interned], registry: SiteRegistry) -> dict:
+    """
+    Merge per-file partial results, in file order.
+
+    :param file_paths: file paths, in the same order as the partial results (List[str])
+    :param partials: interned partial results (Iterable[Interned])
+    :param registry: site registry the partial results were interned with (SiteRegistry)
+    :return: { connection: [dashb] } (dict).
+    """
+    merged = {}
+    for file_path, (entries, no_dashb, _) in zip(file_paths, partials):
+        print(f'processing {os.path.basename(file_path)}')
+        for connection in no_dashb:
+            print(f'no dashb info for connection {connection}')
+        for key, dashb in entries:
+            samples = merged.get(key)
+            if samples is None:
+                samples = merged[key] = []
+            if dashb:
+                samples.append(dashb)
+
+    return {registry.connection_name(key): samples for key, samples in merged.items()}
+
+
+def parse_files(file_paths: List[str], workers: int = 1, loader: str = 'stream', sketches: bool = False) -> List[Partial]:
+    """
+    Parse metrics files, serially or in a process pool.
+
+    :param file_paths: file paths (List[str])
+    :param workers: number of worker processes, 1 for a serial run (int)
+    :param loader: 'stream' or 'json', see process_file() (str)
+    :param sketches: also build the per-connection quantile sketches (bool)
+    :return: partial results, in the same order as the file paths (List[Partial]).
+    """
+    parse = partial(process_file, loader=loader, sketches=sketches)
+    if workers <= 1 or len(file_paths) <= 1:
+        return list(map(parse, file_paths))
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as executor:
+        # map() returns the results in submission order, which keeps the merge deterministic
+        return list(executor.map(parse, file_paths))
+
+
+def collect_partials(file_paths: List[str], workers: int = 1, cache: Optional[ConnectionCache] = None,
+                     loader: str = 'stream', sketches: bool = False) -> List[Partial]:
+    """
+    Return the partial results of all metrics files.
+
+    With a cache, only new or changed files are parsed; the partial results of the other files are
+    read from the cache. Cached results without sketches are parsed again when sketches are requested.
+
+    :param file_paths: file paths (List[str])
+    :param workers: number of worker processes, 1 for a serial run (int)
+    :param cache: cache of per-file partial results (Optional[ConnectionCache])
+    :param loader: 'stream' or 'json', see process_file() (str)
+    :param sketches: also build the per-connection quantile sketches (bool)
+    :return: partial results, in the same order as the file paths (List[Partial]).
+    """
+    partials = [cache.lookup(file_path) if cache else None for file_path in file_paths]
+    missing = [i for i, result in enumerate(partials) if result is None or (sketches and result[3] is None)]
+    if cache:
+        print(f'{len(file_paths) - len(missing)} of {len(file_paths)} files found in the cache')
+
+    for i, result in zip(missing, parse_files([file_paths[i] for i in missing], workers=workers, loader=loader, sketches=sketches)):
+        partials[i] = result
+        if cache:
+            cache.store(file_paths[i], result)
+    if cache:
+        cache.save()
+
+    return partials
+
+
+def process_files(file_paths: List[str], workers: int = 1, cache: Optional[ConnectionCache] = None,
+                  loader: str = 'stream', registry: Optional[SiteRegistry] = None) -> dict:
+    """
+    Extract and combine the connections and bandwidths of all metrics files.
+
+    :param file_paths: file paths (List[str])
+    :param workers: number of worker processes, 1 for a serial run (int)
+    :param cache: cache of per-file partial results (Optional[ConnectionCache])
+    :param loader: 'stream' or 'json', see process_file() (str)
+    :param registry: site registry, default: a new one (Optional[SiteRegistry])
+    :return: { connection: [dashb] } (dict).
+    """
+    registry = registry or SiteRegistry()
+    partials = collect_partials(file_paths, workers=workers, cache=cache, loader=loader)
+
+    return merge_partials(file_paths, intern_partials(partials, registry), registry)
+
+
+def build_sketches(partials: List[Interned], registry: SiteRegistry) -> Dict[str, KLLSketch]:
+    """
+    Merge the per-file quantile sketches of each connection, over all bandwidth values of all files.
+
+    The sketches are built when the files are parsed (in the workers, and cached with the other per-file
+    results), and merged here in file order. The per-file sketches are merged in place.
+
+    :param partials: interned partial results, parsed with sketches (List[Interned])
+    :param registry: site registry the partial results were interned with (SiteRegistry)
+    :return: { connection: sketch } (Dict[str, KLLSketch]).
+    """
+    sketches = {}
+    for _, _, file_sketches in partials:
+        merge_sketches(sketches, file_sketches)
+
+    return {registry.connection_name(key): sketch for key, sketch in sketches.items()}
+
+
+def find_input_files(pattern: Optional[str]) -> List[str]:
+    """
+    Return the metrics files to process.
+
+    :param pattern: directory (containing latest*.json files) or glob pattern; None for input_files in ./data (Optional[str])
+    :return: file paths (List[str]).
+    """
+    if not pattern:
+        data_dir = os.path.join(os.getcwd(), 'data')
+        return [os.path.join(data_dir, file_name) for file_name in input_files]
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, 'latest*.json')
+
+    return sorted(glob.glob(pattern))
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Combine the connections and bandwidths from Rucio transfer metrics files.')
+    parser.add_argument('--input', type=str,
+                        help='Directory with latest*.json files, or a glob pattern (default: input_files in ./data).')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1).')
+    parser.add_argument('--output', type=str, default='combined_connections.json', help='Output file (.json, .msgpack or .cbor, optionally .gz or .zst).')
+    parser.add_argument('--pretty', action='store_true', help='Indent the JSON output files.')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help=f'Cache of per-file results (default: {DEFAULT_CACHE_DIR}), see connection_cache.py.')
+    parser.add_argument('--no-cache', action='store_true', help='Parse all files and do not update the cache.')
+    parser.add_argument('--loader', choices=['stream', 'json'], default='stream',
+                        help='Decode one connection at a time (stream) or the whole file at once (json).')
+    parser.add_argument('--store', type=str,
+                        help='Also write the bandwidths as a columnar store, one snapshot per file (e.g. combined_connections.npz).')
+    parser.add_argument('--month-first', nargs='+', default=[], metavar='NAME',
+                        help='Metrics files named latest-MM.DD.YYYY.json, besides the early ones known to the store (see bandwidth_store.py).')
+    parser.add_argument('--sketches', type=str,
+                        help='Also write one quantile sketch per connection (e.g. connection_sketches.json).')
+    parser.add_argument('--registry', type=str, default=DEFAULT_REGISTRY,
+                        help=f'Site registry that keeps the site IDs stable across runs (default: {DEFAULT_REGISTRY}).')
+    add_arguments(parser, 'process_connections')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'process_connections')
+
+    file_paths = find_input_files(args.input)
+    if not file_paths:
+        parser.error(f'no input files found for {args.input}')
+
+    # extract all info; { connection: [dashb] }
+    cache = None if args.no_cache else ConnectionCache(args.cache_dir)
+    with profiler.phase('load'):
+        registry = SiteRegistry.load(args.registry)
+        partials = intern_partials(collect_partials(file_paths, workers=args.workers, cache=cache, loader=args.loader,
+                                                    sketches=bool(args.sketches)), registry)
+        profiler.count('files', len(file_paths))
+        profiler.count('entries', sum(len(entries) for entries, _, _ in partials))
+    with profiler.phase('transform'):
+        all_connections = merge_partials(file_paths, partials, registry)
+        profiler.count('connections', len(all_connections))
+        store = None
+        if args.store:
+            from bandwidth_store import BandwidthStore, MONTH_FIRST_FILES  # requires numpy
+            # input_files is in chronological order, a glob is not
+            store = BandwidthStore.from_partials(file_paths, partials, registry, MONTH_FIRST_FILES.union(args.month_first), ordered=not args.input)
+        sketches = sketches_to_dict(build_sketches(partials, registry)) if args.sketches else None
+
+    empty = 0
+    for connection, bandwidths in all_connections.items():
+        if not bandwidths:
+            empty += 1
 
-        all_connections[connection].append(dashb)
+    print(f'There were {empty} empty connections out of a total of {len(all_connections.keys())}')
+    with profiler.phase('write'):
+        write_dict_to_json(all_connections, args.output, pretty=args.pretty)
+        if store is not None:
+            store.save(args.store)
+        if sketches is not None:
+            write_dict_to_json(sketches, args.sketches, pretty=args.pretty)
+        registry.save(args.registry)
+    profiler.finish()
 
-empty = 0
-# names = []
-for connection, bandwidths in all_connections.items():
-    # print(f'connection={connection} bandwidths={bandwidths}')
-    if not bandwidths:
-        empty += 1
-        # names.append(connection)
 
-print(f'There were {empty} empty connections out of a total of {len(all_connections.keys())}')
-write_dict_to_json(all_connections, 'combined_connections.json')
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Optional instrumentation of the REDWOOD scripts.
+
+Scripts that support it take --profile [REPORT] and mark their phases:
+
+  profiler = Profiler.from_args(args, 'process_connections')
+  with profiler.phase('load'):
+      ...
+      profiler.count('connections', len(connections))
+  profiler.finish()
+
+With --profile, the wall and CPU time of each phase, the peak RSS at its end (and, with --profile-tracemalloc,
+its peak traced Python/NumPy memory), the item counts and the resulting throughput are written to a JSON report.
+--profile-dump FILE also writes a cProfile dump (FILE.prof, for pstats or snakeviz) or sampled stacks in the
+folded format of flamegraph.pl and speedscope (FILE.folded). Without --profile, phase() returns a shared no-op
+context manager and count() returns immediately.
+
+CPU times are those of the whole process, so phases that run concurrently in threads share them; the CPU time of
+worker processes is only included in the totals (cpu_children).
+"""
+
+import argparse
+import cProfile
+import contextlib
+import datetime
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Iterator, List, Optional
+
+from data_io import write_dict_to_json
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+SAMPLE_INTERVAL = 0.005
+_DISABLED = contextlib.nullcontext()
+
+
+def max_rss(who: str = 'self') -> Optional[int]:
+    """
+    Return the peak resident set size of the process or of its finished children.
+
+    :param who: 'self' or 'children' (str)
+    :return: peak RSS in bytes, None if unknown (Optional[int]).
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # kB on Linux, bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+class StackSampler:
+    """Sampling profiler that counts the stacks of all threads, every SAMPLE_INTERVAL seconds of CPU time."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        """
+        Initialize the sampler.
+
+        :param interval: sampling interval in seconds of process CPU time (float).
+        """
+        self.interval = interval
+        self.stacks = Counter()
+
+    def _sample(self, signum: int, frame):
+        """
+        Record the current stack of each thread.
+
+        :param signum: signal number (int)
+        :param frame: interrupted frame (frame).
+        """
+        frames = sys._current_frames()
+        # the handler runs in the main thread, on top of the interrupted frame
+        frames[threading.main_thread().ident] = frame
+        for thread_frame in frames.values():
+            names = []
+            while thread_frame is not None:
+                code = thread_frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                thread_frame = thread_frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        """Start sampling."""
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """Stop sampling."""
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def write(self, file_path: str):
+        """
+        Write the stacks in the folded format, one 'frame;frame;.. count' line per stack.
+
+        :param file_path: file path (str).
+        """
+        with open(file_path, 'w', encoding='utf-8') as folded:
+            for stack, count in self.stacks.most_common():
+                folded.write(f'{stack} {count}\n')
+
+
+class Profiler:
+    """Collects the time, memory and item counts of the phases of a script."""
+
+    def __init__(self, script: str, report: Optional[str] = None, dump: Optional[str] = None, trace_memory: bool = False):
+        """
+        Initialize the profiler; it is disabled unless a report file is given.
+
+        :param script: script name, for the report (str)
+        :param report: JSON report file, None to disable profiling (Optional[str])
+        :param dump: cProfile (.prof) or folded stack (.folded) dump file (Optional[str])
+        :param trace_memory: measure the peak traced memory of each phase with tracemalloc (bool).
+        """
+        self.script = script
+        self.report = report
+        self.dump = dump
+        self.enabled = report is not None
+        self.trace_memory = trace_memory and self.enabled
+        self.phases = []
+        self.counts = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.profile = None
+        self.sampler = None
+        if not self.enabled:
+            return
+
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        if self.trace_memory:
+            tracemalloc.start()
+        if dump and dump.endswith('.folded'):
+            self.sampler = StackSampler()
+            self.sampler.start()
+        elif dump:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, script: str) -> 'Profiler':
+        """
+        Create a profiler from the options added by add_arguments().
+
+        :param args: parsed arguments (argparse.Namespace)
+        :param script: script name (str)
+        :return: profiler (Profiler).
+        """
+        return cls(script, args.profile, args.profile_dump, args.profile_tracemalloc)
+
+    def _stack(self) -> List[dict]:
+        """
+        Return the open phases of the current thread.
+
+        :return: phase records, innermost last (List[dict]).
+        """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        return stack
+
+    def phase(self, name: str):
+        """
+        Return a context manager that records a phase; phases can be nested.
+
+        :param name: phase name, e.g. 'load', 'transform' or 'write' (str)
+        :return: context manager (ContextManager).
+        """
+        if not self.enabled:
+            return _DISABLED
+
+        return self._phase(name)
+
+    @contextlib.contextmanager
+    def _phase(self, name: str) -> Iterator[dict]:
+        """
+        Record a phase.
+
+        :param name: phase name (str)
+        :return: phase record (Iterator[dict]).
+        """
+        stack = self._stack()
+        record = {'name': '/'.join([parent['name'] for parent in stack[-1:]] + [name]), 'counts': {}}
+        stack.append(record)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            record['tracemalloc_peak'] = 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        record['start'] = wall - self.wall
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            record['max_rss'] = max_rss()
+            if self.trace_memory:
+                # a nested phase resets the peak, so include the peaks of the nested phases
+                record['tracemalloc_peak'] = max(record['tracemalloc_peak'], tracemalloc.get_traced_memory()[1])
+            stack.pop()
+            if self.trace_memory and stack:
+                stack[-1]['tracemalloc_peak'] = max(stack[-1]['tracemalloc_peak'], record['tracemalloc_peak'])
+            with self.lock:
+                self.phases.append(record)
+
+    def count(self, name: str, value: int):
+        """
+        Add to an item count of the current phase (and of the whole run).
+
+        :param name: item name, e.g. 'connections', 'queues' or 'hosts' (str)
+        :param value: number of items (int).
+        """
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1]['counts'][name] = stack[-1]['counts'].get(name, 0) + value
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self) -> Optional[dict]:
+        """
+        Stop profiling and write the report (and the dump).
+
+        :return: report, None if profiling is disabled (Optional[dict]).
+        """
+        if not self.enabled:
+            return None
+        wall = time.perf_counter() - self.wall
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.dump)
+        if self.sampler:
+            self.sampler.stop()
+            self.sampler.write(self.dump)
+        report = {
+            'script': self.script,
+            'argv': sys.argv[1:],
+            'started': self.started,
+            'wall': wall,
+            'cpu': time.process_time() - self.cpu,
+            'cpu_children': sum(os.times()[2:4]),
+            'max_rss': max_rss(),
+            'max_rss_children': max_rss('children'),
+            'counts': self.counts,
+            'throughput': {key: value / wall for key, value in self.counts.items() if wall > 0},
+            'phases': merge_phases(self.phases),
+        }
+        if self.trace_memory:
+            report['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        write_dict_to_json(report, self.report, pretty=True, quiet=True)
+        for line in summarize(report):
+            print(line)
+        print(f'profile written to {self.report}' + (f' and {self.dump}' if self.dump else ''))
+        self.enabled = False
+
+        return report
+
+
+def merge_phases(records: List[dict]) -> List[dict]:
+    """
+    Merge the records of phases with the same name, and add their throughput.
+
+    :param records: phase records (List[dict])
+    :return: one record per phase name, nested phases after their parents, in the order of their first start (List[dict]).
+    """
+    merged = {}
+    for record in sorted(records, key=lambda record: record['start']):
+        total = merged.get(record['name'])
+        if total is None:
+            merged[record['name']] = dict(record, calls=1, counts=dict(record['counts']))
+            continue
+        total['calls'] += 1
+        for key in ('wall', 'cpu'):
+            total[key] += record[key]
+        for key in ('max_rss', 'tracemalloc_peak'):
+            if record.get(key) is not None:
+                total[key] = max(total[key], record[key])
+        for key, value in record['counts'].items():
+            total['counts'][key] = total['counts'].get(key, 0) + value
+    for total in merged.values():
+        total['throughput'] = {key: value / total['wall'] for key, value in total['counts'].items() if total['wall'] > 0}
+
+    def order(total: dict) -> tuple:
+        names = total['name'].split('/')
+        return tuple(merged['/'.join(names[:depth])]['start'] if '/'.join(names[:depth]) in merged else total['start']
+                     for depth in range(1, len(names) + 1))
+
+    return sorted(merged.values(), key=order)
+
+
+def add_arguments(parser: argparse.ArgumentParser, script: str):
+    """
+    Add the profiling options to the argument parser of a script.
+
+    :param parser: argument parser (argparse.ArgumentParser)
+    :param script: script name, for the default report name (str).
+    """
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', nargs='?', const=f'{script}_profile.json', metavar='REPORT',
+                       help=f'Write a JSON report with the time, memory and item counts per phase (default: {script}_profile.json).')
+    group.add_argument('--profile-dump', type=str, metavar='FILE',
+                       help='With --profile, also write a cProfile dump (.prof) or sampled stacks for flame graphs (.folded).')
+    group.add_argument('--profile-tracemalloc', action='store_true',
+                       help='With --profile, also measure the peak traced memory of each phase (slower).')
+
+
+def summarize(report: Dict) -> List[str]:
+    """
+    Format the phases of a report as lines of a table.
+
+    :param report: report from Profiler.finish() (Dict)
+    :return: lines (List[str]).
+    """
+    lines = [f'{"phase":30s} {"wall (s)":>10s} {"cpu (s)":>10s} {"rss (MB)":>10s}  counts']
+    for record in report['phases']:
+        rss = record['max_rss'] / 1e6 if record['max_rss'] else float('nan')
+        counts = ', '.join(f'{key}={value}' for key, value in record['counts'].items())
+        lines.append(f'{record["name"]:30s} {record["wall"]:10.3f} {record["cpu"]:10.3f} {rss:10.1f}  {counts}')
+
+    return lines
@@ -0,0 +1,284 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Mergeable quantile sketches for connection bandwidths.
+
+KLLSketch is a KLL sketch (Karnin, Lang, Liberty, 2016) with deterministic compaction: values are kept in a
+hierarchy of compactors, and a full compactor promotes every other sorted value to the next level, where it
+counts twice. The memory usage is O(k) regardless of the number of values, the sketch is exact as long as
+fewer than about k values have been added, and two sketches are merged by concatenating their compactors.
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Union
+
+DEFAULT_K = 200
+QUANTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+class KLLSketch:
+    """Quantile sketch with bounded memory that can be merged with other sketches."""
+
+    def __init__(self, k: int = DEFAULT_K, c: float = 2 / 3):
+        """
+        Initialize an empty sketch.
+
+        :param k: capacity of the top compactor; larger is more accurate (int)
+        :param c: capacity ratio between two consecutive compactors (float).
+        """
+        self.k = k
+        self.c = c
+        self.compactors = [[]]
+        self.offsets = [0]
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.size = 0
+        self.max_size = self._capacity(0)
+
+    def _capacity(self, height: int) -> int:
+        """
+        Return the capacity of the compactor at the given height.
+
+        :param height: compactor height, 0 for the bottom (int)
+        :return: capacity (int).
+        """
+        depth = len(self.compactors) - height - 1
+
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _grow(self):
+        """Add a compactor on top."""
+        self.compactors.append([])
+        self.offsets.append(0)
+        self.max_size = sum(self._capacity(height) for height in range(len(self.compactors)))
+
+    def _compress(self):
+        """Compact full compactors until the sketch fits its maximum size again."""
+        for height in range(len(self.compactors)):
+            if len(self.compactors[height]) < self._capacity(height):
+                continue
+            if height + 1 >= len(self.compactors):
+                self._grow()
+            items = sorted(self.compactors[height])
+            # an odd item out stays at this level
+            keep = items[:len(items) % 2]
+            # alternate between promoting the odd and even positions, which keeps the error unbiased
+            offset = self.offsets[height]
+            self.offsets[height] = 1 - offset
+            self.compactors[height + 1].extend(items[len(keep) + offset::2])
+            self.compactors[height] = keep
+            self.size = sum(len(compactor) for compactor in self.compactors)
+            if self.size < self.max_size:
+                break
+
+    def update(self, value: float):
+        """
+        Add a value.
+
+        :param value: value (float).
+        """
+        self.compactors[0].append(value)
+        self.count += 1
+        self.size += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self.size >= self.max_size:
+            self._compress()
+
+    def extend(self, values: Iterable[float]):
+        """
+        Add several values.
+
+        :param values: values (Iterable[float]).
+        """
+        for value in values:
+            self.update(value)
+
+    def merge(self, other: 'KLLSketch'):
+        """
+        Merge another sketch into this one.
+
+        :param other: sketch to merge (KLLSketch).
+        """
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.size = sum(len(compactor) for compactor in self.compactors)
+        while self.size >= self.max_size:
+            self._compress()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Return the (approximate) q-quantile, the smallest value whose rank is at least q * count.
+
+        :param q: quantile, 0-1 (float)
+        :return: value, None for an empty sketch (Optional[float]).
+        """
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        weighted = sorted((value, 1 << height) for height, compactor in enumerate(self.compactors) for value in compactor)
+        total = sum(weight for _, weight in weighted)
+        threshold = q * total
+        rank = 0
+        for value, weight in weighted:
+            rank += weight
+            if rank >= threshold:
+                return value
+
+        return self.max
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the sketch.
+
+        :return: JSON serializable dictionary (dict).
+        """
+        return {
+            'k': self.k,
+            'c': self.c,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'offsets': self.offsets,
+            'compactors': self.compactors,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'KLLSketch':
+        """
+        Deserialize a sketch created with to_dict().
+
+        :param data: serialized sketch (dict)
+        :return: sketch (KLLSketch).
+        """
+        sketch = cls(data['k'], data['c'])
+        sketch.compactors = [list(compactor) for compactor in data['compactors']]
+        sketch.offsets = list(data['offsets'])
+        sketch.count = data['count']
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        sketch.size = sum(len(compactor) for compactor in sketch.compactors)
+        sketch.max_size = sum(sketch._capacity(height) for height in range(len(sketch.compactors)))
+
+        return sketch
+
+
+def sketch_dashb(entries: Iterable[tuple], resolutions: Iterable[str] = ('1h', '1d', '1w'), k: int = DEFAULT_K) -> Dict[Union[str, int], KLLSketch]:
+    """
+    Build one sketch per connection from (connection, dashb) entries.
+
+    All available resolutions of a dashb entry are added to the sketch of its connection.
+
+    :param entries: (connection name or key, dashb or None) entries (Iterable[tuple])
+    :param resolutions: dashb keys to add (Iterable[str])
+    :param k: sketch size parameter (int)
+    :return: { connection: sketch } (Dict[Union[str, int], KLLSketch]).
+    """
+    resolutions = tuple(resolutions)
+    sketches = {}
+    for connection, dashb in entries:
+        if not dashb:
+            continue
+        sketch = sketches.get(connection)
+        if sketch is None:
+            sketch = sketches[connection] = KLLSketch(k)
+        for key in resolutions:
+            value = dashb.get(key)
+            if value is not None:
+                sketch.update(value)
+
+    return sketches
+
+
+def merge_sketches(sketches: Dict[Union[str, int], KLLSketch], others: Dict[Union[str, int], KLLSketch]):
+    """
+    Merge per-connection sketches into another set of per-connection sketches, in place.
+
+    :param sketches: sketches to merge into (Dict[Union[str, int], KLLSketch])
+    :param others: sketches to merge (Dict[Union[str, int], KLLSketch]).
+    """
+    for connection, other in others.items():
+        sketch = sketches.get(connection)
+        if sketch is None:
+            sketches[connection] = other
+        else:
+            sketch.merge(other)
+
+
+def summarize(sketch: KLLSketch, quantiles: Optional[Dict[str, float]] = None) -> Dict[str, Optional[float]]:
+    """
+    Return the named quantiles and the maximum of a sketch.
+
+    :param sketch: sketch (KLLSketch)
+    :param quantiles: { name: quantile }, default: p50, p90 and p99 (Optional[Dict[str, float]])
+    :return: { name: value } including 'max' (Dict[str, Optional[float]]).
+    """
+    summary = {name: sketch.quantile(q) for name, q in (quantiles or QUANTILES).items()}
+    summary['max'] = sketch.max if sketch.count else None
+
+    return summary
+
+
+def sketches_to_dict(sketches: Dict[str, KLLSketch]) -> Dict[str, dict]:
+    """
+    Serialize per-connection sketches.
+
+    :param sketches: { connection: sketch } (Dict[str, KLLSketch])
+    :return: { connection: serialized sketch } (Dict[str, dict]).
+    """
+    return {connection: sketch.to_dict() for connection, sketch in sketches.items()}
+
+
+def sketches_from_dict(data: Dict[str, dict]) -> Dict[str, KLLSketch]:
+    """
+    Deserialize per-connection sketches.
+
+    :param data: { connection: serialized sketch } (Dict[str, dict])
+    :return: { connection: sketch } (Dict[str, KLLSketch]).
+    """
+    return {connection: KLLSketch.from_dict(sketch) for connection, sketch in data.items()}
+
+
+def exact_quantile(values: List[float], q: float) -> float:
+    """
+    Return the exact q-quantile with the same definition as KLLSketch.quantile().
+
+    :param values: values (List[float])
+    :param q: quantile, 0-1 (float)
+    :return: value (float).
+    """
+    ordered = sorted(values)
+    index = max(0, math.ceil(q * len(ordered)) - 1)
+
+    return ordered[min(index, len(ordered) - 1)]
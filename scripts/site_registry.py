@@ -0,0 +1,215 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Site-name interning for connections.
+
+A SiteRegistry assigns each site name a small integer ID, and a connection "A:B" is represented by the packed
+integer (ID of A << 32) | ID of B. Connection strings are split only the first time they are seen; the
+self-connection and UNKNOWN filters then become integer comparisons.
+
+The registry only grows, so IDs never change once assigned. It is saved to site_registry.json (see
+process_connections.py), and loading it at the start of a run keeps the IDs stable across runs, so stores and
+other artifacts that refer to sites by ID stay valid. UNKNOWN always has ID 0.
+"""
+
+import argparse
+import os
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from data_io import read_json_to_dict, write_dict_to_json
+
+REGISTRY_VERSION = 1
+DEFAULT_REGISTRY = 'site_registry.json'
+UNKNOWN = 'UNKNOWN'
+UNKNOWN_ID = 0
+SITE_BITS = 32
+SITE_MASK = (1 << SITE_BITS) - 1
+
+
+def pack(source: int, destination: int) -> int:
+    """
+    Return the key of a connection.
+
+    :param source: source site ID (int)
+    :param destination: destination site ID (int)
+    :return: (source << 32) | destination (int).
+    """
+    return (source << SITE_BITS) | destination
+
+
+def unpack(key: int) -> Tuple[int, int]:
+    """
+    Return the site IDs of a connection key.
+
+    :param key: connection key (int)
+    :return: source and destination site IDs (Tuple[int, int]).
+    """
+    return key >> SITE_BITS, key & SITE_MASK
+
+
+def is_valid(key: int) -> bool:
+    """
+    Tell whether a connection is kept: not a self-connection, and not to or from UNKNOWN.
+
+    :param key: connection key (int)
+    :return: True if the connection is kept (bool).
+    """
+    source, destination = key >> SITE_BITS, key & SITE_MASK
+
+    return source != destination and source != UNKNOWN_ID and destination != UNKNOWN_ID
+
+
+class SiteRegistry:
+    """Append-only mapping between site names and integer IDs."""
+
+    def __init__(self, sites: Optional[Sequence[str]] = None):
+        """
+        Initialize the registry.
+
+        :param sites: site names in ID order, starting with UNKNOWN (Optional[Sequence[str]])
+        :raises ValueError: if the first site is not UNKNOWN.
+        """
+        self.sites = list(sites) if sites else [UNKNOWN]
+        if self.sites[0] != UNKNOWN:
+            raise ValueError(f'site ID {UNKNOWN_ID} must be {UNKNOWN}, not {self.sites[0]}')
+        self.ids = {site: site_id for site_id, site in enumerate(self.sites)}
+        self.keys = {}
+
+    def __len__(self) -> int:
+        """
+        Return the number of sites.
+
+        :return: number of sites, including UNKNOWN (int).
+        """
+        return len(self.sites)
+
+    def intern(self, site: str) -> int:
+        """
+        Return the ID of a site, assigning the next free ID to a new site.
+
+        :param site: site name (str)
+        :return: site ID (int).
+        """
+        site_id = self.ids.get(site)
+        if site_id is None:
+            site_id = self.ids[site] = len(self.sites)
+            self.sites.append(site)
+
+        return site_id
+
+    def connection_key(self, connection: str) -> int:
+        """
+        Return the key of a connection name, "A:B".
+
+        Only the first two fields of the name are used, as in the rest of the scripts.
+
+        :param connection: connection name (str)
+        :return: connection key (int).
+        """
+        key = self.keys.get(connection)
+        if key is None:
+            fields = connection.split(':')
+            destination = fields[1] if len(fields) > 1 else UNKNOWN
+            key = self.keys[connection] = pack(self.intern(fields[0]), self.intern(destination))
+
+        return key
+
+    def connection_name(self, key: int) -> str:
+        """
+        Return the name of a connection key, "A:B".
+
+        :param key: connection key (int)
+        :return: connection name (str).
+        """
+        return f'{self.sites[key >> SITE_BITS]}:{self.sites[key & SITE_MASK]}'
+
+    def remap(self, sites: Sequence[str]) -> List[int]:
+        """
+        Return the IDs in this registry of the sites of another registry, interning the new ones.
+
+        :param sites: site names in the ID order of the other registry (Sequence[str])
+        :return: IDs in this registry, indexed by the IDs of the other registry (List[int]).
+        """
+        return [self.intern(site) for site in sites]
+
+    def translate(self, sites: Sequence[str], keys: Iterable[int]) -> List[int]:
+        """
+        Convert connection keys of another registry to keys of this registry.
+
+        :param sites: site names of the other registry, in ID order (Sequence[str])
+        :param keys: connection keys of the other registry (Iterable[int])
+        :return: connection keys of this registry (List[int]).
+        """
+        ids = self.remap(sites)
+
+        return [(ids[key >> SITE_BITS] << SITE_BITS) | ids[key & SITE_MASK] for key in keys]
+
+    def to_dict(self) -> dict:
+        """
+        Return the registry in the site_registry.json layout.
+
+        :return: { 'version': .., 'sites': [site] } (dict).
+        """
+        return {'version': REGISTRY_VERSION, 'sites': self.sites}
+
+    def save(self, file_path: str = DEFAULT_REGISTRY):
+        """
+        Write the registry.
+
+        :param file_path: file path (str).
+        """
+        tmp_path = f'{file_path}.tmp'
+        write_dict_to_json(self.to_dict(), tmp_path, quiet=True)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: str = DEFAULT_REGISTRY) -> 'SiteRegistry':
+        """
+        Read a registry, or start a new one if the file does not exist.
+
+        :param file_path: file path (str)
+        :return: registry (SiteRegistry)
+        :raises ValueError: for a registry with another version.
+        """
+        if not os.path.exists(file_path):
+            return cls()
+        data = read_json_to_dict(file_path)
+        if data.get('version') != REGISTRY_VERSION:
+            raise ValueError(f'{file_path} has version {data.get("version")}, expected {REGISTRY_VERSION}')
+
+        return cls(data['sites'])
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Show the site IDs of a site registry.')
+    parser.add_argument('--registry', type=str, default=DEFAULT_REGISTRY, help=f'Registry file (default: {DEFAULT_REGISTRY}).')
+    parser.add_argument('sites', nargs='*', help='Sites to look up (default: all).')
+    args = parser.parse_args()
+
+    registry = SiteRegistry.load(args.registry)
+    for site in args.sites or registry.sites:
+        print(f'{registry.ids.get(site, "-")}\t{site}')
+    print(f'{len(registry)} sites in {args.registry}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+
+"""
+Select a representative subset of the queues and generate a reduced platform from it.
+
+Full-scale platforms with all queues and every measured site pair are slow to simulate, and simply keeping the
+first N queues skews the results. The N queues are selected from queues-corepower_based.json and
+max_connections.json with heap-based top-k selection, by one of the strategies:
+
+  gflops      the N queues with the largest GFLOPS
+  stratified  the queues are put in capacity buckets (equal width in log GFLOPS), each bucket gets a share of the
+              N queues proportional to its number of queues, and the best-connected queues of each bucket are kept
+  connected   greedy best-connected subgraph: starting from the queue whose RSEs have the largest total
+              bandwidth, the queue with the most bandwidth to the RSEs selected so far is added next
+
+By default the GFLOPS of the selected queues are scaled so that their total equals the capacity of the full set.
+The reduced platform is written with generate_xml.py, and a report compares the GFLOPS and bandwidth
+distributions of the subset with the full set (quantiles and the Kolmogorov-Smirnov distance).
+"""
+
+import argparse
+import heapq
+import math
+from typing import Dict, List, Sequence, Set
+
+import numpy as np
+
+from data_io import read_json_to_dict, write_dict_to_json
+from generate_xml import generate_xml_from_data, get_rses
+from profiling import Profiler, add_arguments
+
+STRATEGIES = ('gflops', 'stratified', 'connected')
+BUCKETS = 5
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def usable_queues(queues: dict) -> Dict[str, dict]:
+    """
+    Return the queues that get a host in a platform, i.e. with GFLOPS and RSE(s).
+
+    :param queues: queue info from queues-corepower_based.json (dict)
+    :return: { queue: info } (Dict[str, dict]).
+    """
+    return {queue: info for queue, info in queues.items() if info.get('GFLOPS') and get_rses(info)}
+
+
+def site_links(connections: Dict[str, float], sites: Set[str]) -> Dict[str, Dict[str, float]]:
+    """
+    Index the measured bandwidths between the given sites, in both directions.
+
+    :param connections: bandwidths per "A:B" connection, from max_connections.json (Dict[str, float])
+    :param sites: sites to keep (Set[str])
+    :return: { site: { other site: bandwidth } }, the larger bandwidth of A:B and B:A (Dict[str, Dict[str, float]]).
+    """
+    links = {}
+    for connection, bandwidth in connections.items():
+        site1, _, site2 = connection.partition(':')
+        if site1 == site2 or site1 not in sites or site2 not in sites or not bandwidth:
+            continue
+        if bandwidth > links.get(site1, {}).get(site2, 0):
+            links.setdefault(site1, {})[site2] = bandwidth
+            links.setdefault(site2, {})[site1] = bandwidth
+
+    return links
+
+
+def queue_strengths(queues: Dict[str, dict], links: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """
+    Return the total bandwidth of the links of the RSEs of each queue.
+
+    :param queues: queue info (Dict[str, dict])
+    :param links: links from site_links() (Dict[str, Dict[str, float]])
+    :return: { queue: bandwidth } (Dict[str, float]).
+    """
+    site_strength = {site: sum(others.values()) for site, others in links.items()}
+
+    return {queue: sum(site_strength.get(rse, 0.0) for rse in get_rses(info)) for queue, info in queues.items()}
+
+
+def select_gflops(queues: Dict[str, dict], count: int) -> List[str]:
+    """
+    Select the queues with the largest GFLOPS.
+
+    :param queues: queue info (Dict[str, dict])
+    :param count: number of queues (int)
+    :return: selected queues (List[str]).
+    """
+    return heapq.nlargest(count, queues, key=lambda queue: queues[queue]['GFLOPS'])
+
+
+def select_stratified(queues: Dict[str, dict], count: int, strengths: Dict[str, float], buckets: int = BUCKETS) -> List[str]:
+    """
+    Select queues from capacity buckets, proportionally to the number of queues per bucket.
+
+    The buckets have equal widths in log GFLOPS; the shares are rounded with the largest remainder method, and the
+    best-connected queues (then the largest) of each bucket are selected.
+
+    :param queues: queue info (Dict[str, dict])
+    :param count: number of queues (int)
+    :param strengths: total bandwidth per queue, from queue_strengths() (Dict[str, float])
+    :param buckets: number of capacity buckets (int)
+    :return: selected queues (List[str]).
+    """
+    if count >= len(queues):
+        return list(queues)
+    logs = {queue: math.log(queues[queue]['GFLOPS']) for queue in queues}
+    low, high = min(logs.values()), max(logs.values())
+    width = (high - low) / buckets or 1.0
+    members = [[] for _ in range(buckets)]
+    for queue, value in logs.items():
+        members[min(int((value - low) / width), buckets - 1)].append(queue)
+
+    shares = [count * len(bucket) / len(queues) for bucket in members]
+    allocation = [int(share) for share in shares]
+    for index in sorted(range(buckets), key=lambda index: shares[index] - allocation[index], reverse=True)[:count - sum(allocation)]:
+        allocation[index] += 1
+
+    selected = []
+    for bucket, size in zip(members, allocation):
+        selected.extend(heapq.nlargest(size, bucket, key=lambda queue: (strengths[queue], queues[queue]['GFLOPS'])))
+
+    return selected
+
+
+def select_connected(queues: Dict[str, dict], count: int, links: Dict[str, Dict[str, float]], strengths: Dict[str, float]) -> List[str]:
+    """
+    Select a best-connected subgraph greedily.
+
+    The gain of a queue is the total bandwidth between its RSEs and the RSEs of the queues selected so far. Gains
+    only grow, so every update pushes a new heap entry and outdated entries are skipped when popped. When no
+    remaining queue is connected to the selection, the largest one is added.
+
+    :param queues: queue info (Dict[str, dict])
+    :param count: number of queues (int)
+    :param links: links from site_links() (Dict[str, Dict[str, float]])
+    :param strengths: total bandwidth per queue, from queue_strengths() (Dict[str, float])
+    :return: selected queues (List[str]).
+    """
+    rses = {queue: get_rses(info) for queue, info in queues.items()}
+    queues_by_rse = {}
+    for queue, queue_rses in rses.items():
+        for rse in queue_rses:
+            queues_by_rse.setdefault(rse, []).append(queue)
+
+    gains = dict.fromkeys(queues, 0.0)
+    heap = [(0.0, -queues[queue]['GFLOPS'], queue) for queue in queues]
+    heapq.heapify(heap)
+    selected = []
+    chosen = set()
+    covered = set()
+
+    def add(queue: str):
+        selected.append(queue)
+        chosen.add(queue)
+        for rse in rses[queue]:
+            if rse in covered:
+                continue
+            covered.add(rse)
+            for site, bandwidth in links.get(rse, {}).items():
+                for other in queues_by_rse.get(site, ()):
+                    if other not in chosen:
+                        gains[other] += bandwidth
+                        heapq.heappush(heap, (-gains[other], -queues[other]['GFLOPS'], other))
+
+    if queues and count:
+        add(max(queues, key=lambda queue: (strengths[queue], queues[queue]['GFLOPS'])))
+    while len(selected) < min(count, len(queues)):
+        gain, _, queue = heapq.heappop(heap)
+        if queue not in chosen and -gain == gains[queue]:
+            add(queue)
+
+    return selected
+
+
+def quantiles(values: Sequence[float]) -> dict:
+    """
+    Summarize a distribution.
+
+    :param values: values (Sequence[float])
+    :return: { 'count', 'total', 'mean', 'q10', 'q50', 'q90' } (dict).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
+        return {'count': 0}
+    summary = {'count': int(values.size), 'total': float(values.sum()), 'mean': float(values.mean())}
+    summary.update({f'q{round(100 * q)}': float(value) for q, value in zip(QUANTILES, np.quantile(values, QUANTILES))})
+
+    return summary
+
+
+def ks_distance(sample: Sequence[float], reference: Sequence[float]) -> float:
+    """
+    Return the Kolmogorov-Smirnov distance, the largest difference between the empirical CDFs of two samples.
+
+    :param sample: values (Sequence[float])
+    :param reference: values (Sequence[float])
+    :return: distance between 0 and 1, NaN for an empty sample (float).
+    """
+    sample = np.sort(np.asarray(sample, dtype=np.float64))
+    reference = np.sort(np.asarray(reference, dtype=np.float64))
+    if not sample.size or not reference.size:
+        return float('nan')
+    points = np.concatenate([sample, reference])
+    cdf1 = np.searchsorted(sample, points, side='right') / sample.size
+    cdf2 = np.searchsorted(reference, points, side='right') / reference.size
+
+    return float(np.abs(cdf1 - cdf2).max())
+
+
+def link_bandwidths(links: Dict[str, Dict[str, float]], sites: Set[str]) -> List[float]:
+    """
+    Return the bandwidths of the links between the given sites, once per site pair.
+
+    :param links: links from site_links() (Dict[str, Dict[str, float]])
+    :param sites: sites (Set[str])
+    :return: bandwidths (List[float]).
+    """
+    return [bandwidth for site in sites for other, bandwidth in links.get(site, {}).items() if other in sites and site < other]
+
+
+def drift_report(queues: Dict[str, dict], selected: List[str], links: Dict[str, Dict[str, float]], scale: float) -> dict:
+    """
+    Compare the selected queues with the full set.
+
+    :param queues: queue info of the full set (Dict[str, dict])
+    :param selected: selected queues (List[str])
+    :param links: links between the RSEs of the full set (Dict[str, Dict[str, float]])
+    :param scale: factor applied to the GFLOPS of the selected queues (float)
+    :return: report (dict).
+    """
+    full_gflops = [queues[queue]['GFLOPS'] for queue in queues]
+    selected_gflops = [queues[queue]['GFLOPS'] for queue in selected]
+    full_sites = {rse for info in queues.values() for rse in get_rses(info)}
+    selected_sites = {rse for queue in selected for rse in get_rses(queues[queue])}
+    full_bandwidths = link_bandwidths(links, full_sites)
+    selected_bandwidths = link_bandwidths(links, selected_sites)
+
+    return {
+        'queues': {'full': len(queues), 'selected': len(selected)},
+        'capacity': {'full': float(sum(full_gflops)), 'selected': float(sum(selected_gflops)),
+                     'fraction': float(sum(selected_gflops) / sum(full_gflops)) if full_gflops else 0.0, 'scale': scale},
+        'gflops': {'full': quantiles(full_gflops), 'selected': quantiles(selected_gflops),
+                   'ks_distance': ks_distance(selected_gflops, full_gflops)},
+        'rses': {'full': len(full_sites), 'selected': len(selected_sites)},
+        'bandwidth': {'full': quantiles(full_bandwidths), 'selected': quantiles(selected_bandwidths),
+                      'ks_distance': ks_distance(selected_bandwidths, full_bandwidths)},
+    }
+
+
+def select(queues: Dict[str, dict], connections: Dict[str, float], count: int, strategy: str = 'stratified',
+           buckets: int = BUCKETS) -> List[str]:
+    """
+    Select `count` queues with one of the STRATEGIES.
+
+    :param queues: queue info, from usable_queues() (Dict[str, dict])
+    :param connections: bandwidths per "A:B" connection, from max_connections.json (Dict[str, float])
+    :param count: number of queues (int)
+    :param strategy: one of STRATEGIES (str)
+    :param buckets: number of capacity buckets for 'stratified' (int)
+    :raises ValueError: for an unknown strategy
+    :return: selected queues (List[str]).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f'unknown strategy: {strategy}')
+    if strategy == 'gflops':
+        return select_gflops(queues, count)
+    links = site_links(connections, {rse for info in queues.values() for rse in get_rses(info)})
+    strengths = queue_strengths(queues, links)
+    if strategy == 'stratified':
+        return select_stratified(queues, count, strengths, buckets)
+
+    return select_connected(queues, count, links, strengths)
+
+
+def print_report(report: dict):
+    """
+    Print the drift report.
+
+    :param report: report from drift_report() (dict).
+    """
+    capacity = report['capacity']
+    print(f"selected {report['queues']['selected']} of {report['queues']['full']} queues, "
+          f"{report['rses']['selected']} of {report['rses']['full']} RSEs")
+    print(f"capacity: {capacity['selected']:.0f} of {capacity['full']:.0f} GFLOPS ({100 * capacity['fraction']:.1f}%), "
+          f"scaled by {capacity['scale']:.3f}")
+    for name in ('gflops', 'bandwidth'):
+        full, selected = report[name]['full'], report[name]['selected']
+        if not full.get('count') or not selected.get('count'):
+            print(f'{name}: {selected.get("count", 0)} of {full.get("count", 0)} values')
+            continue
+        values = '  '.join(f'{key} {selected[key]:.6g} (full {full[key]:.6g})' for key in ('mean', 'q10', 'q50', 'q90'))
+        print(f"{name}: {values}  KS distance {report[name]['ks_distance']:.3f}")
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Select a representative subset of the queues and generate a reduced platform.')
+    parser.add_argument('--count', '-n', type=int, required=True, help='Number of queues to select.')
+    parser.add_argument('--strategy', choices=STRATEGIES, default='stratified', help='Selection strategy (default: stratified).')
+    parser.add_argument('--buckets', type=int, default=BUCKETS, help=f'Capacity buckets for --strategy stratified (default: {BUCKETS}).')
+    parser.add_argument('--queues', type=str, default='queues-corepower_based.json', help='Queue info (default: queues-corepower_based.json).')
+    parser.add_argument('--connections', type=str, default='max_connections.json', help='Measured bandwidths (default: max_connections.json).')
+    parser.add_argument('--output-queues', type=str, default='queues-subset.json', help='Selected queues (default: queues-subset.json).')
+    parser.add_argument('--filename', type=str, default='platform-subset.xml', help='Reduced platform (default: platform-subset.xml).')
+    parser.add_argument('--report', type=str, default='subset_report.json', help='Drift report (default: subset_report.json).')
+    parser.add_argument('--no-rescale', action='store_true', help='Keep the GFLOPS of the selected queues instead of scaling them to the full capacity.')
+    parser.add_argument('--fill-missing', action='store_true', help='Route RSE pairs without a measured connection over their widest path.')
+    add_arguments(parser, 'subset_platform')
+    args = parser.parse_args()
+    if args.count < 1 or args.buckets < 1:
+        parser.error('--count and --buckets must be positive')
+    profiler = Profiler.from_args(args, 'subset_platform')
+
+    with profiler.phase('load'):
+        queues = usable_queues(read_json_to_dict(args.queues))
+        connections = read_json_to_dict(args.connections)
+        profiler.count('queues', len(queues))
+        profiler.count('connections', len(connections))
+
+    with profiler.phase('transform'):
+        selected = select(queues, connections, args.count, strategy=args.strategy, buckets=args.buckets)
+        selected_capacity = sum(queues[queue]['GFLOPS'] for queue in selected)
+        scale = 1.0 if args.no_rescale or not selected_capacity else sum(info['GFLOPS'] for info in queues.values()) / selected_capacity
+        subset = {queue: dict(queues[queue], GFLOPS=round(queues[queue]['GFLOPS'] * scale)) for queue in selected}
+        links = site_links(connections, {rse for info in queues.values() for rse in get_rses(info)})
+        report = dict(strategy=args.strategy, **drift_report(queues, selected, links, scale))
+    print_report(report)
+
+    with profiler.phase('write'):
+        write_dict_to_json(subset, args.output_queues)
+        generate_xml_from_data(args.filename, subset, connections, fill_missing=args.fill_missing)
+        print(f'wrote {args.filename}')
+        write_dict_to_json(report, args.report)
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Seeded synthetic versions of the REDWOOD input files.
+
+The real inputs (Rucio transfer metrics, Grafana exports, corepower and corecount dumps, WRENCH output) are not
+part of the repository. The generators below produce files with the same key structure as the scripts expect,
+at any size and reproducibly for a given seed, for benchmarks (see benchmark.py) and for trying out the scripts:
+
+  Rucio metrics         { "A:B": { "mbps": { "dashb": { "1h": .., "1d": .., "1w": .. } }, "files": {..} } },
+                        including self-connections, UNKNOWN sites and connections without mbps or dashb info
+  Grafana CSV           UTF-8 with BOM, a quoted "Time" column and one column of job slot counts per queue
+  corepower.json        { queue: { "corepower": .. } }
+  queue_corecount.json  { queue: number of cores }
+  queues_and_rses.json  { queue: { "RSE": .. } }, a single RSE or a list
+  WRENCH output         { "workflow_execution": { "tasks": [ { "task_id", "execution_host": { "hostname", .. },
+                        "num_cores_allocated", "whole_task": { "start", "end" }, "compute": { "start", "end" }, .. } ] } }
+
+Usage: python synthetic_data.py [--outdir <directory>] [--connections <number>] [--snapshots <number>] [--queues <number>]
+       [--rows <number>] [--tasks <number>] [--seed <number>]
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import random
+from typing import Dict, List, Optional
+
+from data_io import write_dict_to_json
+
+DEFAULT_SEED = 1
+RESOLUTIONS = ('1h', '1d', '1w')
+
+
+def site_names(n_sites: int) -> List[str]:
+    """
+    Return RSE-like site names.
+
+    :param n_sites: number of sites (int)
+    :return: site names (List[str]).
+    """
+    return [f'SITE{i:05d}_DATADISK' for i in range(n_sites)]
+
+
+def queue_names(n_queues: int) -> List[str]:
+    """
+    Return PanDA queue-like names.
+
+    :param n_queues: number of queues (int)
+    :return: queue names (List[str]).
+    """
+    return [f'QUEUE{i:05d}' for i in range(n_queues)]
+
+
+def sites_for_connections(n_connections: int) -> int:
+    """
+    Return a number of sites for which n_connections is a plausible fraction of all site pairs.
+
+    :param n_connections: number of connections (int)
+    :return: number of sites (int).
+    """
+    return max(4, int((2 * n_connections) ** 0.5) + 2)
+
+
+def rucio_metrics(n_connections: int, n_sites: Optional[int] = None, seed: int = DEFAULT_SEED) -> Dict[str, dict]:
+    """
+    Generate a Rucio transfer metrics file (latest.json).
+
+    About 1% of the connections are self-connections or involve UNKNOWN, 5% have no mbps info and 5% have no
+    dashb info; the others have a dashb bandwidth (Mbit/s) for each resolution, with a few missing values.
+
+    :param n_connections: number of connections (int)
+    :param n_sites: number of sites, default: enough for the number of connections (Optional[int])
+    :param seed: random seed (int)
+    :return: { "A:B": metrics } (Dict[str, dict]).
+    """
+    rng = random.Random(seed)
+    sites = site_names(n_sites or sites_for_connections(n_connections))
+    metrics = {}
+    while len(metrics) < n_connections:
+        draw = rng.random()
+        if draw < 0.005:
+            source = destination = rng.choice(sites)
+        elif draw < 0.01:
+            source, destination = 'UNKNOWN', rng.choice(sites)
+        else:
+            source, destination = rng.sample(sites, 2)
+        connection = f'{source}:{destination}'
+        if connection in metrics:
+            continue
+
+        info = {'files': {'done': {key: rng.randint(0, 5000) for key in RESOLUTIONS},
+                          'failed': {key: rng.randint(0, 50) for key in RESOLUTIONS}}}
+        draw = rng.random()
+        if draw >= 0.05:
+            info['mbps'] = {}
+            if draw >= 0.10:
+                # log-uniform bandwidth between 1 Mbit/s and 10 Gbit/s
+                typical = 10 ** rng.uniform(0, 4)
+                info['mbps']['dashb'] = {key: round(typical * rng.uniform(0.5, 1.5), 3) for key in RESOLUTIONS if rng.random() > 0.05}
+        metrics[connection] = info
+
+    return metrics
+
+
+def snapshot_file_names(n_snapshots: int, start: datetime.date = datetime.date(2024, 1, 1)) -> List[str]:
+    """
+    Return weekly metrics file names, latest-DD.MM.YYYY.json.
+
+    :param n_snapshots: number of files (int)
+    :param start: date of the first file (datetime.date)
+    :return: file names (List[str]).
+    """
+    return [f'latest-{start + datetime.timedelta(weeks=week):%d.%m.%Y}.json' for week in range(n_snapshots)]
+
+
+def grafana_rows(n_queues: int, n_rows: int, seed: int = DEFAULT_SEED) -> List[list]:
+    """
+    Generate the rows of a Grafana export of the number of running job slots per queue.
+
+    :param n_queues: number of queues (int)
+    :param n_rows: number of time bins (int)
+    :param seed: random seed (int)
+    :return: header and data rows, empty bins as empty strings (List[list]).
+    """
+    rng = random.Random(seed)
+    queues = queue_names(n_queues)
+    levels = [rng.randint(10, 20000) for _ in queues]
+    start = datetime.datetime(2024, 1, 1)
+    rows = [['Time'] + queues]
+    for row in range(n_rows):
+        time_bin = start + datetime.timedelta(hours=row)
+        # some bins are empty, as in the real exports
+        values = ['' if rng.random() < 0.02 else int(level * rng.uniform(0.2, 1.0)) for level in levels]
+        rows.append([f'{time_bin:%Y-%m-%d %H:%M:%S}'] + values)
+
+    return rows
+
+
+def write_grafana_csv(file_path: str, n_queues: int, n_rows: int, seed: int = DEFAULT_SEED):
+    """
+    Write a Grafana CSV export: UTF-8 with BOM, with quoted names and times, like the "Time" column of the real files.
+
+    :param file_path: file path (str)
+    :param n_queues: number of queues (int)
+    :param n_rows: number of time bins (int)
+    :param seed: random seed (int).
+    """
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerows(grafana_rows(n_queues, n_rows, seed))
+
+
+def corepower(n_queues: int, seed: int = DEFAULT_SEED) -> Dict[str, dict]:
+    """
+    Generate corepower.json, the average benchmark per core of each queue.
+
+    :param n_queues: number of queues (int)
+    :param seed: random seed (int)
+    :return: { queue: { "corepower": .. } } (Dict[str, dict]).
+    """
+    rng = random.Random(seed)
+
+    return {queue: {'corepower': round(rng.uniform(8, 25), 2)} for queue in queue_names(n_queues)}
+
+
+def queue_corecount(n_queues: int, seed: int = DEFAULT_SEED) -> Dict[str, int]:
+    """
+    Generate queue_corecount.json, the total number of cores of each queue.
+
+    :param n_queues: number of queues (int)
+    :param seed: random seed (int)
+    :return: { queue: cores } (Dict[str, int]).
+    """
+    rng = random.Random(seed)
+
+    return {queue: rng.choice([8, 16, 32, 64]) * rng.randint(1, 2000) for queue in queue_names(n_queues)}
+
+
+def queues_and_rses(n_queues: int, n_sites: int, seed: int = DEFAULT_SEED) -> Dict[str, dict]:
+    """
+    Generate queues_and_rses.json, the RSE(s) used by each queue.
+
+    :param n_queues: number of queues (int)
+    :param n_sites: number of sites to choose the RSEs from (int)
+    :param seed: random seed (int)
+    :return: { queue: { "RSE": name or [names] } } (Dict[str, dict]).
+    """
+    rng = random.Random(seed)
+    sites = site_names(n_sites)
+    queues = {}
+    for queue in queue_names(n_queues):
+        rses = rng.sample(sites, min(len(sites), rng.choice([1, 1, 1, 2])))
+        queues[queue] = {'RSE': rses[0] if len(rses) == 1 else rses}
+
+    return queues
+
+
+def wrench_output(n_tasks: int, n_hosts: int = 100, cores_per_host: int = 8, seed: int = DEFAULT_SEED) -> dict:
+    """
+    Generate a WRENCH simulation output file.
+
+    Tasks are submitted over time and placed on the host that becomes free first, so the scheduling delays
+    (compute start - whole task start) and the host concurrency are realistic.
+
+    :param n_tasks: number of tasks (int)
+    :param n_hosts: number of hosts (int)
+    :param cores_per_host: cores per host (int)
+    :param seed: random seed (int)
+    :return: { "workflow_execution": { "tasks": [task] } } (dict).
+    """
+    rng = random.Random(seed)
+    free_at = [[0.0] * cores_per_host for _ in range(n_hosts)]
+    submit = 0.0
+    tasks = []
+    for index in range(n_tasks):
+        submit += rng.expovariate(n_hosts * cores_per_host / 3600.0)
+        cores = rng.choice([1, 1, 1, 2, 4, 8]) if cores_per_host >= 8 else 1
+        host = rng.randrange(n_hosts)
+        slots = sorted(range(cores_per_host), key=free_at[host].__getitem__)[:cores]
+        start = max(submit, max(free_at[host][slot] for slot in slots))
+        read_end = start + rng.uniform(1, 60)
+        compute_end = read_end + rng.uniform(600, 7200)
+        end = compute_end + rng.uniform(1, 30)
+        for slot in slots:
+            free_at[host][slot] = end
+        tasks.append({
+            'task_id': f'task_{index:07d}',
+            'color': '#3b7dd8',
+            'execution_host': {'hostname': f'host{host:05d}', 'cores': cores_per_host, 'flop_rate': 1e10, 'memory_manager_service': 0},
+            'num_cores_allocated': cores,
+            'vertical_position': 0,
+            'whole_task': {'start': submit, 'end': end},
+            'read': [{'start': start, 'end': read_end, 'id': f'input_{index:07d}'}],
+            'compute': {'start': read_end, 'end': compute_end},
+            'write': [{'start': compute_end, 'end': end, 'id': f'output_{index:07d}'}],
+            'failed': -1,
+            'terminated': -1,
+        })
+
+    return {'workflow_execution': {'tasks': tasks}}
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Write synthetic REDWOOD input files.')
+    parser.add_argument('--outdir', type=str, default='synthetic', help='Output directory (default: synthetic).')
+    parser.add_argument('--connections', type=int, default=10000, help='Connections per Rucio metrics file (default: 10000).')
+    parser.add_argument('--snapshots', type=int, default=4, help='Number of weekly Rucio metrics files (default: 4).')
+    parser.add_argument('--queues', type=int, default=200, help='Number of queues (default: 200).')
+    parser.add_argument('--rows', type=int, default=4380, help='Number of hourly rows in the Grafana CSV (default: 4380, six months).')
+    parser.add_argument('--tasks', type=int, default=10000, help='Number of tasks in the WRENCH output (default: 10000).')
+    parser.add_argument('--hosts', type=int, default=100, help='Number of hosts in the WRENCH output (default: 100).')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help=f'Random seed (default: {DEFAULT_SEED}).')
+    args = parser.parse_args()
+
+    data_dir = os.path.join(args.outdir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    n_sites = sites_for_connections(args.connections)
+    for snapshot, file_name in enumerate(snapshot_file_names(args.snapshots)):
+        write_dict_to_json(rucio_metrics(args.connections, n_sites, seed=args.seed + snapshot), os.path.join(data_dir, file_name))
+    write_grafana_csv(os.path.join(args.outdir, 'grafana-6months.csv'), args.queues, args.rows, args.seed)
+    write_dict_to_json(corepower(args.queues, args.seed), os.path.join(args.outdir, 'corepower.json'))
+    write_dict_to_json(queue_corecount(args.queues, args.seed), os.path.join(args.outdir, 'queue_corecount.json'))
+    write_dict_to_json(queues_and_rses(args.queues, n_sites, args.seed), os.path.join(args.outdir, 'queues_and_rses.json'))
+    write_dict_to_json(wrench_output(args.tasks, args.hosts, seed=args.seed), os.path.join(args.outdir, 'wrench.json'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+
+"""
+Host utilization and concurrency timelines from the task records of a WRENCH JSON file.
+
+Each task occupies num_cores_allocated cores of its execution_host from the start of its execution (the first
+read, or the compute phase) until the end of the whole task, and waits in the queue from the start of the whole
+task until then. These intervals are turned into step curves with a sorted sweep line: every interval becomes a
+start and an end event, the events are sorted once (O(n log n)) by host and time, and a cumulative sum gives the
+number of running tasks and busy cores after every event. The curves of all hosts come from the same sort.
+
+The summary gives, globally and per host, the peak concurrency, the utilization (busy core time over the core
+capacity during the run), the idle fraction (time without any running task), the saturated fraction (time with
+all cores busy; hosts without a known number of cores count as having as many as they ever used) and the
+queueing time, e.g. to check whether the simulated ComputeHosts of generate_xml.py are
+saturated. The curves themselves can be written as compact arrays (.npz), the hosts' curves concatenated with
+offsets.
+"""
+
+import argparse
+from array import array
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from data_io import write_dict_to_json
+from extract_time_diffs import DEFAULT_INPUT, TASKS
+from json_stream import JSONStreamError, iter_items
+from profiling import Profiler, add_arguments
+
+DEFAULT_SUMMARY = 'timeline_summary.json'
+PERCENTILES = (50, 95)
+
+
+def read_intervals(file_path: str) -> Tuple[List[str], np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Read the execution intervals of the tasks of a WRENCH JSON file, one task at a time.
+
+    :param file_path: path to the WRENCH JSON file (str)
+    :raises KeyError: if a task has no execution host, compute phase or whole task times
+    :raises TypeError: if a time is null or not a number
+    :return: host names, cores per host, and per task 'host' (index into the host names), 'cores', 'submit',
+             'start' and 'end' (Tuple[List[str], np.ndarray, Dict[str, np.ndarray]]).
+    """
+    hosts = {}
+    host_cores = []
+    columns = {'host': array('q'), 'cores': array('q'), 'submit': array('d'), 'start': array('d'), 'end': array('d')}
+    for _, task in iter_items(file_path, prefix=TASKS):
+        execution_host = task['execution_host']
+        host = hosts.setdefault(execution_host['hostname'], len(hosts))
+        if host == len(host_cores):
+            host_cores.append(execution_host.get('cores') or 0)
+        start = task['compute']['start']
+        for read in task.get('read') or ():
+            start = min(start, read['start'])
+        columns['host'].append(host)
+        columns['cores'].append(task.get('num_cores_allocated') or 1)
+        columns['submit'].append(task['whole_task']['start'])
+        columns['start'].append(start)
+        columns['end'].append(task['whole_task']['end'])
+
+    return list(hosts), np.asarray(host_cores, dtype=np.int64), {name: np.asarray(column) for name, column in columns.items()}
+
+
+def sweep(starts: np.ndarray, ends: np.ndarray, groups: np.ndarray, weights: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Turn weighted [start, end) intervals into step curves, one per group, with one sort of all events.
+
+    At equal times the end events are handled before the start events, so back to back intervals do not overlap.
+
+    :param starts: interval starts (np.ndarray)
+    :param ends: interval ends (np.ndarray)
+    :param groups: group (e.g. host index) of each interval (np.ndarray)
+    :param weights: { curve name: weight of each interval } (Dict[str, np.ndarray])
+    :return: group and time of each step, sorted by group and time, and { curve name: level from that time on }
+             (Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]).
+    """
+    times = np.concatenate([starts, ends])
+    event_groups = np.concatenate([groups, groups])
+    is_start = np.concatenate([np.ones(len(starts), dtype=np.int8), np.zeros(len(ends), dtype=np.int8)])
+    order = np.lexsort((is_start, times, event_groups))
+    times = times[order]
+    event_groups = event_groups[order]
+    # the level after the last event at each time of each group
+    last = np.ones(len(times), dtype=bool)
+    last[:-1] = (event_groups[1:] != event_groups[:-1]) | (times[1:] != times[:-1])
+    levels = {}
+    for name, weight in weights.items():
+        levels[name] = np.cumsum(np.concatenate([weight, -weight])[order])[last]
+
+    return event_groups[last], times[last], levels
+
+
+def durations(groups: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """
+    Return how long each step of a curve lasts; the last step of each group, back at level 0, lasts 0.
+
+    :param groups: group of each step (np.ndarray)
+    :param times: time of each step (np.ndarray)
+    :return: durations (np.ndarray).
+    """
+    lengths = np.zeros(len(times))
+    if len(times) > 1:
+        lengths[:-1] = np.where(groups[1:] == groups[:-1], np.diff(times), 0.0)
+
+    return lengths
+
+
+def quantiles(values: np.ndarray) -> dict:
+    """
+    Summarize a distribution.
+
+    :param values: values (np.ndarray)
+    :return: { 'mean', 'p50', 'p95', 'max' } (dict).
+    """
+    if not values.size:
+        return {}
+    summary = {'mean': float(values.mean())}
+    summary.update({f'p{percentile}': float(value) for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+    summary['max'] = float(values.max())
+
+    return summary
+
+
+def timelines(host_names: List[str], host_cores: np.ndarray, tasks: Dict[str, np.ndarray]) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """
+    Compute the global and per-host concurrency and utilization curves and their summary metrics.
+
+    The run lasts from the first submission to the end of the last task; utilization, idle and saturated
+    fractions are relative to that span, so hosts that run nothing for a while count as idle.
+
+    :param host_names: host names (List[str])
+    :param host_cores: cores per host, 0 if unknown (np.ndarray)
+    :param tasks: per task 'host', 'cores', 'submit', 'start' and 'end', from read_intervals() (Dict[str, np.ndarray])
+    :return: summary metrics and curves (Tuple[dict, Dict[str, np.ndarray]]).
+    """
+    n_hosts = len(host_names)
+    n_tasks = len(tasks['host'])
+    if not n_tasks:
+        return {'tasks': 0, 'n_hosts': 0, 'hosts': {}}, {}
+    first = float(tasks['submit'].min())
+    last = float(tasks['end'].max())
+    span = last - first
+    ones = np.ones(n_tasks)
+    cores = tasks['cores'].astype(np.float64)
+    queueing = tasks['start'] - tasks['submit']
+
+    # per host
+    groups, times, levels = sweep(tasks['start'], tasks['end'], tasks['host'], {'running': ones, 'cores': cores})
+    lengths = durations(groups, times)
+    boundaries = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    hosts_with_steps = groups[boundaries]
+    busy_core_time = np.bincount(groups, weights=levels['cores'] * lengths, minlength=n_hosts)
+    active_time = np.bincount(groups, weights=(levels['running'] > 0) * lengths, minlength=n_hosts)
+    peak_running = np.zeros(n_hosts)
+    peak_running[hosts_with_steps] = np.maximum.reduceat(levels['running'], boundaries)
+    peak_cores = np.zeros(n_hosts)
+    peak_cores[hosts_with_steps] = np.maximum.reduceat(levels['cores'], boundaries)
+    task_counts = np.bincount(tasks['host'], minlength=n_hosts)
+    queueing_sums = np.bincount(tasks['host'], weights=queueing, minlength=n_hosts)
+    # hosts without a known number of cores are assumed to have as many as they ever used, for both the
+    # utilization and the saturation
+    capacity = np.where(host_cores > 0, host_cores, peak_cores)
+    saturated = (levels['cores'] >= capacity[groups]) & (capacity[groups] > 0)
+    saturated_time = np.bincount(groups, weights=saturated * lengths, minlength=n_hosts)
+
+    hosts = {}
+    for host, name in enumerate(host_names):
+        hosts[name] = {
+            'cores': int(capacity[host]),
+            'tasks': int(task_counts[host]),
+            'peak_concurrency': int(peak_running[host]),
+            'peak_cores': int(peak_cores[host]),
+            'utilization': float(busy_core_time[host] / (capacity[host] * span)) if span and capacity[host] else 0.0,
+            'idle_fraction': float(1 - active_time[host] / span) if span else 0.0,
+            'saturated_fraction': float(saturated_time[host] / span) if span else 0.0,
+            'mean_queueing_time': float(queueing_sums[host] / task_counts[host]) if task_counts[host] else 0.0,
+        }
+
+    # global, and the queue of submitted tasks that have not started yet
+    zeros = np.zeros(n_tasks, dtype=np.int64)
+    global_groups, global_times, global_levels = sweep(tasks['start'], tasks['end'], zeros, {'running': ones, 'cores': cores})
+    global_lengths = durations(global_groups, global_times)
+    queue_groups, queue_times, queue_levels = sweep(tasks['submit'], tasks['start'], zeros, {'queued': ones})
+    queue_lengths = durations(queue_groups, queue_times)
+    total_capacity = float(capacity.sum())
+    utilizations = np.array([host['utilization'] for host in hosts.values()])
+    summary = {
+        'tasks': n_tasks,
+        'n_hosts': n_hosts,
+        'span': [first, last],
+        'makespan': span,
+        'global': {
+            'capacity_cores': int(total_capacity),
+            'peak_concurrency': int(global_levels['running'].max()),
+            'peak_cores': int(global_levels['cores'].max()),
+            'mean_concurrency': float((global_levels['running'] * global_lengths).sum() / span) if span else 0.0,
+            'utilization': float((global_levels['cores'] * global_lengths).sum() / (total_capacity * span)) if span and total_capacity else 0.0,
+            'idle_fraction': float(1 - ((global_levels['running'] > 0) * global_lengths).sum() / span) if span else 0.0,
+            'peak_queued': int(queue_levels['queued'].max()),
+            'mean_queued': float((queue_levels['queued'] * queue_lengths).sum() / span) if span else 0.0,
+            'queueing_time': quantiles(queueing),
+            'host_utilization': quantiles(utilizations),
+            'saturated_hosts': int(sum(host['saturated_fraction'] >= 0.5 for host in hosts.values())),
+        },
+        'hosts': hosts,
+    }
+    offsets = np.zeros(n_hosts + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(groups, minlength=n_hosts))
+    curves = {
+        'global_times': global_times, 'global_running': global_levels['running'], 'global_cores': global_levels['cores'],
+        'queue_times': queue_times, 'queue_queued': queue_levels['queued'],
+        'host_names': np.array(host_names), 'host_offsets': offsets,
+        'host_times': times, 'host_running': levels['running'], 'host_cores': levels['cores'],
+    }
+
+    return summary, curves
+
+
+def print_summary(summary: dict, top: int = 10):
+    """
+    Print the global metrics and the most utilized hosts.
+
+    :param summary: summary from timelines() (dict)
+    :param top: number of hosts to list (int).
+    """
+    print(f"tasks: {summary['tasks']}  hosts: {summary['n_hosts']}")
+    if not summary['tasks']:
+        return
+    metrics = summary['global']
+    print(f"makespan: {summary['makespan']:.3f}  capacity: {metrics['capacity_cores']} cores")
+    print(f"peak concurrency: {metrics['peak_concurrency']} tasks, {metrics['peak_cores']} cores  "
+          f"mean concurrency: {metrics['mean_concurrency']:.2f}")
+    print(f"utilization: {metrics['utilization']:.3f}  idle fraction: {metrics['idle_fraction']:.3f}  "
+          f"hosts saturated at least half of the time: {metrics['saturated_hosts']}")
+    queueing = '  '.join(f'queueing time {name}: {value:.3f}' for name, value in metrics['queueing_time'].items())
+    print(f"peak queued: {metrics['peak_queued']}  mean queued: {metrics['mean_queued']:.2f}  {queueing}")
+    print(f"{'host':>20}{'cores':>8}{'tasks':>8}{'peak':>8}{'utilization':>13}{'idle':>8}{'saturated':>11}")
+    ranked = sorted(summary['hosts'].items(), key=lambda item: item[1]['utilization'], reverse=True)
+    for name, host in ranked[:top]:
+        print(f"{name:>20}{host['cores']:>8}{host['tasks']:>8}{host['peak_concurrency']:>8}{host['utilization']:>13.3f}"
+              f"{host['idle_fraction']:>8.3f}{host['saturated_fraction']:>11.3f}")
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Compute host utilization and concurrency timelines from a WRENCH JSON file.')
+    parser.add_argument('--input', type=str, default=DEFAULT_INPUT, help=f'WRENCH JSON file (default: {DEFAULT_INPUT}).')
+    parser.add_argument('--summary', type=str, default=DEFAULT_SUMMARY, help=f'Summary metrics (default: {DEFAULT_SUMMARY}).')
+    parser.add_argument('--curves', type=str, metavar='FILE', help='Write the global and per-host curves to FILE (.npz).')
+    parser.add_argument('--top', type=int, default=10, help='Number of most utilized hosts to print (default: 10).')
+    add_arguments(parser, 'timeline')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'timeline')
+
+    with profiler.phase('load'):
+        try:
+            host_names, host_cores, tasks = read_intervals(args.input)
+        except (OSError, JSONStreamError) as e:
+            print(f"Failed to load JSON data: {e}")
+            exit(-1)
+        except (KeyError, TypeError, ValueError) as e:
+            # missing field, or a null or non-numeric time
+            print(f"Failed to extract data from JSON file: {e}")
+            exit(-1)
+        profiler.count('tasks', len(tasks['host']))
+        profiler.count('hosts', len(host_names))
+
+    with profiler.phase('transform'):
+        summary, curves = timelines(host_names, host_cores, tasks)
+    print_summary(summary, args.top)
+
+    with profiler.phase('write'):
+        write_dict_to_json(summary, args.summary)
+        if args.curves and curves:
+            np.savez(args.curves, **curves)
+            print(f'wrote curves to {args.curves}')
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
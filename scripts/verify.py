@@ -24,37 +24,499 @@ Make sure that all queues have populated RSE and GFLOPS info
 Note: the filtering was perhaps already done by the scripts that
       created the earlier JSON files. The script also writes out
       the number of queues (150 as of June 14, 2024).
+
+Every pipeline artifact present in the work directory is validated against a declared schema (SCHEMAS), member
+by member with json_stream (or ElementTree.iterparse for platform.xml), so large files are never loaded as a
+whole. While streaming, hash indexes (queue RSEs, measured sites, hosts, links, ...) are built, and cross-file
+checks (CHECKS) are answered from these indexes, e.g. that every RSE of a queue has a bandwidth entry in
+max_connections.json and that every route endpoint in platform.xml is a host. The files are scanned in parallel
+processes, and each check runs as soon as the files it needs have been scanned.
 """
 
-import json
+import argparse
+import math
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from data_io import write_dict_to_json
+from json_stream import JSONStreamError, iter_items
+from profiling import Profiler, add_arguments
+
+QUEUE_KEY = r'\S+'
+CONNECTION_KEY = r'[^:]+:[^:]+'
+PLATFORM = 'platform.xml'
+# messages kept per artifact and per check, the problems are all counted
+MAX_MESSAGES = 100
+DEFAULT_REPORT = 'verify_report.json'
+
+
+class Schema(NamedTuple):
+    """
+    Schema of a JSON artifact: an object with keys matching `key` and values matching `value`.
+
+    A value specification is a type name ('number', 'positive', 'count', 'string' or 'rses'), optionally with a
+    trailing '?' when null is allowed, or { field: specification } for objects with required fields. `indexes`
+    names the INDEXERS to build while validating.
+    """
+
+    key: str
+    value: Any
+    indexes: Tuple[str, ...] = ()
+
+
+class Problems:
+    """Counter of the problems of an artifact or a check, keeping the first MAX_MESSAGES messages."""
+
+    def __init__(self):
+        """Initialize an empty counter."""
+        self.count = 0
+        self.messages = []
+
+    def add(self, message: str):
+        """
+        Record a problem.
+
+        :param message: description of the problem (str).
+        """
+        self.count += 1
+        if len(self.messages) < MAX_MESSAGES:
+            self.messages.append(message)
+
+    def result(self, **fields) -> dict:
+        """
+        Return the problems as a report entry.
+
+        :param fields: other fields of the entry, e.g. items (dict)
+        :return: { .., 'problems': count, 'messages': [..] } (dict).
+        """
+        return dict(fields, problems=self.count, messages=self.messages)
+
+
+class Check(NamedTuple):
+    """A cross-file check of the indexes of some artifacts, yielding one message per problem."""
+
+    name: str
+    artifacts: Tuple[str, ...]
+    run: Callable[[Dict[str, Dict[str, Any]]], Iterable[str]]
+
+
+def check_type(value: Any, kind: str) -> bool:
+    """
+    Check a value against a type name.
+
+    :param value: value (Any)
+    :param kind: 'number' (>= 0), 'positive' (> 0), 'count' (integer >= 0), 'string' or 'rses' (non-empty string or
+                 list of strings), with '?' if null is allowed (str)
+    :return: True if the value matches (bool).
+    """
+    if kind.endswith('?'):
+        if value is None:
+            return True
+        kind = kind[:-1]
+    if kind == 'string':
+        return isinstance(value, str) and bool(value)
+    if kind == 'rses':
+        if isinstance(value, str):
+            return bool(value)
+        return isinstance(value, list) and bool(value) and all(isinstance(rse, str) and rse for rse in value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return False
+    if kind == 'count':
+        return isinstance(value, int) and value >= 0
+    if kind == 'positive':
+        return value > 0
+
+    return value >= 0
+
+
+def check_value(value: Any, spec: Any) -> List[str]:
+    """
+    Check a value against a value specification.
+
+    :param value: value (Any)
+    :param spec: type name or { field: specification } (Any)
+    :return: problems, empty if the value matches (List[str]).
+    """
+    if isinstance(spec, str):
+        return [] if check_type(value, spec) else [f'expected {spec}, got {value!r:.60}']
+    if not isinstance(value, dict):
+        return [f'expected an object, got {value!r:.60}']
+
+    return [f'{field}: {problem}' for field, field_spec in spec.items()
+            for problem in (check_value(value[field], field_spec) if field in value else ['missing'])]
+
+
+def queue_rses(key: str, value: Any) -> Iterator[Tuple[str, Any]]:
+    """
+    Index the RSE(s) of a queue.
+
+    :param key: queue (str)
+    :param value: queue info (Any)
+    :return: ('rses', (queue, [RSE, ..])) (Iterator[Tuple[str, Any]]).
+    """
+    rses = value.get('RSE') if isinstance(value, dict) else None
+    if rses:
+        yield 'rses', (key, [rses] if isinstance(rses, str) else rses)
+
+
+def measured_sites(key: str, value: Any) -> Iterator[Tuple[str, Any]]:
+    """
+    Index the sites of a connection with a measured bandwidth.
+
+    :param key: "A:B" connection (str)
+    :param value: bandwidth (Any)
+    :return: ('sites', site) for both sites (Iterator[Tuple[str, Any]]).
+    """
+    if value and check_type(value, 'number'):
+        for site in key.split(':'):
+            yield 'sites', site
+
+
+INDEXERS = {'rses': queue_rses, 'sites': measured_sites}
+
+QUEUES = Schema(QUEUE_KEY, {'RSE': 'rses', 'GFLOPS': 'positive'}, ('rses',))
+SCHEMAS = {
+    'queues_and_rses.json': Schema(QUEUE_KEY, {'RSE': 'rses'}, ('rses',)),
+    'corepower.json': Schema(QUEUE_KEY, {'corepower': 'number?'}),
+    'queue_corecount.json': Schema(QUEUE_KEY, 'count'),
+    'number_of_cpus.json': Schema(QUEUE_KEY, 'count'),
+    'gflops_per_cpu.json': Schema(QUEUE_KEY, 'number'),
+    'job_slot_stats.json': Schema(QUEUE_KEY, {'max': 'count', 'mean': 'number', 'samples': 'count'}),
+    'queues-corepower_based.json': QUEUES,
+    'queues-runtimes_based.json': QUEUES,
+    'max_connections.json': Schema(CONNECTION_KEY, 'number', ('sites',)),
+}
+
+
+def members(source: Union[str, dict]) -> Iterator[Tuple[Any, Any]]:
+    """
+    Return the members of a JSON artifact.
+
+    :param source: path of the file, streamed, or the loaded data (Union[str, dict])
+    :return: (key, value) (Iterator[Tuple[Any, Any]]).
+    """
+    return iter(source.items()) if isinstance(source, dict) else iter_items(source)
+
+
+def scan_json(name: str, source: Union[str, dict]) -> Tuple[dict, Dict[str, Any]]:
+    """
+    Validate a JSON artifact against its schema and build its indexes.
+
+    :param name: artifact name, a key of SCHEMAS (str)
+    :param source: path of the file or the loaded data (Union[str, dict])
+    :return: result ({ 'items', 'problems', 'messages' }) and indexes ({ 'keys': set, index name: set or dict }),
+             None if the file cannot be read (Tuple[dict, Optional[Dict[str, Any]]]).
+    """
+    schema = SCHEMAS[name]
+    key_pattern = re.compile(schema.key)
+    problems = Problems()
+    items = 0
+    keys = set()
+    indexes = {'keys': keys, 'rses': {}, 'sites': set()}
+
+    try:
+        for key, value in members(source):
+            items += 1
+            if not isinstance(key, str) or not key_pattern.fullmatch(key):
+                problems.add(f'unexpected key {key!r}')
+                continue
+            if key in keys:
+                problems.add(f'{key}: duplicate key')
+            keys.add(key)
+            for message in check_value(value, schema.value):
+                problems.add(f'{key}: {message}')
+            for index in schema.indexes:
+                for index_name, item in INDEXERS[index](key, value):
+                    if isinstance(indexes[index_name], dict):
+                        indexes[index_name][item[0]] = item[1]
+                    else:
+                        indexes[index_name].add(item)
+    except (JSONStreamError, UnicodeDecodeError) as exc:
+        problems.add(f'malformed JSON: {exc}')
+    except OSError as exc:
+        problems.add(f'cannot read {source}: {exc.strerror or exc}')
+        return problems.result(items=items), None
+
+    return problems.result(items=items), indexes
+
+
+def scan_platform(source: str) -> Tuple[dict, Dict[str, Any]]:
+    """
+    Validate a SimGrid platform file and index its hosts, links and references to them.
+
+    The file is parsed incrementally; the attributes are read when an element starts and processed elements
+    are dropped, so memory does not grow with the number of routes.
+
+    :param source: path of the platform file (str)
+    :return: result ({ 'items', 'problems', 'messages' }) and indexes ({ 'hosts', 'links', 'endpoints', 'link_refs' }),
+             None if the file cannot be read (Tuple[dict, Optional[Dict[str, Any]]]).
+    """
+    problems = Problems()
+    items = 0
+    indexes = {'hosts': set(), 'links': set(), 'endpoints': set(), 'link_refs': set()}
+    stack = []
+    try:
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            if event == 'end':
+                stack.pop()
+                if stack and stack[-1].tag in ('platform', 'zone'):
+                    # the children of a zone are handled, drop them
+                    stack[-1].clear()
+                continue
+            stack.append(element)
+            items += index_element(element, indexes, problems)
+    except ET.ParseError as exc:
+        problems.add(f'malformed XML: {exc}')
+    except OSError as exc:
+        problems.add(f'cannot read {source}: {exc.strerror or exc}')
+        return problems.result(items=items), None
+
+    return problems.result(items=items), indexes
+
+
+def index_element(element: ET.Element, indexes: Dict[str, set], problems: Problems) -> int:
+    """
+    Add a platform element to the indexes.
+
+    :param element: started element, with its attributes (ET.Element)
+    :param indexes: platform indexes (Dict[str, set])
+    :param problems: problems of the platform file (Problems)
+    :return: 1 for hosts, links and routes, else 0 (int).
+    """
+    tag = element.tag
+    if tag in ('host', 'link', 'backbone'):
+        index = 'hosts' if tag == 'host' else 'links'
+        identifier = element.get('id')
+        if not identifier:
+            problems.add(f'<{tag}> without id')
+        elif identifier in indexes[index]:
+            problems.add(f'duplicate {tag} id {identifier}')
+        else:
+            indexes[index].add(identifier)
+        return 1
+    if tag == 'route':
+        for attribute in ('src', 'dst'):
+            if element.get(attribute):
+                indexes['endpoints'].add(element.get(attribute))
+            else:
+                problems.add(f'<route> without {attribute}')
+        return 1
+    if tag == 'link_ctn':
+        indexes['link_refs'].add(element.get('id', ''))
+    elif tag == 'host_link':
+        indexes['endpoints'].add(element.get('id', ''))
+        indexes['link_refs'].update(element.get(attribute, '') for attribute in ('up', 'down'))
+
+    return 0
+
+
+def scan(name: str, source: Union[str, dict]) -> Tuple[dict, Dict[str, Any]]:
+    """
+    Validate an artifact and build its indexes.
+
+    :param name: artifact name (str)
+    :param source: path of the file, or the loaded data for JSON artifacts (Union[str, dict])
+    :return: result and indexes, None if the file cannot be read (Tuple[dict, Optional[Dict[str, Any]]]).
+    """
+    return scan_platform(source) if name == PLATFORM else scan_json(name, source)
+
+
+def check_rse_bandwidth(indexes: Dict[str, Dict[str, Any]]) -> Iterator[str]:
+    """
+    Check that every RSE of a queue has at least one bandwidth entry in max_connections.json.
+
+    :param indexes: indexes per artifact (Dict[str, Dict[str, Any]])
+    :return: problems (Iterator[str]).
+    """
+    sites = indexes['max_connections.json']['sites']
+    for queue, rses in indexes['queues-corepower_based.json']['rses'].items():
+        for rse in rses:
+            if rse not in sites:
+                yield f'{queue}: RSE {rse} has no bandwidth entry'
+
+
+def check_route_endpoints(indexes: Dict[str, Dict[str, Any]]) -> Iterator[str]:
+    """
+    Check that every route endpoint in platform.xml is a host.
+
+    :param indexes: indexes per artifact (Dict[str, Dict[str, Any]])
+    :return: problems (Iterator[str]).
+    """
+    hosts = indexes[PLATFORM]['hosts']
+    for endpoint in sorted(indexes[PLATFORM]['endpoints'] - hosts):
+        yield f'route endpoint {endpoint} is not a host'
+
+
+def check_route_links(indexes: Dict[str, Dict[str, Any]]) -> Iterator[str]:
+    """
+    Check that every link used by a route in platform.xml is declared.
+
+    :param indexes: indexes per artifact (Dict[str, Dict[str, Any]])
+    :return: problems (Iterator[str]).
+    """
+    for link in sorted(indexes[PLATFORM]['link_refs'] - indexes[PLATFORM]['links']):
+        yield f'link {link} is used but not declared'
 
 
-def read_json_to_dict(file_path: str) -> dict:
+def check_measured_links(indexes: Dict[str, Dict[str, Any]]) -> Iterator[str]:
     """
-    Read a json file to a dictionary.
+    Check that every connection link ("A:B") in platform.xml has a bandwidth in max_connections.json.
 
-    :param file_path: path to the JSON file (str)
-    :return: data dictionary (dict).
+    :param indexes: indexes per artifact (Dict[str, Dict[str, Any]])
+    :return: problems (Iterator[str]).
     """
-    with open(file_path, 'r', encoding='utf-8') as json_file:
-        data_dict = json.load(json_file)
+    connections = indexes['max_connections.json']['keys']
+    for link in sorted(indexes[PLATFORM]['links']):
+        if ':' in link and link not in connections:
+            yield f'link {link} is not in max_connections.json'
+
+
+CHECKS = [
+    Check('queue RSEs have bandwidth', ('queues-corepower_based.json', 'max_connections.json'), check_rse_bandwidth),
+    Check('route endpoints are hosts', (PLATFORM,), check_route_endpoints),
+    Check('route links are declared', (PLATFORM,), check_route_links),
+    Check('platform links are measured', (PLATFORM, 'max_connections.json'), check_measured_links),
+]
+
+
+def run_check(check: Check, indexes: Dict[str, Dict[str, Any]]) -> dict:
+    """
+    Run a cross-file check.
+
+    :param check: check (Check)
+    :param indexes: indexes per artifact (Dict[str, Dict[str, Any]])
+    :return: { 'problems', 'messages' } (dict).
+    """
+    problems = Problems()
+    for message in check.run(indexes):
+        problems.add(message)
+
+    return problems.result()
+
+
+def validate(sources: Dict[str, Union[str, dict]], jobs: int = 1) -> dict:
+    """
+    Validate artifacts and run the cross-file checks between them.
+
+    Files given by path are scanned in up to `jobs` processes; loaded data is scanned in this process. A check
+    runs as soon as all of its artifacts are scanned, and is skipped if one of them is not given or cannot be
+    read (which is a problem of that artifact).
+
+    :param sources: { artifact name: path or loaded data } (Dict[str, Union[str, dict]])
+    :param jobs: number of processes (int)
+    :return: { 'artifacts': { name: result }, 'checks': { name: result }, 'problems': total } (dict).
+    """
+    report = {'artifacts': {}, 'checks': {}, 'problems': 0}
+    indexes = {}
+    pending = [check for check in CHECKS if all(name in sources for name in check.artifacts)]
+    for check in CHECKS:
+        if check not in pending:
+            report['checks'][check.name] = {'skipped': 'missing ' + ', '.join(name for name in check.artifacts if name not in sources)}
+
+    def scanned(name: str, result: dict, index: Optional[Dict[str, Any]]):
+        report['artifacts'][name] = result
+        if index is None:
+            for check in [check for check in pending if name in check.artifacts]:
+                pending.remove(check)
+                report['checks'][check.name] = {'skipped': f'cannot read {name}'}
+            return
+        indexes[name] = index
+        for check in list(pending):
+            if all(artifact in indexes for artifact in check.artifacts):
+                pending.remove(check)
+                report['checks'][check.name] = run_check(check, indexes)
+
+    files = [name for name, source in sources.items() if isinstance(source, str)]
+    for name, source in sources.items():
+        if name not in files:
+            scanned(name, *scan(name, source))
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(files))) as executor:
+            futures = {executor.submit(scan, name, sources[name]): name for name in files}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scanned(futures.pop(future), *future.result())
+    else:
+        for name in files:
+            scanned(name, *scan(name, sources[name]))
+
+    report['artifacts'] = {name: report['artifacts'][name] for name in sources}
+    report['checks'] = {check.name: report['checks'][check.name] for check in CHECKS}
+    report['problems'] = sum(result.get('problems', 0) for section in ('artifacts', 'checks') for result in report[section].values())
+
+    return report
+
+
+def summarize(report: dict, max_messages: int = 10):
+    """
+    Print a validation report.
+
+    :param report: report from validate() (dict)
+    :param max_messages: messages to print per artifact and check (int).
+    """
+    for section in ('artifacts', 'checks'):
+        for name, result in report[section].items():
+            if 'skipped' in result:
+                print(f'{name}: skipped ({result["skipped"]})')
+                continue
+            items = f'{result["items"]} items, ' if 'items' in result else ''
+            print(f'{name}: {items}{result["problems"]} problems')
+            for message in result['messages'][:max_messages]:
+                print(f'  {message}')
+            if result['problems'] > max_messages:
+                print(f'  ... and {result["problems"] - max_messages} more')
+    print(f'found {report["problems"]} problems')
+
+
+def verify(sources: Dict[str, Union[str, dict]], jobs: int = 1, max_messages: int = 10) -> dict:
+    """
+    Validate artifacts, see validate(), and print the report.
+
+    :param sources: { artifact name: path or loaded data } (Dict[str, Union[str, dict]])
+    :param jobs: number of processes (int)
+    :param max_messages: messages to print per artifact and check (int)
+    :return: report from validate() (dict).
+    """
+    report = validate(sources, jobs=jobs)
+    summarize(report, max_messages)
+
+    return report
 
-    return data_dict
 
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Validate the pipeline artifacts and the references between them.')
+    parser.add_argument('files', nargs='*',
+                        help=f'Artifacts to validate (default: all of {", ".join(list(SCHEMAS) + [PLATFORM])} found in --workdir).')
+    parser.add_argument('--workdir', type=str, default='.', help='Directory with the artifacts (default: current directory).')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Number of processes (default: number of CPUs).')
+    parser.add_argument('--report', type=str, default=DEFAULT_REPORT, help=f'JSON report (default: {DEFAULT_REPORT}).')
+    parser.add_argument('--max-messages', type=int, default=10, help='Messages to print per artifact and check (default: 10).')
+    add_arguments(parser, 'verify')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'verify')
 
-queues = read_json_to_dict('queues-corepower_based.json')
+    names = args.files or [name for name in list(SCHEMAS) + [PLATFORM] if os.path.exists(os.path.join(args.workdir, name))]
+    unknown = [name for name in names if name not in SCHEMAS and name != PLATFORM]
+    if unknown:
+        parser.error(f'no schema for {", ".join(unknown)}')
+    if not names:
+        parser.error(f'no artifacts found in {args.workdir}')
 
-# make sure there are entries for all queues
-for queue in queues:
+    with profiler.phase('transform'):
+        report = verify({name: os.path.join(args.workdir, name) for name in names}, jobs=args.jobs, max_messages=args.max_messages)
+        profiler.count('artifacts', len(names))
+    with profiler.phase('write'):
+        write_dict_to_json(report, args.report)
+    profiler.finish()
 
-    # get the GFLOPS number for this queue
-    gflops = queues.get(queue).get("GFLOPS")
-    if not gflops:
-        print(f'GFLOPS unknown for {queue}')
+    sys.exit(1 if report['problems'] else 0)
 
-    # verify that the queue has RSE(s)
-    rses = queues.get(queue).get("RSE")
-    if not rses:
-        print(f'RSE(s) unknown for {queue}')
 
-print(f"verified {len(queues)} queues")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""
+Widest-path (maximum bottleneck) bandwidths between all sites.
+
+max_connections.json only contains the site pairs that Rucio measured. For any other pair, the best
+achievable bandwidth is the one of the widest path through measured connections, ie the path whose
+slowest link is as fast as possible. All pairs are computed at once with a Floyd-Warshall variant on the
+(max, min) semiring, vectorized over an adjacency matrix: O(n^3) element operations in n NumPy steps.
+The routes are taken from a maximum spanning tree of the measured connections: the tree path between two
+sites is a widest path, and it is always simple.
+
+With --cache-dir, the results are cached on disk, keyed on a hash of the input bandwidths.
+
+Usage: python widest_path.py [--input max_connections.json] [--output widest_connections.json] [--missing-only] [--cache-dir DIR]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from data_io import read_json_to_dict, write_dict_to_json
+from profiling import Profiler, add_arguments
+
+
+def connections_digest(connections: Dict[str, float]) -> str:
+    """
+    Return a hash of the bandwidths, independent of the key order.
+
+    :param connections: { "A:B": bandwidth } (Dict[str, float])
+    :return: hex digest (str).
+    """
+    return hashlib.sha256(json.dumps(connections, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def widest_paths_matrix(capacity: np.ndarray) -> np.ndarray:
+    """
+    Compute the all-pairs widest path bandwidths.
+
+    :param capacity: (n, n) symmetric matrix of direct bandwidths, 0 where there is no connection (np.ndarray)
+    :return: (n, n) bottleneck bandwidths (np.ndarray).
+    """
+    width = capacity.astype(float)
+    np.fill_diagonal(width, np.inf)
+    for k in range(len(width)):
+        np.maximum(width, np.minimum(width[:, k, None], width[None, k, :]), out=width)
+    np.fill_diagonal(width, 0)
+
+    return width
+
+
+def spanning_tree(capacity: np.ndarray) -> tuple:
+    """
+    Compute a maximum spanning forest (Kruskal), rooted at the lowest site of each connected component.
+
+    :param capacity: (n, n) symmetric matrix of direct bandwidths, 0 where there is no connection (np.ndarray)
+    :return: (n,) parent of each site, -1 for the roots, and (n,) depth of each site (tuple).
+    """
+    n = len(capacity)
+    rows, columns = np.nonzero(np.triu(capacity, k=1))
+    order = np.argsort(-capacity[rows, columns], kind='stable')
+    leader = list(range(n))
+
+    def find(site: int) -> int:
+        while leader[site] != site:
+            leader[site] = leader[leader[site]]
+            site = leader[site]
+        return site
+
+    neighbours = [[] for _ in range(n)]
+    for i, j in zip(rows[order].tolist(), columns[order].tolist()):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            leader[root_i] = root_j
+            neighbours[i].append(j)
+            neighbours[j].append(i)
+
+    parent = np.full(n, -1, dtype=np.int32)
+    depth = np.full(n, -1, dtype=np.int32)
+    for root in range(n):
+        if depth[root] >= 0:
+            continue
+        depth[root] = 0
+        stack = [root]
+        while stack:
+            site = stack.pop()
+            for other in neighbours[site]:
+                if depth[other] < 0:
+                    parent[other] = site
+                    depth[other] = depth[site] + 1
+                    stack.append(other)
+
+    return parent, depth
+
+
+class WidestPaths:
+    """Widest path bandwidths and routes between all sites of a set of measured connections."""
+
+    def __init__(self, connections: Dict[str, float], cache_dir: Optional[str] = None):
+        """
+        Compute (or load from the cache) the widest paths between all sites.
+
+        :param connections: measured bandwidths { "A:B": bandwidth }, eg from max_connections.json (Dict[str, float])
+        :param cache_dir: cache directory, None (default) to disable the cache (Optional[str]).
+        """
+        self.connections = connections
+        # sorted, so that the matrix indices only depend on the bandwidths and match the cache key
+        self.sites = sorted({site for connection in connections for site in connection.split(':')[:2]})
+        self.site_ids = {site: index for index, site in enumerate(self.sites)}
+
+        # the measured link of each pair, in both directions; the fastest one if both A:B and B:A are given
+        capacity = np.zeros((len(self.sites), len(self.sites)))
+        self.links = {}
+        for connection, bandwidth in connections.items():
+            site1, site2 = connection.split(':')[:2]
+            i, j = self.site_ids[site1], self.site_ids[site2]
+            if i == j or not bandwidth or bandwidth <= capacity[i, j]:
+                continue
+            capacity[i, j] = capacity[j, i] = bandwidth
+            self.links[(i, j)] = self.links[(j, i)] = connection
+        self.capacity = capacity
+
+        cache_path = os.path.join(cache_dir, f'{connections_digest(connections)}.npz') if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                self.width = cached['width']
+        else:
+            self.width = widest_paths_matrix(capacity)
+            if cache_path:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez(cache_path, width=self.width)
+        self.parent, self.depth = spanning_tree(capacity)
+
+    def bandwidth(self, site1: str, site2: str) -> float:
+        """
+        Return the widest path bandwidth between two sites.
+
+        :param site1: site name (str)
+        :param site2: site name (str)
+        :return: bandwidth, 0 if the sites are not connected (float).
+        """
+        i, j = self.site_ids.get(site1), self.site_ids.get(site2)
+        if i is None or j is None:
+            return 0.0
+
+        return float(self.width[i, j])
+
+    def path(self, site1: str, site2: str) -> List[str]:
+        """
+        Return the measured connections along the widest path between two sites.
+
+        :param site1: site name (str)
+        :param site2: site name (str)
+        :return: connection names, empty if the sites are not connected (List[str]).
+        """
+        if not self.bandwidth(site1, site2):
+            return []
+        # climb the spanning tree from both ends to their common ancestor
+        i, j = self.site_ids[site1], self.site_ids[site2]
+        head, tail = [], []
+        while i != j:
+            if self.depth[i] >= self.depth[j]:
+                head.append(self.links[(i, int(self.parent[i]))])
+                i = int(self.parent[i])
+            else:
+                tail.append(self.links[(int(self.parent[j]), j)])
+                j = int(self.parent[j])
+
+        return head + tail[::-1]
+
+    def to_connections(self, missing_only: bool = False) -> Dict[str, float]:
+        """
+        Return the widest path bandwidth of every connected site pair.
+
+        Measured pairs keep their name (and orientation); the other pairs are named A:B in site order.
+
+        :param missing_only: only return the pairs without a measured connection (bool)
+        :return: { "A:B": bandwidth } (Dict[str, float]).
+        """
+        result = {}
+        rows, columns = np.nonzero(np.triu(self.width, k=1))
+        for i, j in zip(rows.tolist(), columns.tolist()):
+            measured = self.links.get((i, j))
+            if measured and missing_only:
+                continue
+            result[measured or f'{self.sites[i]}:{self.sites[j]}'] = float(self.width[i, j])
+
+        return result
+
+
+def main():
+    """Perform main actions for the script."""
+    parser = argparse.ArgumentParser(description='Fill in the site pairs without measurements with widest path bandwidths.')
+    parser.add_argument('--input', type=str, default='max_connections.json', help='Measured bandwidths (default: max_connections.json).')
+    parser.add_argument('--output', type=str, default='widest_connections.json', help='Output file (.json, .msgpack or .cbor, optionally .gz or .zst).')
+    parser.add_argument('--pretty', action='store_true', help='Indent the JSON output files.')
+    parser.add_argument('--missing-only', action='store_true', help='Only write the pairs without a measured connection.')
+    parser.add_argument('--cache-dir', type=str, help='Cache the results in this directory (default: no cache).')
+    add_arguments(parser, 'widest_path')
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'widest_path')
+
+    with profiler.phase('load'):
+        connections = read_json_to_dict(args.input)
+        profiler.count('connections', len(connections))
+    with profiler.phase('transform'):
+        paths = WidestPaths(connections, cache_dir=args.cache_dir)
+        result = paths.to_connections(missing_only=args.missing_only)
+        profiler.count('sites', len(paths.sites))
+        profiler.count('pairs', len(result))
+    print(f'{len(paths.sites)} sites, {len(paths.links) // 2} measured pairs, {len(result)} pairs written')
+    with profiler.phase('write'):
+        write_dict_to_json(result, args.output, pretty=args.pretty)
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for the snapshot dates of bandwidth_store.py."""
+
+import numpy as np
+import pytest
+
+from bandwidth_store import parse_snapshot_time, snapshot_times
+from process_connections import input_files
+
+
+def test_month_first_files():
+    """The early latest-MM.DD.YYYY.json files are read month first, even when both orders are valid dates."""
+    assert parse_snapshot_time('data/latest-01.10.2024.json') == np.datetime64('2024-01-10')
+    assert parse_snapshot_time('latest-01.23.2024.json') == np.datetime64('2024-01-23')
+    assert parse_snapshot_time('latest-01.04.2024.json') == np.datetime64('2024-04-01')
+    assert parse_snapshot_time('latest-01.10.2024.json', month_first=False) == np.datetime64('2024-10-01')
+    assert np.isnat(parse_snapshot_time('latest.json'))
+
+
+def test_input_files_are_chronological():
+    """The dates of the repository's input_files list, which is in chronological order, are increasing."""
+    times = snapshot_times(input_files, ordered=True)
+    assert times[0] == np.datetime64('2024-01-10')
+    assert (np.diff(times) > np.timedelta64(0)).all()
+
+
+def test_ambiguous_order_warns():
+    """An ambiguous name read out of the file order, where the other order fits, is reported."""
+    assert snapshot_times(['latest-04.06.2024.json', 'latest-03.05.2024.json'])[0] == np.datetime64('2024-06-04')
+    file_names = ['latest-01.10.2024.json', 'latest-14.02.2024.json', 'latest-03.04.2024.json', 'latest-01.05.2024.json']
+    with pytest.warns(UserWarning, match='latest-01.10.2024.json'):
+        times = snapshot_times(['latest-20.12.2023.json'] + file_names, month_first_files=[], ordered=True)
+    assert times[1] == np.datetime64('2024-10-01')
+    file_names = ['latest-14.02.2024.json', 'latest-06.05.2024.json', 'latest-13.05.2024.json']
+    with pytest.warns(UserWarning, match='latest-06.05.2024.json'):
+        snapshot_times(file_names, month_first_files=['latest-06.05.2024.json'], ordered=True)
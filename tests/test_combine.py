@@ -0,0 +1,100 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for combine.py, against the loop of the original script."""
+
+import random
+
+import pytest
+
+from combine import MODELS, combine, join
+import synthetic_data
+
+
+def baseline_combine(queues_and_rses, gflops_per_cpu, number_of_cpus, option):
+    """Combine the inputs like the original combine.py."""
+    scale_factor = 1 if option == 1 else 10
+    combined = {}
+    for queue in queues_and_rses:
+        n_cpus = number_of_cpus.get(queue)
+        if not n_cpus:
+            continue
+        if option == 1:
+            gflops = gflops_per_cpu.get(queue)
+        else:
+            d = gflops_per_cpu.get(queue)
+            gflops = d.get('corepower')
+        if not gflops:
+            continue
+        rses = queues_and_rses.get(queue)
+        if not rses:
+            continue
+        try:
+            combined[queue] = {}
+            combined[queue]['RSE'] = rses.get('RSE')
+            combined[queue]['GFLOPS'] = int(gflops) * int(n_cpus) * scale_factor
+        except (TypeError, ValueError):
+            pass
+
+    return combined
+
+
+@pytest.fixture
+def inputs():
+    """Return queues_and_rses, corepower, queue_corecount, gflops_per_cpu and number_of_cpus, with gaps."""
+    rng = random.Random(3)
+    queues = synthetic_data.queues_and_rses(80, 20)
+    names = list(queues)
+    for queue in names[::11]:
+        queues[queue] = {}
+    corecount = synthetic_data.queue_corecount(90)
+    for queue in names[::7]:
+        corecount[queue] = 0 if rng.random() < 0.5 else None
+    gflops_per_cpu = {queue: round(rng.uniform(5, 30), 3) for queue in names if rng.random() > 0.1}
+    number_of_cpus = {queue: rng.randint(0, 5000) for queue in names if rng.random() > 0.1}
+
+    return queues, synthetic_data.corepower(80), corecount, gflops_per_cpu, number_of_cpus
+
+
+def without_cores(combined):
+    """Drop the number of cores, which the original script did not write."""
+    return {queue: {key: value for key, value in info.items() if key != 'cores'} for queue, info in combined.items()}
+
+
+@pytest.mark.parametrize('option', [1, 2])
+def test_matches_baseline(inputs, option):
+    """The RSE(s) and GFLOPS of each queue, and the order of the queues, are the ones of the original script."""
+    queues, corepower, corecount, gflops_per_cpu, number_of_cpus = inputs
+    sources = (gflops_per_cpu, number_of_cpus) if option == 1 else (corepower, corecount)
+    expected = baseline_combine(queues, *sources, option)
+    result = combine(queues, *sources, option=option)
+    assert list(without_cores(result).items()) == list(expected.items())
+    assert all(info['cores'] == int(sources[1][queue]) for queue, info in result.items())
+
+
+def test_one_pass(inputs):
+    """All models computed in one pass give the results of one model at a time."""
+    queues, corepower, corecount, gflops_per_cpu, number_of_cpus = inputs
+    sources = {'gflops_per_cpu.json': gflops_per_cpu, 'number_of_cpus.json': number_of_cpus,
+               'corepower.json': corepower, 'queue_corecount.json': corecount}
+    combined, report = join(queues, sources, list(MODELS.values()))
+    assert combined['runtimes'] == combine(queues, gflops_per_cpu, number_of_cpus, option=1)
+    assert combined['corepower'] == combine(queues, corepower, corecount, option=2)
+    assert report['sources']['queue_corecount.json']['unmatched'] == 10
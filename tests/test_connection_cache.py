@@ -0,0 +1,66 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for connection_cache.py."""
+
+import os
+
+from connection_cache import ConnectionCache
+
+
+def blobs(cache_dir):
+    """Return the blob names in a cache directory."""
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.pickle.z'))
+
+
+def test_replaced_blob_is_removed(tmp_path):
+    """Storing a modified file removes the blob of its old content, unless another file still uses it."""
+    cache_dir = str(tmp_path / 'cache')
+    first, second = tmp_path / 'a.json', tmp_path / 'b.json'
+    first.write_text('{"x": 1}')
+    second.write_text('{"x": 1}')
+    cache = ConnectionCache(cache_dir)
+    cache.store(str(first), 'old')
+    cache.store(str(second), 'old')
+    old_blobs = blobs(cache_dir)
+    assert len(old_blobs) == 1
+
+    first.write_text('{"x": 2}')
+    cache.store(str(first), 'new')
+    assert len(blobs(cache_dir)) == 2
+    assert cache.lookup(str(second)) == 'old'
+
+    second.write_text('{"x": 3}')
+    cache.store(str(second), 'newer')
+    assert old_blobs[0] not in blobs(cache_dir)
+    assert len(blobs(cache_dir)) == 2
+    assert cache.lookup(str(first)) == 'new'
+
+
+def test_store_replaces_result(tmp_path):
+    """Storing a new result for an unchanged file replaces the cached one."""
+    cache_dir = str(tmp_path / 'cache')
+    path = tmp_path / 'a.json'
+    path.write_text('{}')
+    cache = ConnectionCache(cache_dir)
+    cache.store(str(path), ('partial', None))
+    cache.store(str(path), ('partial', 'sketches'))
+    cache.save()
+    assert ConnectionCache(cache_dir).lookup(str(path)) == ('partial', 'sketches')
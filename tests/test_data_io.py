@@ -0,0 +1,59 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for the JSON backends of data_io.py."""
+
+import pytest
+
+import data_io
+
+BACKENDS = ['json'] + (['orjson'] if data_io.orjson else [])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('pretty', [False, True])
+def test_non_finite_as_null(monkeypatch, backend, pretty):
+    """Both backends write NaN and inf as null, and read NaN literals as None."""
+    monkeypatch.setattr(data_io, 'JSON_BACKEND', backend)
+    data = {'a': float('nan'), 'b': [1.5, float('inf'), -float('inf')], 'c': {'d': 2}}
+    expected = {'a': None, 'b': [1.5, None, None], 'c': {'d': 2}}
+    assert data_io.loads(data_io.dumps(data, pretty=pretty)) == expected
+    assert data_io.loads(b'{"a": NaN, "b": [1.5, Infinity, -Infinity], "c": {"d": 2}}') == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_same_output(monkeypatch, backend):
+    """The compact output does not depend on the backend."""
+    data = {'x': [1, 2.5, None, 'y'], 'z': {'w': float('nan')}}
+    monkeypatch.setattr(data_io, 'JSON_BACKEND', 'json')
+    expected = data_io.dumps(data)
+    monkeypatch.setattr(data_io, 'JSON_BACKEND', backend)
+    assert data_io.dumps(data) == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_read_large_file(monkeypatch, tmp_path, backend):
+    """Files above the mmap threshold are read by both backends."""
+    monkeypatch.setattr(data_io, 'JSON_BACKEND', backend)
+    monkeypatch.setattr(data_io, 'MMAP_THRESHOLD', 16)
+    data = {f'site{i}:site{i + 1}': float(i) for i in range(100)}
+    path = str(tmp_path / 'large.json')
+    data_io.write_dict_to_json(data, path, quiet=True)
+    assert data_io.read_json_to_dict(path) == data
@@ -0,0 +1,127 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for the --batch comparison of extract_time_diffs.py."""
+
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import extract_time_diffs
+from extract_time_diffs import compare_runs, find_runs, run_tags
+import synthetic_data
+
+
+def write_run(file_path, n_tasks, n_hosts, seed=1):
+    """Write a synthetic WRENCH output and return it."""
+    data = synthetic_data.wrench_output(n_tasks, n_hosts=n_hosts, seed=seed)
+    with (gzip.open if file_path.endswith('.gz') else open)(file_path, 'wt', encoding='utf-8') as json_file:
+        json.dump(data, json_file)
+
+    return data
+
+
+def expected_row(data):
+    """Return the delays and makespan of a run, computed from the whole document."""
+    tasks = data['workflow_execution']['tasks']
+    delays = np.array([task['compute']['start'] - task['whole_task']['start'] for task in tasks])
+    makespan = max(task['whole_task']['end'] for task in tasks) - min(task['whole_task']['start'] for task in tasks)
+
+    return {'tasks': len(tasks), 'delay_mean': delays.mean(), 'delay_p95': np.percentile(delays, 95), 'delay_max': delays.max(),
+            'makespan': makespan}
+
+
+@pytest.fixture
+def batch(tmp_path):
+    """Write a batch of runs: two configurations, a compressed file, a run directory and two broken files."""
+    expected = {}
+    for name, nodes in (('flat_10.json', 10), ('flat_40.json', 40), ('star_20.json.gz', 20)):
+        expected[name] = expected_row(write_run(str(tmp_path / name), 300, nodes))
+    (tmp_path / 'flat_20').mkdir()
+    expected['flat_20'] = expected_row(write_run(str(tmp_path / 'flat_20' / 'wrench.json'), 300, 20))
+
+    (tmp_path / 'broken_5.json').write_text('{"workflow_execution": {"tasks": [')
+    data = synthetic_data.wrench_output(10, n_hosts=5)
+    data['workflow_execution']['tasks'][3]['compute']['start'] = None
+    (tmp_path / 'null_5.json').write_text(json.dumps(data))
+
+    return str(tmp_path), expected
+
+
+@pytest.mark.parametrize('name, tags', [('flat_1000.json', (1000, 'flat')), ('star_50.json.gz', (50, 'star')),
+                                        ('cluster-n64', (64, 'cluster')), ('run.json', (None, 'run')), ('1000.json', (1000, 'default'))])
+def test_run_tags(name, tags):
+    """The node count and configuration are taken from the name."""
+    assert run_tags(name) == tags
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_compare_runs(batch, jobs):
+    """Every run is analyzed, and compared with the run of its configuration with the fewest nodes."""
+    path, expected = batch
+    rows = compare_runs(find_runs(path), jobs=jobs)
+    assert [(row['config'], row['nodes']) for row in rows] == [('broken', 5), ('flat', 10), ('flat', 20), ('flat', 40),
+                                                               ('null', 5), ('star', 20)]
+    by_name = {os.path.relpath(row['file'], path).split(os.sep)[0]: row for row in rows}
+    for name, values in expected.items():
+        for key, value in values.items():
+            assert by_name[name][key] == pytest.approx(value)
+    assert 'JSONStreamError' in by_name['broken_5.json']['error']
+    assert 'TypeError' in by_name['null_5.json']['error']
+
+    flat = [by_name[name] for name in ('flat_10.json', 'flat_20', 'flat_40.json')]
+    assert flat[0]['speedup'] == 1 and flat[0]['efficiency'] == 1
+    assert flat[2]['speedup'] == pytest.approx(flat[0]['makespan'] / flat[2]['makespan'])
+    assert flat[2]['efficiency'] == pytest.approx(flat[2]['speedup'] * 10 / 40)
+    assert by_name['star_20.json.gz']['speedup'] == 1
+
+
+def test_manifest(batch):
+    """A manifest lists the runs relative to its directory, with optional node counts and configurations."""
+    path, expected = batch
+    manifest = os.path.join(path, 'manifest.json')
+    with open(manifest, 'w', encoding='utf-8') as json_file:
+        json.dump({'runs': [{'file': 'flat_10.json'}, {'file': 'flat_40.json', 'nodes': 80, 'config': 'big'}]}, json_file)
+    assert find_runs(manifest) == [{'file': os.path.join(path, 'flat_10.json'), 'nodes': 10, 'config': 'flat'},
+                                   {'file': os.path.join(path, 'flat_40.json'), 'nodes': 80, 'config': 'big'}]
+
+    with open(manifest, 'w', encoding='utf-8') as json_file:
+        json.dump({'runs': ['flat_10.json']}, json_file)
+    with pytest.raises(ValueError):
+        find_runs(manifest)
+
+
+def test_verbose_matches_baseline(tmp_path, monkeypatch, capsys):
+    """--verbose prints the task times like the original script did."""
+    file_path = str(tmp_path / 'wrench.json')
+    data = write_run(file_path, 5, 2)
+    monkeypatch.setattr(sys, 'argv', ['extract_time_diffs.py', '--input', file_path, '--verbose'])
+    extract_time_diffs.main()
+    expected = ''
+    for task in data['workflow_execution']['tasks']:
+        compute_start = task['compute']['start']
+        whole_task_start = task['whole_task']['start']
+        expected += (f"Task ID: {task['task_id']}\nCompute Start Time: {compute_start}\n"
+                     f"Whole Task Start Time: {whole_task_start}\nDifference: {compute_start - whole_task_start}\n\n")
+    assert capsys.readouterr().out.startswith(expected)
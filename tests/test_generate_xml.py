@@ -0,0 +1,79 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for the --nodes platforms of generate_xml.py."""
+
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import generate_xml
+from generate_xml import TOPOLOGIES, generate_xml_fragments, generate_xml_stream, generate_xml_tree, platform_counts
+
+# written by the original generate_xml.py --nodes 4
+BASELINE = os.path.join(os.path.dirname(__file__), 'data', 'platform-flat-4.xml')
+
+
+def read_bytes(file_path):
+    """Return the contents of a file."""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('backend', [generate_xml_stream, generate_xml_tree, generate_xml_fragments])
+def test_flat_matches_baseline(tmp_path, backend):
+    """All backends write the flat platform of the original script, byte for byte."""
+    filename = str(tmp_path / 'platform.xml')
+    backend(filename, 4)
+    assert read_bytes(filename) == read_bytes(BASELINE)
+
+
+def test_default_matches_baseline(tmp_path, monkeypatch):
+    """The command line without options writes the flat platform of the original script."""
+    filename = str(tmp_path / 'platform.xml')
+    monkeypatch.setattr(sys, 'argv', ['generate_xml.py', '--filename', filename, '--nodes', '4'])
+    generate_xml.main()
+    assert read_bytes(filename) == read_bytes(BASELINE)
+
+
+@pytest.mark.parametrize('topology', TOPOLOGIES)
+@pytest.mark.parametrize('nodes', [0, 1, 2, 13])
+def test_backends_identical(tmp_path, topology, nodes):
+    """The stream and fragments backends (and the tree backend for the flat topology) write identical files."""
+    stream, fragments, tree = (str(tmp_path / name) for name in ('stream.xml', 'fragments.xml', 'tree.xml'))
+    generate_xml_stream(stream, nodes, topology=topology)
+    generate_xml_fragments(fragments, nodes, topology=topology)
+    assert read_bytes(fragments) == read_bytes(stream)
+    if topology == 'flat':
+        generate_xml_tree(tree, nodes)
+        assert read_bytes(tree) == read_bytes(stream)
+
+
+@pytest.mark.parametrize('topology', TOPOLOGIES)
+def test_platform_counts(tmp_path, topology):
+    """platform_counts() matches the hosts, links and routes in the file."""
+    filename = str(tmp_path / 'platform.xml')
+    generate_xml_stream(filename, 7, topology=topology)
+    root = ET.parse(filename).getroot()
+    counts = {'hosts': len(root.findall('.//host')), 'links': len(root.findall('.//link')) + len(root.findall('.//backbone')),
+              'routes': len(root.findall('.//route'))}
+    assert counts == platform_counts(7, topology)
@@ -0,0 +1,67 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for number_of_cpus.py, against the dictionary reduction of the original script."""
+
+import pytest
+
+from number_of_cpus import find_max_values, read_csv_to_dict, read_time_series, slot_statistics, stream_max_values
+import synthetic_data
+
+
+def baseline_max_values(file_path):
+    """Return the maxima of the original script, which keeps the whole table in memory."""
+    return find_max_values(read_csv_to_dict(file_path))
+
+
+@pytest.fixture
+def grafana_csv(tmp_path):
+    """Write a synthetic Grafana export."""
+    file_path = str(tmp_path / 'grafana.csv')
+    synthetic_data.write_grafana_csv(file_path, 40, 300)
+
+    return file_path
+
+
+@pytest.mark.parametrize('method, chunk_rows', [('stream', 1024), ('numpy', 1024), ('numpy', 7)])
+def test_matches_baseline(grafana_csv, method, chunk_rows):
+    """The streamed maxima, and their order, are the ones of the original script."""
+    expected = baseline_max_values(grafana_csv)
+    assert list(stream_max_values(grafana_csv, method=method, chunk_rows=chunk_rows).result().items()) == list(expected.items())
+
+
+@pytest.mark.parametrize('method', ['stream', 'numpy'])
+def test_irregular_cells(tmp_path, method):
+    """Non-integer and missing cells are ignored like in the original script."""
+    file_path = str(tmp_path / 'grafana.csv')
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        csv_file.write('"Time","A","B","C"\n'
+                       '"2024-01-01 00:00:00",5,"n/a",\n'
+                       '"2024-01-01 01:00:00",12,1.5,3\n'
+                       ',,,\n'
+                       '"2024-01-01 02:00:00",7,4,\n')
+    assert stream_max_values(file_path, method=method, chunk_rows=2).result() == baseline_max_values(file_path)
+
+
+def test_statistics_max(grafana_csv):
+    """The maxima of --stats are the ones of the original script."""
+    names, stamps, values = read_time_series(grafana_csv, chunk_rows=16)
+    statistics = slot_statistics(names, stamps, values)
+    assert {queue: stats['max'] for queue, stats in statistics.items()} == baseline_max_values(grafana_csv)
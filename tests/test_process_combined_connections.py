@@ -0,0 +1,111 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for reduce_connections() of process_combined_connections.py, against the loops of the original script."""
+
+import random
+
+import pytest
+
+from bandwidth_store import BandwidthStore
+from process_combined_connections import TARGET_BANDWIDTH, reduce_connections
+import synthetic_data
+
+# the fixed scaling factor of the original script
+SCALING_FACTOR = 2.2595857275527105
+
+
+def baseline_reduction(connections):
+    """Reduce the combined connections like the original process_combined_connections.py."""
+    connections_with_max = {}
+    for connection in connections.keys():
+        data = connections.get(connection)
+        if not data:
+            continue
+        weeks = []
+        days = []
+        hours = []
+        for info in data:
+            weeks.append(info.get('1w', 0))
+            days.append(info.get('1d', 0))
+            hours.append(info.get('1h', 0))
+        highest_value = max([max(weeks), max(days), max(hours)])
+        if highest_value == 0:
+            continue
+        connections_with_max[connection] = highest_value * SCALING_FACTOR
+
+    fastest_connection = {}
+    highest_value = 0
+    slowest_connection = {}
+    lowest_value = 9999
+    for connection in connections_with_max:
+        value = connections_with_max[connection]
+        if value > highest_value:
+            fastest_connection = {connection: value}
+            highest_value = value
+        if value < lowest_value:
+            slowest_connection = {connection: value}
+            lowest_value = value
+
+    reduced_connections_with_max = {}
+    for connection in connections_with_max:
+        value1 = connections_with_max[connection]
+        source, destination = connection.split(':')
+        inv = f'{destination}:{source}'
+        if inv in reduced_connections_with_max:
+            continue
+        value2 = connections_with_max.get(inv, 0)
+        reduced_connections_with_max[connection] = max(value1, value2)
+
+    return reduced_connections_with_max, fastest_connection, slowest_connection
+
+
+def combined_connections(seed):
+    """Return combined connections with inverse pairs, ties, empty lists and zero or missing values."""
+    rng = random.Random(seed)
+    sites = synthetic_data.site_names(12)
+    connections = {}
+    for _ in range(200):
+        connection = ':'.join(rng.sample(sites, 2))
+        samples = []
+        for _ in range(rng.randint(0, 4)):
+            samples.append({key: rng.choice([0, 5.0, 10.0, round(rng.uniform(1, 4000), 3)]) for key in synthetic_data.RESOLUTIONS
+                            if rng.random() > 0.2})
+        connections[connection] = samples
+
+    return connections
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_baseline(seed):
+    """The reduced connections, their order and the fastest and slowest connection are the ones of the original loops."""
+    connections = combined_connections(seed)
+    expected, fastest, slowest = baseline_reduction(connections)
+    result = reduce_connections(BandwidthStore.from_connections(connections), scaling_factor=SCALING_FACTOR)
+    assert list(result.connections.items()) == list(expected.items())
+    assert result.fastest == fastest
+    assert result.slowest == slowest
+
+
+def test_target_bandwidth():
+    """By default, the fastest connection is scaled to the target bandwidth."""
+    result = reduce_connections(BandwidthStore.from_connections(combined_connections(0)))
+    assert list(result.fastest.values()) == pytest.approx([TARGET_BANDWIDTH])
+    assert max(result.connections.values()) == pytest.approx(TARGET_BANDWIDTH)
@@ -0,0 +1,129 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for process_connections.py, against the loop of the original script."""
+
+import gzip
+import json
+
+import pytest
+
+from connection_cache import ConnectionCache
+from json_stream import JSONStreamError, iter_items
+from process_connections import process_files
+import synthetic_data
+
+
+def baseline_connections(file_paths):
+    """Combine the metrics files like the original process_connections.py."""
+    all_connections = {}
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as json_file:
+            connections = json.load(json_file)
+        for connection in connections.keys():
+            sites = connection.split(':')
+            local_site = sites[0]
+            remote_site = sites[1]
+            if local_site == remote_site:
+                continue
+            if 'UNKNOWN' in {local_site, remote_site}:
+                continue
+            if connection not in all_connections:
+                all_connections[connection] = []
+            mbps = connections.get(connection).get('mbps')
+            if not mbps:
+                continue
+            dashb = mbps.get('dashb')
+            if not dashb:
+                continue
+            all_connections[connection].append(dashb)
+
+    return all_connections
+
+
+@pytest.fixture
+def metrics_files(tmp_path):
+    """Write a few overlapping metrics files, in snapshot order."""
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    file_paths = []
+    for seed, file_name in enumerate(synthetic_data.snapshot_file_names(5)):
+        file_path = str(data_dir / file_name)
+        with open(file_path, 'w', encoding='utf-8') as json_file:
+            json.dump(synthetic_data.rucio_metrics(150, n_sites=15, seed=seed), json_file, indent=2)
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_matches_baseline(metrics_files, workers):
+    """The combined connections, including their order, are the ones of the original script."""
+    expected = baseline_connections(metrics_files)
+    assert list(process_files(metrics_files, workers=workers).items()) == list(expected.items())
+    assert any(not samples for samples in expected.values())
+
+
+def test_cache_matches_baseline(metrics_files, tmp_path, capsys):
+    """Cached and re-parsed files give the result of the original script, also after a file is modified."""
+    cache_dir = str(tmp_path / 'cache')
+    expected = baseline_connections(metrics_files)
+    assert process_files(metrics_files, cache=ConnectionCache(cache_dir)) == expected
+    assert process_files(metrics_files, cache=ConnectionCache(cache_dir)) == expected
+    assert '5 of 5 files found in the cache' in capsys.readouterr().out
+
+    with open(metrics_files[2], 'w', encoding='utf-8') as json_file:
+        json.dump(synthetic_data.rucio_metrics(150, n_sites=15, seed=99), json_file)
+    expected = baseline_connections(metrics_files)
+    assert list(process_files(metrics_files, workers=2, cache=ConnectionCache(cache_dir)).items()) == list(expected.items())
+    assert '4 of 5 files found in the cache' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('loader', ['stream', 'json'])
+def test_loaders_match_baseline(metrics_files, loader):
+    """Both loaders give the result of the original script, also for compressed files."""
+    expected = baseline_connections(metrics_files)
+    assert list(process_files(metrics_files, loader=loader).items()) == list(expected.items())
+
+    for file_path in metrics_files:
+        with open(file_path, 'rb') as json_file, gzip.open(f'{file_path}.gz', 'wb') as gz_file:
+            gz_file.write(json_file.read())
+    assert process_files([f'{file_path}.gz' for file_path in metrics_files], loader=loader) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_iter_items_chunks(tmp_path, chunk_size):
+    """Members split across chunks are decoded like json.load() does."""
+    data = {'a:b': {'mbps': {'dashb': {'1h': 1.5e3, '1d': -2, '1w': None}}},
+            'c\\"}{:d': ['x', {'y': True}, [], {}], '\u00e9:\u4e2d': 'caf\u00e9 \\u00e9', 'n': 12345678901234567890}
+    file_path = str(tmp_path / 'latest.json')
+    with open(file_path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file, indent=1, ensure_ascii=False)
+    assert list(iter_items(file_path, chunk_size=chunk_size)) == list(data.items())
+    assert list(iter_items(file_path, prefix=('c\\"}{:d',), chunk_size=chunk_size)) == list(enumerate(data['c\\"}{:d']))
+
+
+def test_iter_items_truncated(tmp_path):
+    """A truncated file raises JSONStreamError."""
+    file_path = str(tmp_path / 'latest.json')
+    with open(file_path, 'w', encoding='utf-8') as json_file:
+        json_file.write('{"a:b": {"mbps": {"dashb": {"1h": 1.5}}}, "c:d": {"mbps": ')
+    with pytest.raises(JSONStreamError):
+        list(iter_items(file_path))
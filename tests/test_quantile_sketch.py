@@ -0,0 +1,69 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for quantile_sketch.py and the per-file sketches of process_connections.py."""
+
+import random
+
+from process_connections import build_sketches, extract_connections, intern_partials, merge_partials
+from quantile_sketch import KLLSketch, QUANTILES, exact_quantile
+from site_registry import SiteRegistry
+import synthetic_data
+
+
+def test_exact_below_capacity():
+    """A sketch holding fewer values than its capacity returns the exact quantiles."""
+    values = [random.Random(1).uniform(0, 1000) for _ in range(150)]
+    sketch = KLLSketch()
+    sketch.extend(values)
+    for q in (0.0, 0.1, 0.5, 0.9, 0.99, 1.0):
+        assert sketch.quantile(q) == exact_quantile(values, q)
+
+
+def test_rank_error():
+    """The rank of a quantile of a merged sketch is within a few percent of the requested one."""
+    rng = random.Random(2)
+    values = [rng.lognormvariate(5, 2) for _ in range(50000)]
+    sketch = KLLSketch()
+    for start in range(0, len(values), 5000):
+        part = KLLSketch()
+        part.extend(values[start:start + 5000])
+        sketch.merge(part)
+    assert sketch.count == len(values)
+    for q in QUANTILES.values():
+        estimate = sketch.quantile(q)
+        rank = sum(1 for value in values if value <= estimate) / len(values)
+        assert abs(rank - q) < 0.02, (q, rank, exact_quantile(values, q))
+
+
+def test_file_sketches_merge():
+    """The sketches built per file, merged over the files, cover all values of each connection."""
+    registry = SiteRegistry()
+    partials = intern_partials([extract_connections(synthetic_data.rucio_metrics(200, 20, seed=seed).items(), sketches=True) for seed in range(3)], registry)
+    sketches = build_sketches(partials, registry)
+    connections = merge_partials(['a', 'b', 'c'], partials, registry)
+    for connection, samples in connections.items():
+        values = [value for dashb in samples for value in (dashb.get(key) for key in ('1h', '1d', '1w')) if value is not None]
+        if not values:
+            assert connection not in sketches
+            continue
+        assert sketches[connection].count == len(values)
+        assert sketches[connection].quantile(0.5) == exact_quantile(values, 0.5)
+        assert sketches[connection].max == max(values)
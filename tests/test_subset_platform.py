@@ -0,0 +1,104 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for the selection strategies of subset_platform.py, against plain reference implementations."""
+
+import math
+import random
+
+import pytest
+
+from generate_xml import get_rses
+from subset_platform import queue_strengths, select, select_connected, select_gflops, select_stratified, site_links
+import synthetic_data
+
+
+def platform(seed):
+    """Return queue info and integer bandwidths, so that sums do not depend on the order of the additions."""
+    rng = random.Random(seed)
+    queues = synthetic_data.queues_and_rses(60, 25, seed=seed)
+    for info in queues.values():
+        info['GFLOPS'] = rng.choice([10, 100, 1000]) * rng.randint(1, 50)
+    sites = synthetic_data.site_names(25)
+    connections = {':'.join(rng.sample(sites, 2)): rng.randint(1, 10000) for _ in range(120)}
+
+    return queues, connections
+
+
+def reference_connected(queues, count, links, strengths):
+    """Greedy best-connected selection, recomputing every gain at each step."""
+    selected = [max(queues, key=lambda queue: (strengths[queue], queues[queue]['GFLOPS']))]
+    while len(selected) < min(count, len(queues)):
+        covered = {rse for queue in selected for rse in get_rses(queues[queue])}
+
+        def gain(queue):
+            return sum(links.get(rse, {}).get(site, 0) for rse in covered for site in get_rses(queues[queue]))
+
+        selected.append(min((queue for queue in queues if queue not in selected),
+                            key=lambda queue: (-gain(queue), -queues[queue]['GFLOPS'], queue)))
+
+    return selected
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('count', [1, 7, 30, 60, 80])
+def test_select_gflops(seed, count):
+    """The queues with the largest GFLOPS are selected, in order."""
+    queues, _ = platform(seed)
+    assert select_gflops(queues, count) == sorted(queues, key=lambda queue: queues[queue]['GFLOPS'], reverse=True)[:count]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('count', [1, 7, 30, 59])
+def test_select_stratified(seed, count):
+    """Each capacity bucket gets its share of the queues, rounded by largest remainder, and keeps its best-connected queues."""
+    queues, connections = platform(seed)
+    strengths = queue_strengths(queues, site_links(connections, {rse for info in queues.values() for rse in get_rses(info)}))
+    selected = select_stratified(queues, count, strengths, buckets=4)
+    assert len(selected) == len(set(selected)) == count
+
+    logs = {queue: math.log(info['GFLOPS']) for queue, info in queues.items()}
+    low, high = min(logs.values()), max(logs.values())
+    buckets = {}
+    for queue, value in logs.items():
+        buckets.setdefault(min(int((value - low) / ((high - low) / 4)), 3), []).append(queue)
+    for members in buckets.values():
+        chosen = [queue for queue in members if queue in selected]
+        assert abs(len(chosen) - count * len(members) / len(queues)) < 1
+        if chosen:
+            weakest = min((strengths[queue], queues[queue]['GFLOPS']) for queue in chosen)
+            assert all((strengths[queue], queues[queue]['GFLOPS']) <= weakest for queue in members if queue not in chosen)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('count', [1, 2, 10, 40, 60])
+def test_select_connected(seed, count):
+    """The heap-based greedy selection equals the one that recomputes every gain."""
+    queues, connections = platform(seed)
+    links = site_links(connections, {rse for info in queues.values() for rse in get_rses(info)})
+    strengths = queue_strengths(queues, links)
+    assert select_connected(queues, count, links, strengths) == reference_connected(queues, count, links, strengths)
+
+
+def test_unknown_strategy():
+    """An unknown strategy raises ValueError."""
+    queues, connections = platform(0)
+    with pytest.raises(ValueError):
+        select(queues, connections, 5, strategy='random')
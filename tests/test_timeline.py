@@ -0,0 +1,102 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for timeline.py."""
+
+import json
+import sys
+
+import numpy as np
+import pytest
+
+import timeline
+from timeline import read_intervals, sweep, timelines
+
+
+def brute_force_level(starts, ends, groups, weight, group, time):
+    """Return the total weight of the intervals of a group that contain a time."""
+    inside = (groups == group) & (starts <= time) & (time < ends)
+
+    return weight[inside].sum()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sweep_brute_force(seed):
+    """Every step of the curves has the level of the intervals it is in, with ties and empty intervals."""
+    rng = np.random.default_rng(seed)
+    n = 200
+    groups = rng.integers(0, 4, n)
+    starts = rng.integers(0, 50, n).astype(float)
+    ends = starts + rng.integers(0, 10, n)
+    weights = {'running': np.ones(n), 'cores': rng.integers(1, 9, n).astype(float)}
+    step_groups, step_times, levels = sweep(starts, ends, groups, weights)
+
+    for group in range(4):
+        in_group = groups == group
+        expected_times = np.unique(np.concatenate([starts[in_group], ends[in_group]]))
+        assert step_times[step_groups == group].tolist() == expected_times.tolist()
+    for index, (group, time) in enumerate(zip(step_groups, step_times)):
+        for name, weight in weights.items():
+            assert levels[name][index] == brute_force_level(starts, ends, groups, weight, group, time)
+
+
+def write_tasks(file_path, tasks):
+    """Write WRENCH task records."""
+    with open(file_path, 'w', encoding='utf-8') as json_file:
+        json.dump({'workflow_execution': {'tasks': tasks}}, json_file)
+
+
+def task(host, cores, host_cores, submit, start, end, read=None):
+    """Return a WRENCH task record, executing from the read (if any) or compute start."""
+    record = {'task_id': f'{host}_{submit}_{start}', 'execution_host': {'hostname': host, 'cores': host_cores},
+              'num_cores_allocated': cores, 'whole_task': {'start': submit, 'end': end}, 'compute': {'start': start, 'end': end}}
+    if read is not None:
+        record['read'] = [{'start': read, 'end': start}]
+
+    return record
+
+
+def test_summary(tmp_path):
+    """The metrics of a small run match the hand computed values, including a host without a known number of cores."""
+    file_path = str(tmp_path / 'wrench.json')
+    write_tasks(file_path, [task('A', 1, 2, 0, 0, 10), task('A', 1, 2, 0, 6, 10, read=5), task('B', 4, 0, 2, 4, 20)])
+    summary, _ = timelines(*read_intervals(file_path))
+
+    assert summary['makespan'] == 20
+    assert summary['hosts']['A'] == {'cores': 2, 'tasks': 2, 'peak_concurrency': 2, 'peak_cores': 2, 'utilization': 15 / 40,
+                                     'idle_fraction': 0.5, 'saturated_fraction': 0.25, 'mean_queueing_time': 2.5}
+    assert summary['hosts']['B'] == {'cores': 4, 'tasks': 1, 'peak_concurrency': 1, 'peak_cores': 4, 'utilization': 0.8,
+                                     'idle_fraction': pytest.approx(0.2), 'saturated_fraction': 0.8, 'mean_queueing_time': 2.0}
+    result = summary['global']
+    assert (result['capacity_cores'], result['peak_concurrency'], result['peak_cores']) == (6, 3, 6)
+    assert result['utilization'] == pytest.approx(79 / 120)
+    assert result['idle_fraction'] == 0.0
+    assert (result['peak_queued'], result['mean_queued']) == (2, pytest.approx(7 / 20))
+    assert result['saturated_hosts'] == 1
+
+
+def test_null_time(tmp_path, monkeypatch, capsys):
+    """A null time is reported instead of crashing."""
+    file_path = str(tmp_path / 'wrench.json')
+    write_tasks(file_path, [task('A', 1, 2, 0, 0, 10), task('A', 1, 2, None, 6, 10)])
+    monkeypatch.setattr(sys, 'argv', ['timeline.py', '--input', file_path, '--summary', str(tmp_path / 'summary.json')])
+    with pytest.raises(SystemExit):
+        timeline.main()
+    assert 'Failed to extract data from JSON file' in capsys.readouterr().out
@@ -0,0 +1,85 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# Author:
+# - Paul Nilsson, paul.nilsson@cern.ch, 2024
+
+"""Tests for widest_path.py."""
+
+import random
+
+import pytest
+
+from widest_path import WidestPaths
+
+
+def test_bandwidths():
+    """Unmeasured pairs get the bottleneck of their widest path."""
+    paths = WidestPaths({'A:B': 10, 'B:C': 5, 'C:D': 1, 'A:C': 2})
+    assert paths.bandwidth('A', 'B') == 10.0
+    assert paths.bandwidth('A', 'C') == 5.0
+    assert paths.bandwidth('A', 'D') == 1.0
+    assert paths.path('A', 'C') == ['A:B', 'B:C']
+    assert paths.bandwidth('A', 'E') == 0.0
+
+
+def test_cache_ignores_key_order(tmp_path):
+    """A cached result computed from the same bandwidths in another key order gives the same answers."""
+    first = WidestPaths({'A:B': 10, 'B:C': 5, 'C:D': 1}, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    reordered = WidestPaths({'C:D': 1, 'B:C': 5, 'A:B': 10}, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    for site1, site2, bandwidth in (('A', 'B', 10.0), ('B', 'C', 5.0), ('C', 'D', 1.0), ('A', 'D', 1.0)):
+        assert first.bandwidth(site1, site2) == reordered.bandwidth(site1, site2) == bandwidth
+    assert reordered.path('A', 'D') == ['A:B', 'B:C', 'C:D']
+
+
+def test_no_cache_by_default(tmp_path, monkeypatch):
+    """Nothing is written to the working directory unless a cache directory is given."""
+    monkeypatch.chdir(tmp_path)
+    WidestPaths({'A:B': 10})
+    assert not list(tmp_path.iterdir())
+
+
+def check_paths(paths: WidestPaths, connections: dict):
+    """Every path is simple, connects its endpoints and has the widest path bandwidth as bottleneck."""
+    for i, site1 in enumerate(paths.sites):
+        for site2 in paths.sites[i + 1:]:
+            links = paths.path(site1, site2)
+            width = paths.bandwidth(site1, site2)
+            if not width:
+                assert links == []
+                continue
+            visited = [site1]
+            for link in links:
+                source, destination = link.split(':')
+                assert visited[-1] in (source, destination)
+                visited.append(destination if visited[-1] == source else source)
+            assert visited[-1] == site2
+            assert len(set(visited)) == len(visited)
+            assert min(connections[link] for link in links) == width
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_paths_are_simple_widest_paths(seed):
+    """Random graphs, with float bandwidths and with many ties."""
+    rng = random.Random(seed)
+    sites = [f'S{index}' for index in range(25)]
+    for draw in (lambda: rng.uniform(1, 1000), lambda: rng.choice([10, 100, 1000])):
+        connections = {f'{source}:{destination}': draw() for source in sites for destination in sites
+                       if source != destination and rng.random() < 0.15}
+        check_paths(WidestPaths(connections), connections)